@@ -0,0 +1,114 @@
+"""
+Offline latency / quality benchmark of provider precision modes on a fixed VTT corpus.
+
+  python bench.py --engine fbnllb200d600m --corpus ./corpus --src-lang en --langs ru,de \
+      --precisions fp32,bf16,int8-dynamic
+
+Each precision gets a freshly loaded model. Quality is measured against the first
+precision's output (chrF with sacrebleu if installed, else difflib similarity).
+"""
+
+import argparse
+import difflib
+import glob
+import os
+import time
+
+from dotenv import load_dotenv
+
+from config.app_cfg import load_config, load_engine_config
+from services.providers.base_prv import build_provider
+from utils.mem_ut import model_param_bytes, process_rss_bytes
+from utils.vtt_ut import dedupe_texts, extract_vtt_lines
+
+
+def _parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--engine", default=os.getenv("YTTRANS_ENGINE", "fbnllb200d600m"))
+    p.add_argument("--corpus", required=True, help="directory with .vtt files")
+    p.add_argument("--src-lang", default="en")
+    p.add_argument("--langs", default="ru,de")
+    p.add_argument("--precisions", default="fp32,bf16,int8-dynamic")
+    p.add_argument("--repeat", type=int, default=1, help="timed passes per lang (after one warm pass)")
+    return p.parse_args()
+
+
+def _load_corpus(path):
+    texts = []
+    for fn in sorted(glob.glob(os.path.join(path, "*.vtt"))):
+        with open(fn, "r", encoding="utf-8") as f:
+            _lines, _idxs, file_texts, _rolling = extract_vtt_lines(f.read())
+        texts.extend(file_texts)
+    uniq, _plan = dedupe_texts(texts)
+    return uniq
+
+
+def _similarity(hyps, refs):
+    try:
+        import sacrebleu
+
+        return "chrF", sacrebleu.corpus_chrf(hyps, [refs]).score
+    except ImportError:
+        ratios = [difflib.SequenceMatcher(None, h, r).ratio() for h, r in zip(hyps, refs)]
+        return "difflib", 100.0 * sum(ratios) / max(1, len(ratios))
+
+
+def _run_precision(base_cfg, engine, precision, texts, src_lang, langs, repeat):
+    cfg = dict(base_cfg)
+    cfg[f"{engine}_precision"] = precision
+    rss_before = process_rss_bytes()
+    provider = build_provider(cfg)
+
+    out = {}
+    ms = {}
+    for lang in langs:
+        # first pass loads the model and warms up kernels
+        out[lang] = provider.translate_batch(texts, src_lang=src_lang, tgt_lang=lang)
+        t0 = time.monotonic()
+        for _ in range(max(1, repeat)):
+            provider.translate_batch(texts, src_lang=src_lang, tgt_lang=lang)
+        ms[lang] = (time.monotonic() - t0) * 1000.0 / max(1, repeat)
+
+    meta = provider.get_meta() if hasattr(provider, "get_meta") else {}
+    return {
+        "precision": meta.get("precision") or precision,
+        "out": out,
+        "ms": ms,
+        "model_mb": model_param_bytes(getattr(provider, "_model", None)) / 1024 / 1024,
+        "rss_mb": (process_rss_bytes() - rss_before) / 1024 / 1024,
+    }
+
+
+def main():
+    load_dotenv()
+    args = _parse_args()
+
+    cfg = load_config()
+    engine = (args.engine or "").lower()
+    cfg["engine"] = engine
+    cfg.update(load_engine_config(engine))
+
+    texts = _load_corpus(args.corpus)
+    if not texts:
+        raise SystemExit(f"no caption lines found in {args.corpus}")
+    langs = [x.strip() for x in args.langs.split(",") if x.strip()]
+    precisions = [x.strip() for x in args.precisions.split(",") if x.strip()]
+    print(f"engine={engine} lines={len(texts)} chars={sum(len(t) for t in texts)} langs={','.join(langs)}")
+
+    ref = None
+    for precision in precisions:
+        res = _run_precision(cfg, engine, precision, texts, args.src_lang, langs, args.repeat)
+        if ref is None:
+            ref = res
+        for lang in langs:
+            metric, score = _similarity(res["out"][lang], ref["out"][lang])
+            print(
+                f"precision={res['precision']:<13} lang={lang:<5} "
+                f"ms={res['ms'][lang]:9.1f} lines/s={len(texts) * 1000.0 / max(1e-6, res['ms'][lang]):7.1f} "
+                f"{metric}_vs_{ref['precision']}={score:6.2f} "
+                f"model_mb={res['model_mb']:7.1f} rss_delta_mb={res['rss_mb']:7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 import os
 import socket
 
+from config.fbm2m100_cfg import load_fbm2m100_config
+from config.fbnllb200d600m_cfg import load_fbnllb200d600m_config
+from config.googleweb_cfg import load_googleweb_config
+from config.madlad400_cfg import load_madlad400_config
+from config.mbart50_cfg import load_mbart50_config
+
 
 def _env(name, default=""):
     v = os.getenv(name)
@@ -55,6 +61,46 @@ def load_config():
 
     max_total_chars = _env_int("YTTRANS_MAXTOTALCHARS", 4500)
 
+    # Job payload (src_vtt etc.) is kept in Redis until the job finishes.
+    payload_ttl_sec = _env_int("YTTRANS_PAYLOAD_TTL_SEC", 86400)
+
+    # Reliable queue: job lease (visibility timeout) renewed by heartbeat; expired leases are requeued.
+    lease_ttl_sec = _env_int("YTTRANS_LEASE_TTL_SEC", 60)
+    job_max_attempts = _env_int("YTTRANS_JOB_MAX_ATTEMPTS", 3)
+
+    # Admission control for SubmitTranslate (0 => unlimited).
+    # backlog chars = sum(len(src_vtt) * len(target_langs)) of unfinished jobs.
+    max_queued_jobs = _env_int("YTTRANS_MAX_QUEUED_JOBS", 0)
+    max_backlog_chars = _env_int("YTTRANS_MAX_BACKLOG_CHARS", 0)
+    retry_after_sec = _env_int("YTTRANS_RETRY_AFTER_SEC", 30)
+
+    # Cross-job translated segment cache: in-process LRU (L1) + shared Redis (L2).
+    segcache_enabled = _env_int("YTTRANS_SEGCACHE", 1)
+    segcache_l1_max_mb = _env_int("YTTRANS_SEGCACHE_L1_MAX_MB", 64)
+    segcache_redis = _env_int("YTTRANS_SEGCACHE_REDIS", 1)
+    segcache_ttl_sec = _env_int("YTTRANS_SEGCACHE_TTL_SEC", 7 * 86400)
+
+    # Whole-job result cache keyed by VTT content hash (+ src_lang, engine, model), one entry per target lang.
+    result_cache_enabled = _env_int("YTTRANS_RESULT_CACHE", 1)
+    result_cache_ttl_sec = _env_int("YTTRANS_RESULT_CACHE_TTL_SEC", 7 * 86400)
+    coalesce_enabled = _env_int("YTTRANS_COALESCE", 1)
+    coalesce_ttl_sec = _env_int("YTTRANS_COALESCE_TTL_SEC", 3600)
+    coalesce_poll_ms = _env_int("YTTRANS_COALESCE_POLL_MS", 1000)
+    vtt_rolling = _env("YTTRANS_VTT_ROLLING", "auto").strip().lower()
+    multi_target_group = _env_int("YTTRANS_MULTI_TARGET_GROUP", 8)
+    batcher_enabled = _env_int("YTTRANS_BATCHER", 0)
+    batcher_window_ms = _env_int("YTTRANS_BATCHER_WINDOW_MS", 20)
+    batcher_max_tokens = _env_int("YTTRANS_BATCHER_MAX_TOKENS", 4096)
+    batcher_max_pending = _env_int("YTTRANS_BATCHER_MAX_PENDING", 16)
+    # Multi-process inference (HF torch providers): 0 => in-process threads, N => N forked processes
+    # sharing the model weights copy-on-write, each pinned to its own CPU subset.
+    procpool_workers = _env_int("YTTRANS_PROCPOOL", 0)
+    procpool_threads = _env_int("YTTRANS_PROCPOOL_THREADS", 0)
+    procpool_pin = _env_int("YTTRANS_PROCPOOL_PIN", 1)
+    procpool_min_rows = _env_int("YTTRANS_PROCPOOL_MIN_ROWS", 16)
+    # a pool call not done in time raises instead of hanging the job; 0 => no limit
+    procpool_timeout_sec = _env_int("YTTRANS_PROCPOOL_TIMEOUT_SEC", 600)
+
     auth_token = _env("AUTH_TOKEN", "")
     log_level = _env("LOG_LEVEL", "info")
 
@@ -75,6 +121,32 @@ def load_config():
         "job_lang_parallelism": job_lang_parallelism,
         "redis_url": redis_url,
         "max_total_chars": max_total_chars,
+        "payload_ttl_sec": payload_ttl_sec,
+        "lease_ttl_sec": lease_ttl_sec,
+        "job_max_attempts": job_max_attempts,
+        "max_queued_jobs": max_queued_jobs,
+        "max_backlog_chars": max_backlog_chars,
+        "retry_after_sec": retry_after_sec,
+        "segcache_enabled": segcache_enabled,
+        "segcache_l1_max_mb": segcache_l1_max_mb,
+        "segcache_redis": segcache_redis,
+        "segcache_ttl_sec": segcache_ttl_sec,
+        "result_cache_enabled": result_cache_enabled,
+        "result_cache_ttl_sec": result_cache_ttl_sec,
+        "coalesce_enabled": coalesce_enabled,
+        "coalesce_ttl_sec": coalesce_ttl_sec,
+        "coalesce_poll_ms": coalesce_poll_ms,
+        "vtt_rolling": vtt_rolling,
+        "multi_target_group": multi_target_group,
+        "batcher_enabled": batcher_enabled,
+        "batcher_window_ms": batcher_window_ms,
+        "batcher_max_tokens": batcher_max_tokens,
+        "batcher_max_pending": batcher_max_pending,
+        "procpool_workers": procpool_workers,
+        "procpool_threads": procpool_threads,
+        "procpool_pin": procpool_pin,
+        "procpool_min_rows": procpool_min_rows,
+        "procpool_timeout_sec": procpool_timeout_sec,
         "auth_token": auth_token,
         "log_level": log_level,
         "build_hash": build_hash,
@@ -87,4 +159,22 @@ def load_config():
         # public/advertise
         "advertise_host": public_host,
         "advertise_port": public_port,
-    }
\ No newline at end of file
+    }
+
+
+def load_engine_config(engine):
+    """
+    Provider specific config for engine (empty dict for engines without one).
+    """
+    engine = (engine or "").lower()
+    if engine == "googleweb":
+        return load_googleweb_config()
+    if engine == "fbm2m100":
+        return load_fbm2m100_config()
+    if engine == "fbnllb200d600m":
+        return load_fbnllb200d600m_config()
+    if engine == "madlad400":
+        return load_madlad400_config()
+    if engine == "mbart50":
+        return load_mbart50_config()
+    return {}
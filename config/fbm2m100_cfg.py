@@ -15,6 +15,13 @@ def _env_int(name, default):
     return int(v)
 
 
+def _env_float(name, default):
+    v = os.getenv(name)
+    if v is None or v == "":
+        return float(default)
+    return float(v)
+
+
 def load_fbm2m100_config():
     """
     Local transformers-based M2M100 provider.
@@ -32,8 +39,28 @@ def load_fbm2m100_config():
         "fbm2m100_torch_threads": _env_int("FBM2M100_TORCH_THREADS", 0),
         "fbm2m100_max_input_tokens": _env_int("FBM2M100_MAX_INPUT_TOKENS", 1024),
         "fbm2m100_max_new_tokens": _env_int("FBM2M100_MAX_NEW_TOKENS", 256),
+        # per-row limit: min(MAX_NEW_TOKENS, src tokens * RATIO + SLACK); RATIO=0 => fixed MAX_NEW_TOKENS
+        "fbm2m100_max_new_tokens_ratio": _env_float("FBM2M100_MAX_NEW_TOKENS_RATIO", 2.0),
+        "fbm2m100_max_new_tokens_slack": _env_int("FBM2M100_MAX_NEW_TOKENS_SLACK", 16),
+        # stop rows whose output ends in an n-gram (n <= LOOP_NGRAM) repeated LOOP_REPEATS times; 0 = off
+        "fbm2m100_loop_ngram": _env_int("FBM2M100_LOOP_NGRAM", 4),
+        "fbm2m100_loop_repeats": _env_int("FBM2M100_LOOP_REPEATS", 4),
         "fbm2m100_num_beams": _env_int("FBM2M100_NUM_BEAMS", 1),
         "fbm2m100_warmup": _env_int("FBM2M100_WARMUP", 0),
         "fbm2m100_batch_size": _env_int("FBM2M100_BATCH_SIZE", 8),
+        "fbm2m100_batch_max_tokens": _env_int("FBM2M100_BATCH_MAX_TOKENS", 2048),
+        # batches in flight per pipeline stage (tensors / generate / decode overlap); 0 => one batch at a time
+        "fbm2m100_pipeline_depth": _env_int("FBM2M100_PIPELINE_DEPTH", 2),
+        # fp32 | bf16 | int8-dynamic (dynamic int8 Linear layers, CPU only)
+        "fbm2m100_precision": _env("FBM2M100_PRECISION", "fp32").strip().lower(),
+        # torch | onnx (onnxruntime CPU) | ct2 (CTranslate2); exported/converted models are
+        # kept under <HF_HOME>/yttrans-onnx, <HF_HOME>/yttrans-ct2 unless *_DIR is set
+        "fbm2m100_backend": _env("FBM2M100_BACKEND", "torch").strip().lower(),
+        "fbm2m100_onnx_dir": _env("FBM2M100_ONNX_DIR", ""),
+        "fbm2m100_ct2_dir": _env("FBM2M100_CT2_DIR", ""),
         "fbm2m100_max_concurrency": _env_int("FBM2M100_MAX_CONCURRENCY", 1),
+        # model replicas (shared weights, own tokenizer) serving parallel batches; 0 => MAX_CONCURRENCY
+        "fbm2m100_replicas": _env_int("FBM2M100_REPLICAS", 0),
+        # intra-op threads per replica; 0 => TORCH_THREADS (or the CPUs) / REPLICAS
+        "fbm2m100_replica_threads": _env_int("FBM2M100_REPLICA_THREADS", 0),
     }
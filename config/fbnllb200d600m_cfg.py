@@ -15,6 +15,13 @@ def _env_int(name, default):
     return int(v)
 
 
+def _env_float(name, default):
+    v = os.getenv(name)
+    if v is None or v == "":
+        return float(default)
+    return float(v)
+
+
 def load_fbnllb200d600m_config():
     """
     Local transformers-based NLLB-200 distilled 600M provider.
@@ -25,8 +32,21 @@ def load_fbnllb200d600m_config():
       FBNLLB200D600M_TORCH_THREADS    (default: 0 => do not set)
       FBNLLB200D600M_MAX_INPUT_TOKENS (default: 1024)
       FBNLLB200D600M_MAX_NEW_TOKENS   (default: 256)
+      FBNLLB200D600M_MAX_NEW_TOKENS_RATIO (default: 2.0; per-row limit src*ratio+slack, 0 => fixed)
+      FBNLLB200D600M_MAX_NEW_TOKENS_SLACK (default: 16)
+      FBNLLB200D600M_LOOP_NGRAM       (default: 4; repetition-loop stop, 0 => off)
+      FBNLLB200D600M_LOOP_REPEATS     (default: 4)
       FBNLLB200D600M_NUM_BEAMS        (default: 1)
       FBNLLB200D600M_BATCH_SIZE       (default: 8)
+      FBNLLB200D600M_BATCH_MAX_TOKENS (default: 2048; padded tokens per batch, 0 => BATCH_SIZE rows)
+      FBNLLB200D600M_PIPELINE_DEPTH   (default: 2; 0 => no tokenize/generate/decode overlap)
+      FBNLLB200D600M_PRECISION        (default: fp32; fp32|bf16|int8-dynamic)
+      FBNLLB200D600M_BACKEND          (default: torch; torch|onnx|ct2)
+      FBNLLB200D600M_ONNX_DIR         (default: <HF_HOME>/yttrans-onnx)
+      FBNLLB200D600M_CT2_DIR          (default: <HF_HOME>/yttrans-ct2)
+      FBNLLB200D600M_SHORTLIST        (default: 0; 1 => per-target-lang output vocabulary shortlist)
+      FBNLLB200D600M_REPLICAS         (default: 0 => MAX_CONCURRENCY)
+      FBNLLB200D600M_REPLICA_THREADS  (default: 0 => TORCH_THREADS or CPUs / REPLICAS)
       FBNLLB200D600M_WARMUP           (default: 0/1)
     """
     return {
@@ -35,8 +55,38 @@ def load_fbnllb200d600m_config():
         "fbnllb200d600m_torch_threads": _env_int("FBNLLB200D600M_TORCH_THREADS", 0),
         "fbnllb200d600m_max_input_tokens": _env_int("FBNLLB200D600M_MAX_INPUT_TOKENS", 1024),
         "fbnllb200d600m_max_new_tokens": _env_int("FBNLLB200D600M_MAX_NEW_TOKENS", 256),
+        # per-row limit: min(MAX_NEW_TOKENS, src tokens * RATIO + SLACK); RATIO=0 => fixed MAX_NEW_TOKENS
+        "fbnllb200d600m_max_new_tokens_ratio": _env_float("FBNLLB200D600M_MAX_NEW_TOKENS_RATIO", 2.0),
+        "fbnllb200d600m_max_new_tokens_slack": _env_int("FBNLLB200D600M_MAX_NEW_TOKENS_SLACK", 16),
+        # stop rows whose output ends in an n-gram (n <= LOOP_NGRAM) repeated LOOP_REPEATS times; 0 = off
+        "fbnllb200d600m_loop_ngram": _env_int("FBNLLB200D600M_LOOP_NGRAM", 4),
+        "fbnllb200d600m_loop_repeats": _env_int("FBNLLB200D600M_LOOP_REPEATS", 4),
         "fbnllb200d600m_num_beams": _env_int("FBNLLB200D600M_NUM_BEAMS", 1),
         "fbnllb200d600m_batch_size": _env_int("FBNLLB200D600M_BATCH_SIZE", 8),
+        "fbnllb200d600m_batch_max_tokens": _env_int("FBNLLB200D600M_BATCH_MAX_TOKENS", 2048),
+        # batches in flight per pipeline stage (tensors / generate / decode overlap); 0 => one batch at a time
+        "fbnllb200d600m_pipeline_depth": _env_int("FBNLLB200D600M_PIPELINE_DEPTH", 2),
+        # fp32 | bf16 | int8-dynamic (dynamic int8 Linear layers, CPU only)
+        "fbnllb200d600m_precision": _env("FBNLLB200D600M_PRECISION", "fp32").strip().lower(),
+        # torch | onnx (onnxruntime CPU) | ct2 (CTranslate2); exported/converted models are
+        # kept under <HF_HOME>/yttrans-onnx, <HF_HOME>/yttrans-ct2 unless *_DIR is set
+        "fbnllb200d600m_backend": _env("FBNLLB200D600M_BACKEND", "torch").strip().lower(),
+        "fbnllb200d600m_onnx_dir": _env("FBNLLB200D600M_ONNX_DIR", ""),
+        "fbnllb200d600m_ct2_dir": _env("FBNLLB200D600M_CT2_DIR", ""),
+        # per-target-lang output vocabulary shortlist (torch backend): decode projects onto
+        # SHORTLIST_SIZE tokens only. Built offline (shortlist.py) or from own outputs after
+        # SHORTLIST_MIN_TOKENS generated tokens (0 = offline only), once the most frequent ids
+        # cover SHORTLIST_MIN_COVERAGE of the latest outputs.
+        # Langs without one use the full vocab.
+        "fbnllb200d600m_shortlist": _env_int("FBNLLB200D600M_SHORTLIST", 0),
+        "fbnllb200d600m_shortlist_dir": _env("FBNLLB200D600M_SHORTLIST_DIR", ""),
+        "fbnllb200d600m_shortlist_size": _env_int("FBNLLB200D600M_SHORTLIST_SIZE", 32000),
+        "fbnllb200d600m_shortlist_min_tokens": _env_int("FBNLLB200D600M_SHORTLIST_MIN_TOKENS", 200000),
+        "fbnllb200d600m_shortlist_min_coverage": _env_float("FBNLLB200D600M_SHORTLIST_MIN_COVERAGE", 0.995),
         "fbnllb200d600m_warmup": _env_int("FBNLLB200D600M_WARMUP", 0),
         "fbnllb200d600m_max_concurrency": _env_int("FBNLLB200D600M_MAX_CONCURRENCY", 1),
+        # model replicas (shared weights, own tokenizer) serving parallel batches; 0 => MAX_CONCURRENCY
+        "fbnllb200d600m_replicas": _env_int("FBNLLB200D600M_REPLICAS", 0),
+        # intra-op threads per replica; 0 => TORCH_THREADS (or the CPUs) / REPLICAS
+        "fbnllb200d600m_replica_threads": _env_int("FBNLLB200D600M_REPLICA_THREADS", 0),
     }
@@ -15,14 +15,49 @@ def _env_int(name, default):
     return int(v)
 
 
+def _env_float(name, default):
+    v = os.getenv(name)
+    if v is None or v == "":
+        return float(default)
+    return float(v)
+
+
 def load_madlad400_config():
     return {
         "madlad400_model": _env("MADLAD400_MODEL", "google/madlad400-3b-mt"),
         "madlad400_device": _env("MADLAD400_DEVICE", "cpu"),
         "madlad400_torch_threads": _env_int("MADLAD400_TORCH_THREADS", 1),
         "madlad400_batch_size": _env_int("MADLAD400_BATCH_SIZE", 1),
+        "madlad400_batch_max_tokens": _env_int("MADLAD400_BATCH_MAX_TOKENS", 0),
+        # batches in flight per pipeline stage (tensors / generate / decode overlap); 0 => one batch at a time
+        "madlad400_pipeline_depth": _env_int("MADLAD400_PIPELINE_DEPTH", 2),
+        # fp32 | bf16 | int8-dynamic (dynamic int8 Linear layers, CPU only)
+        "madlad400_precision": _env("MADLAD400_PRECISION", "fp32").strip().lower(),
+        # torch | ct2 (CTranslate2; converted once into CT2_DIR, default <HF_HOME>/yttrans-ct2)
+        "madlad400_backend": _env("MADLAD400_BACKEND", "torch").strip().lower(),
+        "madlad400_ct2_dir": _env("MADLAD400_CT2_DIR", ""),
+        # per-target-lang output vocabulary shortlist (torch backend): decode projects onto
+        # SHORTLIST_SIZE tokens only. Built offline (shortlist.py) or from own outputs after
+        # SHORTLIST_MIN_TOKENS generated tokens (0 = offline only), once the most frequent ids
+        # cover SHORTLIST_MIN_COVERAGE of the latest outputs.
+        # Langs without one use the full vocab.
+        "madlad400_shortlist": _env_int("MADLAD400_SHORTLIST", 0),
+        "madlad400_shortlist_dir": _env("MADLAD400_SHORTLIST_DIR", ""),
+        "madlad400_shortlist_size": _env_int("MADLAD400_SHORTLIST_SIZE", 32000),
+        "madlad400_shortlist_min_tokens": _env_int("MADLAD400_SHORTLIST_MIN_TOKENS", 200000),
+        "madlad400_shortlist_min_coverage": _env_float("MADLAD400_SHORTLIST_MIN_COVERAGE", 0.995),
         "madlad400_max_input_tokens": _env_int("MADLAD400_MAX_INPUT_TOKENS", 512),
         "madlad400_max_new_tokens": _env_int("MADLAD400_MAX_NEW_TOKENS", 256),
+        # per-row limit: min(MAX_NEW_TOKENS, src tokens * RATIO + SLACK); RATIO=0 => fixed MAX_NEW_TOKENS
+        "madlad400_max_new_tokens_ratio": _env_float("MADLAD400_MAX_NEW_TOKENS_RATIO", 2.0),
+        "madlad400_max_new_tokens_slack": _env_int("MADLAD400_MAX_NEW_TOKENS_SLACK", 16),
+        # stop rows whose output ends in an n-gram (n <= LOOP_NGRAM) repeated LOOP_REPEATS times; 0 = off
+        "madlad400_loop_ngram": _env_int("MADLAD400_LOOP_NGRAM", 4),
+        "madlad400_loop_repeats": _env_int("MADLAD400_LOOP_REPEATS", 4),
         "madlad400_num_beams": _env_int("MADLAD400_NUM_BEAMS", 1),
         "madlad400_max_concurrency": _env_int("MADLAD400_MAX_CONCURRENCY", 1),
+        # model replicas (shared weights, own tokenizer) serving parallel batches; 0 => MAX_CONCURRENCY
+        "madlad400_replicas": _env_int("MADLAD400_REPLICAS", 0),
+        # intra-op threads per replica; 0 => TORCH_THREADS (or the CPUs) / REPLICAS
+        "madlad400_replica_threads": _env_int("MADLAD400_REPLICA_THREADS", 0),
     }
\ No newline at end of file
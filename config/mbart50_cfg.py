@@ -15,6 +15,13 @@ def _env_int(name, default):
     return int(v)
 
 
+def _env_float(name, default):
+    v = os.getenv(name)
+    if v is None or v == "":
+        return float(default)
+    return float(v)
+
+
 def load_mbart50_config():
     return {
         # recommended MT checkpoint
@@ -22,8 +29,23 @@ def load_mbart50_config():
         "mbart50_device": _env("MBART50_DEVICE", "cpu"),
         "mbart50_torch_threads": _env_int("MBART50_TORCH_THREADS", 1),
         "mbart50_batch_size": _env_int("MBART50_BATCH_SIZE", 1),
+        "mbart50_batch_max_tokens": _env_int("MBART50_BATCH_MAX_TOKENS", 0),
+        # batches in flight per pipeline stage (tensors / generate / decode overlap); 0 => one batch at a time
+        "mbart50_pipeline_depth": _env_int("MBART50_PIPELINE_DEPTH", 2),
+        # fp32 | bf16 | int8-dynamic (dynamic int8 Linear layers, CPU only)
+        "mbart50_precision": _env("MBART50_PRECISION", "fp32").strip().lower(),
         "mbart50_max_input_tokens": _env_int("MBART50_MAX_INPUT_TOKENS", 512),
         "mbart50_max_new_tokens": _env_int("MBART50_MAX_NEW_TOKENS", 256),
+        # per-row limit: min(MAX_NEW_TOKENS, src tokens * RATIO + SLACK); RATIO=0 => fixed MAX_NEW_TOKENS
+        "mbart50_max_new_tokens_ratio": _env_float("MBART50_MAX_NEW_TOKENS_RATIO", 2.0),
+        "mbart50_max_new_tokens_slack": _env_int("MBART50_MAX_NEW_TOKENS_SLACK", 16),
+        # stop rows whose output ends in an n-gram (n <= LOOP_NGRAM) repeated LOOP_REPEATS times; 0 = off
+        "mbart50_loop_ngram": _env_int("MBART50_LOOP_NGRAM", 4),
+        "mbart50_loop_repeats": _env_int("MBART50_LOOP_REPEATS", 4),
         "mbart50_num_beams": _env_int("MBART50_NUM_BEAMS", 1),
         "mbart50_max_concurrency": _env_int("MBART50_MAX_CONCURRENCY", 1),
+        # model replicas (shared weights, own tokenizer) serving parallel batches; 0 => MAX_CONCURRENCY
+        "mbart50_replicas": _env_int("MBART50_REPLICAS", 0),
+        # intra-op threads per replica; 0 => TORCH_THREADS (or the CPUs) / REPLICAS
+        "mbart50_replica_threads": _env_int("MBART50_REPLICA_THREADS", 0),
     }
\ No newline at end of file
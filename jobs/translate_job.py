@@ -1,10 +1,14 @@
+import hashlib
 import uuid
 
-from utils.json_ut import dumps, loads
+from utils.json_ut import dumps, dumps_packed, loads, loads_packed
 from utils.time_ut import now_iso_utc
 
 
 QUEUE_KEY = "yttrans:jobs:queue"
+PROCESSING_KEY_PREFIX = "yttrans:jobs:processing:"
+# Sum of weights (src chars * target langs) of submitted, not yet finished jobs.
+BACKLOG_CHARS_KEY = "yttrans:jobs:backlog_chars"
 
 
 def job_key(job_id):
@@ -19,15 +23,110 @@ def partial_key(job_id):
     return f"yttrans:partial:{job_id}"
 
 
-def create_job(r, video_id, engine, target_langs, src_lang):
+def payload_key(job_id):
+    return f"yttrans:payload:{job_id}"
+
+
+def processing_key(worker_id):
+    return f"{PROCESSING_KEY_PREFIX}{worker_id}"
+
+
+def lease_key(job_id):
+    return f"yttrans:lease:{job_id}"
+
+
+def rcache_key(content_hash, lang):
+    return f"yttrans:rcache:{content_hash}:{lang}"
+
+
+def inflight_key(content_hash, lang):
+    return f"yttrans:inflight:{content_hash}:{lang}"
+
+
+def content_hash(src_vtt, src_lang, engine, model_tag):
+    """
+    Content address of a translation request (without target langs).
+    """
+    h = hashlib.sha256()
+    for part in (engine or "", model_tag or "", (src_lang or "auto").strip().lower(), src_vtt or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def job_weight(src_vtt, num_langs):
+    return len(src_vtt or "") * max(0, int(num_langs or 0))
+
+
+def create_job(
+    r,
+    video_id,
+    engine,
+    target_langs,
+    src_lang,
+    payload=None,
+    payload_ttl_sec=86400,
+    done_entries=None,
+    result_ttl_sec=3600,
+    coalesce_hash=None,
+    coalesce_ttl_sec=3600,
+):
+    """
+    payload: {video_id, src_vtt, src_lang, target_langs, options}
+    Stored compressed next to the job hash, so any worker sharing this Redis can run the job.
+
+    done_entries: [{lang, vtt}] already available (result cache hits). They are stored as the
+    job's progressive result; the worker translates only the remaining langs. If all target
+    langs are covered the job is created DONE and never queued.
+
+    coalesce_hash: content hash of the request. Each remaining lang is claimed in-flight
+    for this job; langs already in flight for another job with the same hash are attached
+    to that job (payload["attached"] = {lang: owner_job_id}) and not translated again.
+    """
     job_id = str(uuid.uuid4())
+    done_entries = list(done_entries or [])
+    done_langs = {e.get("lang") for e in done_entries}
+    all_done = bool(target_langs) and all(lang in done_langs for lang in target_langs)
+
+    weight = 0
+    attached = {}
+    if not all_done:
+        pending = [lang for lang in (target_langs or []) if lang not in done_langs]
+        if coalesce_hash:
+            attached = claim_inflight(r, coalesce_hash, pending, job_id, coalesce_ttl_sec)
+            if payload is not None:
+                payload = dict(payload, attached=attached)
+        own = [lang for lang in pending if lang not in attached]
+        weight = job_weight((payload or {}).get("src_vtt"), len(own))
+
+    pipe = r.pipeline()
 
-    r.hset(
+    if done_entries:
+        src_lang_n = src_lang or "auto"
+        pipe.set(
+            result_key(job_id),
+            dumps(
+                {
+                    "video_id": video_id,
+                    "default_lang": src_lang_n if src_lang_n != "auto" else "auto",
+                    "entries": done_entries,
+                    "meta": {
+                        "source_lang": src_lang_n,
+                        "engine": engine,
+                        "cached_langs": sorted(done_langs),
+                        "completed_at": now_iso_utc() if all_done else "",
+                    },
+                }
+            ),
+            ex=int(result_ttl_sec),
+        )
+
+    pipe.hset(
         job_key(job_id),
         mapping={
-            "state": "QUEUED",
-            "percent": "0",
-            "message": "queued",
+            "state": "DONE" if all_done else "QUEUED",
+            "percent": "100" if all_done else "0",
+            "message": "done (cached)" if all_done else "queued",
             "video_id": video_id,
             "engine": engine,
             "src_lang": src_lang or "auto",
@@ -35,13 +134,34 @@ def create_job(r, video_id, engine, target_langs, src_lang):
             "created_at": now_iso_utc(),
             "updated_at": now_iso_utc(),
             "err": "",
-            "meta": dumps({}),
+            "meta": dumps(_initial_meta(done_langs, attached)),
+            "backlog_weight": str(weight),
+            # in-flight claims of a failed job are released by hash, even without its payload
+            "content_hash": coalesce_hash or "",
         },
     )
-    r.lpush(QUEUE_KEY, job_id)
+    if all_done:
+        pipe.execute()
+        return job_id
+
+    pipe.incrby(BACKLOG_CHARS_KEY, weight)
+    if payload is not None:
+        pipe.set(payload_key(job_id), dumps_packed(payload), ex=int(payload_ttl_sec))
+    # payload must exist before the job id becomes visible in the queue
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
     return job_id
 
 
+def _initial_meta(done_langs, attached):
+    meta = {}
+    if done_langs:
+        meta["cached_langs"] = sorted(done_langs)
+    if attached:
+        meta["coalesced_langs"] = dict(attached)
+    return meta
+
+
 def set_status(r, job_id, state=None, percent=None, message=None, err=None, meta=None):
     m = {"updated_at": now_iso_utc()}
     if state is not None:
@@ -84,6 +204,8 @@ def get_status(r, job_id):
         "target_langs": target_langs,
         "err": h.get("err") or "",
         "meta": meta,
+        "attempts": int(h.get("attempts") or 0),
+        "content_hash": h.get("content_hash") or "",
         "created_at": h.get("created_at") or "",
         "updated_at": h.get("updated_at") or "",
     }
@@ -116,4 +238,233 @@ def load_partial_result(r, job_id):
 
 
 def delete_partial_result(r, job_id):
-    r.delete(partial_key(job_id))
\ No newline at end of file
+    r.delete(partial_key(job_id))
+
+
+def load_payload(r, job_id):
+    s = r.get(payload_key(job_id))
+    if not s:
+        return None
+    return loads_packed(s)
+
+
+def delete_payload(r, job_id):
+    r.delete(payload_key(job_id))
+
+
+# ---- reliable queue: claim -> lease + heartbeat -> release; reaper requeues expired leases ----
+
+# Renew/delete an owned key (lease, in-flight claim) only while we still own it.
+_OWNED_RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_OWNED_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Hand an owned key over to a new owner (ARGV[2]) only while the old owner (ARGV[1]) holds it.
+_OWNED_SWAP_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+  return 1
+end
+return 0
+"""
+
+
+def claim_job(r, worker_id, lease_ttl_sec, timeout=1):
+    """
+    Atomically move next job id from the queue to this worker's processing list
+    and take a lease on it. Returns job_id or None.
+    """
+    job_id = r.blmove(QUEUE_KEY, processing_key(worker_id), timeout, src="RIGHT", dest="LEFT")
+    if not job_id:
+        return None
+    r.set(lease_key(job_id), worker_id, ex=int(lease_ttl_sec))
+    r.hincrby(job_key(job_id), "attempts", 1)
+    return job_id
+
+
+def renew_lease(r, job_id, worker_id, lease_ttl_sec):
+    """
+    Heartbeat. Returns False if the lease was lost (expired and maybe taken by another worker).
+    """
+    return bool(r.eval(_OWNED_RENEW_LUA, 1, lease_key(job_id), worker_id, int(lease_ttl_sec)))
+
+
+def release_job(r, job_id, worker_id):
+    pipe = r.pipeline()
+    pipe.lrem(processing_key(worker_id), 0, job_id)
+    pipe.eval(_OWNED_RELEASE_LUA, 1, lease_key(job_id), worker_id)
+    pipe.execute()
+
+
+def requeue_expired(r, suspects):
+    """
+    Reaper pass over all workers' processing lists.
+    A job without a lease is requeued only if it was already leaseless on the previous pass
+    (covers the short window between BLMOVE and SET lease in claim_job).
+
+    suspects: set of (processing_key, job_id) from previous pass.
+    Returns (requeued_job_ids, new_suspects).
+    """
+    requeued = []
+    new_suspects = set()
+
+    for pkey in r.scan_iter(match=f"{PROCESSING_KEY_PREFIX}*", count=100):
+        for job_id in r.lrange(pkey, 0, -1):
+            if r.exists(lease_key(job_id)):
+                continue
+            item = (pkey, job_id)
+            if item not in suspects:
+                new_suspects.add(item)
+                continue
+            # LREM first: only the reaper that actually removed it requeues it
+            if r.lrem(pkey, 1, job_id):
+                # RPUSH: picked up next (workers pop from the right)
+                r.rpush(QUEUE_KEY, job_id)
+                requeued.append(job_id)
+
+    return requeued, new_suspects
+
+
+# ---- admission control ----
+
+
+def get_backlog(r):
+    pipe = r.pipeline()
+    pipe.llen(QUEUE_KEY)
+    pipe.get(BACKLOG_CHARS_KEY)
+    queued_jobs, backlog_chars = pipe.execute()
+    return {
+        "queued_jobs": int(queued_jobs or 0),
+        "backlog_chars": max(0, int(backlog_chars or 0)),
+    }
+
+
+def release_backlog(r, job_id):
+    """
+    Subtract job weight from backlog counter once per job (HDEL wins only once).
+    """
+    w = r.hget(job_key(job_id), "backlog_weight")
+    if not w:
+        return
+    if r.hdel(job_key(job_id), "backlog_weight"):
+        left = r.decrby(BACKLOG_CHARS_KEY, int(w))
+        if left < 0:
+            r.set(BACKLOG_CHARS_KEY, 0)
+
+
+# ---- content-addressed result cache: one entry per (content hash, target lang) ----
+
+
+def load_cached_results(r, chash, langs, ttl_sec=None):
+    """
+    Returns dict lang -> vtt for cached langs. Hits get their TTL refreshed (LRU-like retention).
+    """
+    langs = [x for x in (langs or []) if x]
+    if not chash or not langs:
+        return {}
+    keys = [rcache_key(chash, lang) for lang in langs]
+    vals = r.mget(keys)
+
+    out = {}
+    for lang, v in zip(langs, vals):
+        if not v:
+            continue
+        try:
+            out[lang] = loads_packed(v)
+        except Exception:
+            continue
+
+    if out and ttl_sec:
+        pipe = r.pipeline(transaction=False)
+        for lang in out:
+            pipe.expire(rcache_key(chash, lang), int(ttl_sec))
+        pipe.execute()
+    return out
+
+
+def store_cached_result(r, chash, lang, vtt, ttl_sec=7 * 86400):
+    if not chash or not lang:
+        return
+    r.set(rcache_key(chash, lang), dumps_packed(vtt), ex=int(ttl_sec))
+
+
+# ---- in-flight (single-flight) claims ----
+# yttrans:inflight:{hash}:{lang} = owner job id while that lang is being translated.
+# Another job with the same hash waits for the owner's result cache entry instead.
+
+
+def claim_inflight(r, chash, langs, job_id, ttl_sec):
+    """
+    SET NX an in-flight claim per lang. Returns dict lang -> owner job id
+    for langs already claimed by another job (those are not claimed).
+    """
+    langs = [x for x in (langs or []) if x]
+    if not chash or not langs:
+        return {}
+    pipe = r.pipeline(transaction=False)
+    for lang in langs:
+        key = inflight_key(chash, lang)
+        pipe.set(key, job_id, nx=True, ex=int(ttl_sec))
+        pipe.get(key)
+    res = pipe.execute()
+
+    out = {}
+    for i, lang in enumerate(langs):
+        owner = res[2 * i + 1]
+        if owner and owner != job_id:
+            out[lang] = owner
+    return out
+
+
+def get_inflight_owner(r, chash, lang):
+    if not chash or not lang:
+        return None
+    return r.get(inflight_key(chash, lang))
+
+
+def renew_inflight(r, chash, langs, job_id, ttl_sec):
+    if not chash or not langs:
+        return
+    pipe = r.pipeline(transaction=False)
+    for lang in langs:
+        pipe.eval(_OWNED_RENEW_LUA, 1, inflight_key(chash, lang), job_id, int(ttl_sec))
+    pipe.execute()
+
+
+def release_inflight(r, chash, lang, job_id):
+    if not chash or not lang:
+        return
+    r.eval(_OWNED_RELEASE_LUA, 1, inflight_key(chash, lang), job_id)
+
+
+def release_inflight_many(r, chash, langs, job_id):
+    """
+    Drops this job's in-flight claims for langs; claims held by other jobs are left alone.
+    """
+    langs = [x for x in (langs or []) if x]
+    if not chash or not langs:
+        return
+    pipe = r.pipeline(transaction=False)
+    for lang in langs:
+        pipe.eval(_OWNED_RELEASE_LUA, 1, inflight_key(chash, lang), job_id)
+    pipe.execute()
+
+
+def takeover_inflight(r, chash, lang, from_job_id, job_id, ttl_sec):
+    """
+    Moves the in-flight claim for lang from from_job_id (e.g. a FAILED owner) to job_id.
+    Returns False if from_job_id no longer holds it.
+    """
+    if not chash or not lang:
+        return False
+    return bool(r.eval(_OWNED_SWAP_LUA, 1, inflight_key(chash, lang), from_job_id, job_id, int(ttl_sec)))
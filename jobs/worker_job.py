@@ -1,17 +1,40 @@
 import asyncio
 import logging
+import os
+import uuid
 
 from jobs.translate_job import (
-    QUEUE_KEY,
+    claim_inflight,
+    claim_job,
+    delete_payload,
+    get_inflight_owner,
     get_status,
+    load_cached_results,
+    load_payload,
+    load_result,
+    release_backlog,
+    release_inflight,
+    release_inflight_many,
+    release_job,
+    renew_inflight,
+    renew_lease,
+    requeue_expired,
+    store_cached_result,
     set_status,
     store_result,
     store_partial_result,
+    takeover_inflight,
 )
-from services.providers.base_prv import build_provider
+from services.batcher_srv import batcher_stats, wrap_with_batcher
+from services.executor_srv import InferenceExecutor, provider_max_concurrency
+from services.procpool_srv import procpool_stats, wrap_with_procpool
+from services.providers.base_prv import get_provider, has_async_batch, warmup_provider
+from services.segcache_srv import segment_cache_stats, wrap_with_segment_cache
 from utils.time_ut import now_ms, now_iso_utc
 from utils.vtt_ut import (
-    extract_translatable_lines,
+    dedupe_texts,
+    expand_deduped,
+    extract_vtt_lines,
     inject_translated_lines,
     batch_translate_texts,
     translate_vtt,
@@ -93,24 +116,24 @@ def _publish_partial(
         log.exception("job=%s video_id=%s partial_publish_failed", job_id, video_id)
 
 
-async def run_workers(cfg, r, inmem_requests, stop_event):
+async def run_workers(cfg, r, stop_event, executor=None):
     """
-    inmem_requests: dict job_id -> {video_id, src_vtt, src_lang, target_langs, options}
+    Job payloads ({video_id, src_vtt, src_lang, target_langs, options}) are read from Redis,
+    so any instance sharing the queue can run any job.
+    executor: InferenceExecutor for blocking provider calls (created from provider if None)
     """
     max_parallel = int(cfg.get("max_parallel") or 1)
     sem = asyncio.Semaphore(max_parallel)
-    provider = build_provider(cfg)
+    # shared model instance; cached segments never reach it,
+    # misses from all jobs are micro-batched together and run in pool processes (if enabled)
+    provider = wrap_with_segment_cache(wrap_with_batcher(wrap_with_procpool(get_provider(cfg), cfg), cfg), cfg, r)
 
-    # Warmup: load model at service startup (optional)
-    try:
-        engine_l = (cfg.get("engine") or "").lower()
-        if engine_l in ("fbm2m100", "fbnllb200d600m") and int(cfg.get(f"{engine_l}_warmup", 0) or 0) == 1:
-            log.info("%s warmup: loading model...", engine_l)
-            if hasattr(provider, "warmup"):
-                provider.warmup()
-            log.info("%s warmup: done", engine_l)
-    except Exception as e:
-        log.warning("warmup failed: %s", str(e))
+    own_executor = executor is None
+    if own_executor:
+        executor = InferenceExecutor.for_provider(provider, cfg)
+
+    # Warmup: load model at service startup (optional, <engine>_warmup=1)
+    await executor.run(warmup_provider, cfg)
 
     # pull from global config
     max_total_chars = int(cfg.get("max_total_chars") or 4500)
@@ -119,135 +142,351 @@ async def run_workers(cfg, r, inmem_requests, stop_event):
     job_lang_parallelism = int(cfg.get("job_lang_parallelism") or 1)
 
     def _provider_max_concurrency() -> int:
-        # providers may expose max_concurrency attribute (int)
-        try:
-            v = getattr(provider, "max_concurrency", None)
-            if v is None:
-                return 1
-            return max(1, int(v))
-        except Exception:
-            return 1
+        return provider_max_concurrency(provider, cfg)
 
-    async def one_job(job_id):
-        async with sem:
-            req = inmem_requests.get(job_id)
-            if not req:
-                set_status(
-                    r,
-                    job_id,
-                    state="FAILED",
-                    percent=0,
-                    message="missing request payload",
-                    err="missing_payload",
-                )
-                return
+    # reliable queue
+    worker_id = f"{cfg.get('instance_id') or 'yttrans'}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    lease_ttl_sec = max(5, int(cfg.get("lease_ttl_sec") or 60))
+    job_max_attempts = max(1, int(cfg.get("job_max_attempts") or 3))
 
-            video_id = req.get("video_id", "")
-            src_vtt = req.get("src_vtt", "")
-            src_lang = req.get("src_lang", "auto")
-            target_langs = req.get("target_langs") or []
-            options = req.get("options") or {}
+    # single-flight: langs attached to another job's in-flight work are awaited, not translated
+    coalesce_poll_sec = max(0.05, int(cfg.get("coalesce_poll_ms") or 1000) / 1000.0)
+    # job_id -> (content_hash, set of langs this job holds in-flight claims for)
+    job_inflight = {}
 
-            started = now_ms()
-            engine = cfg.get("engine")
+    loop = asyncio.get_running_loop()
 
-            log.info(
-                "job=%s video_id=%s state=RUNNING engine=%s targets=%s",
+    async def _heartbeat(job_id, job_task):
+        """
+        Renews the lease and the job's in-flight claims. Returns only if the lease was lost:
+        the reaper may already have requeued the job to another worker, so job_task is
+        cancelled and nothing is renewed for it anymore.
+        """
+        interval = max(1.0, lease_ttl_sec / 3.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                ok = await loop.run_in_executor(None, renew_lease, r, job_id, worker_id, lease_ttl_sec)
+                if not ok:
+                    log.warning("job=%s worker=%s lease_lost -> cancel", job_id, worker_id)
+                    job_inflight.pop(job_id, None)
+                    job_task.cancel()
+                    return
+                chash, langs = job_inflight.get(job_id) or ("", set())
+                if langs:
+                    await loop.run_in_executor(None, renew_inflight, r, chash, list(langs), job_id, lease_ttl_sec)
+            except Exception:
+                log.exception("job=%s lease_renew_failed", job_id)
+
+    async def one_job(job_id):
+        # caller already holds a sem slot for this job
+        job_task = asyncio.ensure_future(_run_job(job_id))
+        hb = asyncio.create_task(_heartbeat(job_id, job_task))
+        finished = False
+        try:
+            await job_task
+            finished = True
+        except asyncio.CancelledError:
+            # heartbeat finished on its own => lease lost; the job belongs to the new lease holder
+            if not hb.done() or hb.cancelled():
+                raise
+        finally:
+            hb.cancel()
+            job_inflight.pop(job_id, None)
+            sem.release()
+            # Cancelled/crashed jobs stay in the processing list: the lease expires
+            # and the reaper (here or on another node) requeues them.
+            if finished:
+                try:
+                    await loop.run_in_executor(None, release_job, r, job_id, worker_id)
+                except Exception:
+                    log.exception("job=%s release_failed", job_id)
+
+    def _release_claims(job_id, st):
+        # claims create_job took at submit; otherwise attached jobs wait out coalesce_ttl_sec
+        try:
+            release_inflight_many(r, st.get("content_hash") or "", st.get("target_langs") or [], job_id)
+        except Exception:
+            log.exception("job=%s inflight_release_failed", job_id)
+
+    async def _run_job(job_id):
+        st = get_status(r, job_id)
+        if not st:
+            return
+        if (st.get("state") or "").upper() in ("DONE", "FAILED"):
+            # finished before its lease was released; nothing to do
+            return
+
+        attempts = int(st.get("attempts") or 0)
+        if attempts > job_max_attempts:
+            log.warning("job=%s state=FAILED attempts=%s max_attempts=%s", job_id, attempts, job_max_attempts)
+            set_status(
+                r,
                 job_id,
-                video_id,
-                engine,
-                target_langs,
+                state="FAILED",
+                percent=0,
+                message=f"too many attempts ({attempts})",
+                err="max_attempts",
             )
+            delete_payload(r, job_id)
+            release_backlog(r, job_id)
+            _release_claims(job_id, st)
+            return
+
+        try:
+            req = load_payload(r, job_id)
+        except Exception:
+            log.exception("job=%s payload_load_failed", job_id)
+            req = None
+        if not req:
             set_status(
                 r,
                 job_id,
-                state="RUNNING",
-                percent=1,
-                message="running",
-                meta={"engine": engine, "started_at": now_iso_utc()},
+                state="FAILED",
+                percent=0,
+                message="missing request payload",
+                err="missing_payload",
             )
+            release_backlog(r, job_id)
+            _release_claims(job_id, st)
+            return
 
-            entries = []
-            total = max(1, len(target_langs))
-            done = 0
-
-            failed_langs = []
-            errors = {}
-            fallback_langs = []
+        video_id = req.get("video_id", "")
+        src_vtt = req.get("src_vtt", "")
+        src_lang = req.get("src_lang", "auto")
+        target_langs = req.get("target_langs") or []
+        options = req.get("options") or {}
 
-            base_lines, idxs, texts = extract_translatable_lines(src_vtt)
-            src_has_trailing_nl = src_vtt.endswith("\n")
+        started = now_ms()
+        engine = cfg.get("engine")
 
-            weight = _compute_job_weight(src_vtt, len(target_langs))
-            delay_sec = _delay_for_job(weight, len(target_langs))
-
-            progressive_result = {
-                "video_id": video_id,
-                "default_lang": src_lang if src_lang and src_lang != "auto" else "auto",
-                "entries": [],
-                "meta": {
-                    "source_lang": src_lang or "auto",
-                    "engine": engine,
-                    "options": options,
-                    "started_at": now_iso_utc(),
-                    "weight": weight,
-                    "failed_langs": [],
-                    "fallback_langs": [],
-                    "errors": {},
-                },
-            }
-
-            state_lock = asyncio.Lock()
-
-            def _compute_percent(done_count: int) -> int:
-                return int(1 + (done_count / total) * 98)
+        log.info(
+            "job=%s video_id=%s state=RUNNING engine=%s targets=%s",
+            job_id,
+            video_id,
+            engine,
+            target_langs,
+        )
+        set_status(
+            r,
+            job_id,
+            state="RUNNING",
+            percent=1,
+            message="running",
+            meta={"engine": engine, "started_at": now_iso_utc()},
+        )
 
-            def _compute_msg(done_count: int) -> str:
-                msg = f"translated {done_count}/{total}"
-                if failed_langs:
-                    msg += f", failed={len(failed_langs)}"
-                if fallback_langs:
-                    msg += f", fallback={len(fallback_langs)}"
-                return msg
+        entries = []
+        total = max(1, len(target_langs))
+        done = 0
 
-            _publish_partial(
-                r=r,
-                job_id=job_id,
-                video_id=video_id,
-                state="RUNNING",
-                percent=1,
-                message="running",
-                target_langs=target_langs,
-                entries=entries,
-                failed_langs=failed_langs,
-                fallback_langs=fallback_langs,
-                errors=errors,
-                engine=engine,
-                weight=weight,
-            )
+        # Keep languages already stored in the progressive result:
+        # result cache hits filled in at submit, or work done before a crash/requeue.
+        resumed_langs = []
+        try:
+            prev = load_result(r, job_id) or {}
+        except Exception:
+            prev = {}
+        for e in prev.get("entries") or []:
+            lang = e.get("lang") or ""
+            if lang in target_langs and lang not in resumed_langs and e.get("vtt"):
+                entries.append(e)
+                resumed_langs.append(lang)
+        done = len(resumed_langs)
+        if resumed_langs:
+            log.info("job=%s video_id=%s resume attempt=%s already_done=%s", job_id, video_id, attempts, resumed_langs)
+
+        chash = req.get("content_hash") or ""
+        result_cache_ttl_sec = int(cfg.get("result_cache_ttl_sec") or 7 * 86400)
+
+        pending_langs = [lang for lang in target_langs if lang not in resumed_langs]
+
+        # Langs attached at submit wait for their owner job. Own langs are (re)claimed:
+        # after a requeue another job may have taken some of them over meanwhile.
+        attached = {}
+        own_inflight = set()
+        if chash and req.get("attached") is not None:
+            attached = {k: v for k, v in (req.get("attached") or {}).items() if k in pending_langs}
+            own = [lang for lang in pending_langs if lang not in attached]
+            try:
+                attached.update(claim_inflight(r, chash, own, job_id, lease_ttl_sec))
+                own_inflight.update(lang for lang in own if lang not in attached)
+                renew_inflight(r, chash, list(own_inflight), job_id, lease_ttl_sec)
+            except Exception:
+                log.exception("job=%s inflight_claim_failed", job_id)
+            job_inflight[job_id] = (chash, own_inflight)
+            if attached:
+                log.info("job=%s video_id=%s coalesced=%s", job_id, video_id, attached)
+        coalesced_langs = {}
+
+        failed_langs = []
+        errors = {}
+        fallback_langs = []
+
+        base_lines, idxs, texts, rolling = extract_vtt_lines(src_vtt, rolling=cfg.get("vtt_rolling") or "auto")
+        src_has_trailing_nl = src_vtt.endswith("\n")
+        # rolling mode: line-by-line fallback works on the tag-stripped source too
+        fallback_src_vtt = "\n".join(base_lines) + ("\n" if src_has_trailing_nl else "") if rolling else src_vtt
+
+        # each distinct line is translated once and fanned back out
+        uniq_texts, dedup_plan = dedupe_texts(texts)
+        dedup = {
+            "lines": len(texts),
+            "unique_lines": len(uniq_texts),
+            "dedup_ratio": round(1.0 - len(uniq_texts) / len(texts), 4) if texts else 0.0,
+            "rolling": rolling,
+        }
+        log.info("job=%s video_id=%s dedup=%s", job_id, video_id, dedup)
+
+        weight = _compute_job_weight(src_vtt, len(target_langs))
+        delay_sec = _delay_for_job(weight, len(target_langs))
+
+        progressive_result = {
+            "video_id": video_id,
+            "default_lang": src_lang if src_lang and src_lang != "auto" else "auto",
+            "entries": list(entries),
+            "meta": {
+                "source_lang": src_lang or "auto",
+                "engine": engine,
+                "options": options,
+                "started_at": now_iso_utc(),
+                "weight": weight,
+                "failed_langs": [],
+                "fallback_langs": [],
+                "errors": {},
+                "coalesced_langs": {},
+                "dedup": dedup,
+            },
+        }
 
-            # Effective per-job concurrency
-            eff = min(
-                max(1, job_lang_parallelism),
-                max(1, _provider_max_concurrency()),
-                max(1, len(target_langs)),
-            )
-            lang_sem = asyncio.Semaphore(eff)
+        state_lock = asyncio.Lock()
+
+        def _compute_percent(done_count: int) -> int:
+            return int(1 + (done_count / total) * 98)
+
+        def _compute_msg(done_count: int) -> str:
+            msg = f"translated {done_count}/{total}"
+            if failed_langs:
+                msg += f", failed={len(failed_langs)}"
+            if fallback_langs:
+                msg += f", fallback={len(fallback_langs)}"
+            return msg
+
+        _publish_partial(
+            r=r,
+            job_id=job_id,
+            video_id=video_id,
+            state="RUNNING",
+            percent=1,
+            message="running",
+            target_langs=target_langs,
+            entries=entries,
+            failed_langs=failed_langs,
+            fallback_langs=fallback_langs,
+            errors=errors,
+            engine=engine,
+            weight=weight,
+        )
 
-            log.info(
-                "job=%s video_id=%s lang_parallelism=%s provider_max_concurrency=%s effective=%s",
-                job_id,
-                video_id,
-                job_lang_parallelism,
-                _provider_max_concurrency(),
-                eff,
-            )
+        # Effective per-job concurrency
+        eff = min(
+            max(1, job_lang_parallelism),
+            max(1, _provider_max_concurrency()),
+            max(1, len(target_langs)),
+        )
+        lang_sem = asyncio.Semaphore(eff)
 
-            async def translate_one_lang(lang: str):
-                nonlocal done
+        log.info(
+            "job=%s video_id=%s lang_parallelism=%s provider_max_concurrency=%s effective=%s",
+            job_id,
+            video_id,
+            job_lang_parallelism,
+            _provider_max_concurrency(),
+            eff,
+        )
 
-                async with lang_sem:
-                    lang_started = now_ms()
+        # Encode once / decode many: own langs go to the provider in groups,
+        # one encoder pass per group instead of one per lang.
+        multi_tasks = {}
+        multi_group = int(cfg.get("multi_target_group") or 0)
+        if multi_group > 0 and uniq_texts and hasattr(provider, "translate_batch_multi"):
+            own_langs = [lang for lang in pending_langs if lang not in attached]
+            for g in range(0, len(own_langs), multi_group):
+                group = own_langs[g : g + multi_group]
+                task = asyncio.ensure_future(
+                    executor.run(provider.translate_batch_multi, texts=uniq_texts, src_lang=src_lang, tgt_langs=group)
+                )
+                for lang in group:
+                    multi_tasks[lang] = task
+            log.info("job=%s video_id=%s multi_target_groups=%s", job_id, video_id, -(-len(own_langs) // multi_group))
+
+        async def _wait_for_owner(lang: str):
+            """
+            Polls the owner's result cache entry for an attached lang. Returns the vtt, or None
+            when the owner dropped the lang (claim gone, nothing cached, or owner FAILED)
+            and this job took it over.
+            """
+            owner = attached.get(lang)
+            while True:
+                try:
+                    hits = await loop.run_in_executor(None, load_cached_results, r, chash, [lang])
+                    if lang in hits:
+                        return hits[lang], owner
+                    cur = await loop.run_in_executor(None, get_inflight_owner, r, chash, lang)
+                    if not cur:
+                        # owner may have cached it right after our first look
+                        hits = await loop.run_in_executor(None, load_cached_results, r, chash, [lang])
+                        if lang in hits:
+                            return hits[lang], owner
+                        taken = await loop.run_in_executor(
+                            None, claim_inflight, r, chash, [lang], job_id, lease_ttl_sec
+                        )
+                        cur = taken.get(lang) or job_id
+                    elif cur != job_id:
+                        # a FAILED owner never writes the result; don't wait for its claim to expire
+                        owner = cur
+                        ost = await loop.run_in_executor(None, get_status, r, cur)
+                        if ost and (ost.get("state") or "").upper() == "FAILED":
+                            swapped = await loop.run_in_executor(
+                                None, takeover_inflight, r, chash, lang, cur, job_id, lease_ttl_sec
+                            )
+                            if swapped:
+                                cur = job_id
+                    if cur == job_id:
+                        log.info("job=%s video_id=%s lang=%s coalesce_takeover from=%s", job_id, video_id, lang, owner)
+                        own_inflight.add(lang)
+                        return None, owner
+                    owner = cur
+                except Exception:
+                    log.exception("job=%s lang=%s coalesce_wait_failed -> translate", job_id, lang)
+                    return None, owner
+                await asyncio.sleep(coalesce_poll_sec)
+
+        async def translate_one_lang(lang: str):
+            nonlocal done
+
+            coalesced_vtt, owner = None, None
+            if lang in attached:
+                coalesced_vtt, owner = await _wait_for_owner(lang)
+
+            async with lang_sem:
+                lang_started = now_ms()
+                if coalesced_vtt is not None:
+                    entry = {"lang": lang, "vtt": coalesced_vtt}
+                    async with state_lock:
+                        entries.append(entry)
+                        coalesced_langs[lang] = owner
+                        progressive_result["entries"].append(entry)
+                        progressive_result["meta"]["coalesced_langs"] = dict(coalesced_langs)
+                        store_result(r, job_id, progressive_result, ttl_sec=3600)
+                    log.info(
+                        "job=%s video_id=%s lang=%s state=OK mode=coalesced owner=%s",
+                        job_id,
+                        video_id,
+                        lang,
+                        owner,
+                    )
+                else:
                     log.info(
                         "job=%s video_id=%s lang=%s state=TRANSLATING weight=%s delay_sec=%.2f max_total_chars=%s",
                         job_id,
@@ -259,20 +498,35 @@ async def run_workers(cfg, r, inmem_requests, stop_event):
                     )
 
                     try:
-                        # Prefer provider-native batch if available
-                        if hasattr(provider, "translate_batch"):
-                            translated_texts = provider.translate_batch(texts=texts, src_lang=src_lang, tgt_lang=lang)
+                        # Prefer provider-native batch if available.
+                        # Async providers are awaited directly; blocking provider calls
+                        # go through the executor, never inline on the loop.
+                        if lang in multi_tasks:
+                            multi_res = await multi_tasks.pop(lang)
+                            if lang not in multi_res:
+                                raise RuntimeError(f"translate_batch_multi returned no result for {lang}")
+                            translated_uniq = multi_res[lang]
+                        elif has_async_batch(provider):
+                            translated_uniq = await provider.translate_batch_async(
+                                texts=uniq_texts, src_lang=src_lang, tgt_lang=lang
+                            )
+                        elif hasattr(provider, "translate_batch"):
+                            translated_uniq = await executor.run(
+                                provider.translate_batch, texts=uniq_texts, src_lang=src_lang, tgt_lang=lang
+                            )
                         else:
 
                             def translate_block_sync(block_text):
                                 return provider.translate(text=block_text, src_lang=src_lang, tgt_lang=lang)
 
-                            translated_texts = batch_translate_texts(
-                                texts,
+                            translated_uniq = await executor.run(
+                                batch_translate_texts,
+                                uniq_texts,
                                 translate_block_sync,
                                 max_total_chars=max_total_chars,
                             )
 
+                        translated_texts = expand_deduped(translated_uniq, dedup_plan)
                         vtt_body = inject_translated_lines(base_lines, idxs, translated_texts)
                         vtt_tgt = vtt_body + ("\n" if src_has_trailing_nl else "")
 
@@ -283,6 +537,12 @@ async def run_workers(cfg, r, inmem_requests, stop_event):
                             progressive_result["entries"].append(entry)
                             store_result(r, job_id, progressive_result, ttl_sec=3600)
 
+                        if chash:
+                            try:
+                                store_cached_result(r, chash, lang, vtt_tgt, ttl_sec=result_cache_ttl_sec)
+                            except Exception:
+                                log.exception("job=%s lang=%s result_cache_store_failed", job_id, lang)
+
                         took = now_ms() - lang_started
                         log.info(
                             "job=%s video_id=%s lang=%s state=OK mode=batch duration_ms=%s",
@@ -316,7 +576,7 @@ async def run_workers(cfg, r, inmem_requests, stop_event):
                             def translate_line_sync(line):
                                 return provider.translate(text=line, src_lang=src_lang, tgt_lang=lang)
 
-                            vtt_tgt = translate_vtt(src_vtt, translate_line_sync)
+                            vtt_tgt = await executor.run(translate_vtt, fallback_src_vtt, translate_line_sync)
                             entry = {"lang": lang, "vtt": vtt_tgt}
 
                             async with state_lock:
@@ -327,6 +587,12 @@ async def run_workers(cfg, r, inmem_requests, stop_event):
                                 progressive_result["meta"]["fallback_langs"] = list(fallback_langs)
                                 store_result(r, job_id, progressive_result, ttl_sec=3600)
 
+                            if chash:
+                                try:
+                                    store_cached_result(r, chash, lang, vtt_tgt, ttl_sec=result_cache_ttl_sec)
+                                except Exception:
+                                    log.exception("job=%s lang=%s result_cache_store_failed", job_id, lang)
+
                             took = now_ms() - lang_started
                             log.info(
                                 "job=%s video_id=%s lang=%s state=OK mode=line_by_line duration_ms=%s",
@@ -358,157 +624,218 @@ async def run_workers(cfg, r, inmem_requests, stop_event):
                                 err_txt,
                             )
 
-                    # update progress + partial publish
-                    async with state_lock:
-                        done += 1
-                        percent = _compute_percent(done)
-                        msg = _compute_msg(done)
+                    # drop the claim after the result cache write, so waiting jobs find it
+                    if lang in own_inflight:
+                        own_inflight.discard(lang)
+                        try:
+                            release_inflight(r, chash, lang, job_id)
+                        except Exception:
+                            log.exception("job=%s lang=%s inflight_release_failed", job_id, lang)
+
+                # update progress + partial publish
+                async with state_lock:
+                    done += 1
+                    percent = _compute_percent(done)
+                    msg = _compute_msg(done)
+
+                    set_status(
+                        r,
+                        job_id,
+                        percent=percent,
+                        message=msg,
+                        meta={
+                            "engine": engine,
+                            "failed_langs": failed_langs,
+                            "fallback_langs": fallback_langs,
+                            "weight": weight,
+                        },
+                    )
 
-                        set_status(
-                            r,
-                            job_id,
-                            percent=percent,
-                            message=msg,
-                            meta={
-                                "engine": engine,
-                                "failed_langs": failed_langs,
-                                "fallback_langs": fallback_langs,
-                                "weight": weight,
-                            },
-                        )
+                    _publish_partial(
+                        r=r,
+                        job_id=job_id,
+                        video_id=video_id,
+                        state="RUNNING",
+                        percent=percent,
+                        message=msg,
+                        target_langs=target_langs,
+                        entries=entries,
+                        failed_langs=failed_langs,
+                        fallback_langs=fallback_langs,
+                        errors=errors,
+                        engine=engine,
+                        weight=weight,
+                    )
 
-                        _publish_partial(
-                            r=r,
-                            job_id=job_id,
-                            video_id=video_id,
-                            state="RUNNING",
-                            percent=percent,
-                            message=msg,
-                            target_langs=target_langs,
-                            entries=entries,
-                            failed_langs=failed_langs,
-                            fallback_langs=fallback_langs,
-                            errors=errors,
-                            engine=engine,
-                            weight=weight,
-                        )
+                # pacing (per language)
+                await asyncio.sleep(delay_sec)
 
-                    # pacing (per language)
-                    await asyncio.sleep(delay_sec)
+        try:
+            tasks = [asyncio.create_task(translate_one_lang(lang)) for lang in pending_langs]
+            await asyncio.gather(*tasks)
 
-            try:
-                tasks = [asyncio.create_task(translate_one_lang(lang)) for lang in target_langs]
-                await asyncio.gather(*tasks)
-
-                duration_ms = now_ms() - started
-
-                result_obj = {
-                    "video_id": video_id,
-                    "default_lang": src_lang if src_lang and src_lang != "auto" else "auto",
-                    "entries": entries,
-                    "meta": {
-                        "source_lang": src_lang or "auto",
-                        "engine": engine,
-                        "options": options,
-                        "duration_ms": duration_ms,
-                        "completed_at": now_iso_utc(),
-                        "failed_langs": failed_langs,
-                        "fallback_langs": fallback_langs,
-                        "errors": errors,
-                        "weight": weight,
-                    },
-                }
-                store_result(r, job_id, result_obj, ttl_sec=3600)
-
-                msg = "done"
-                if failed_langs:
-                    msg = f"done with failures: {len(failed_langs)}/{len(target_langs)}"
-
-                set_status(
-                    r,
-                    job_id,
-                    state="DONE",
-                    percent=100,
-                    message=msg,
-                    meta={
-                        "engine": engine,
-                        "duration_ms": duration_ms,
-                        "failed_langs": failed_langs,
-                        "fallback_langs": fallback_langs,
-                        "weight": weight,
-                    },
-                )
+            duration_ms = now_ms() - started
 
-                _publish_partial(
-                    r=r,
-                    job_id=job_id,
-                    video_id=video_id,
-                    state="DONE",
-                    percent=100,
-                    message=msg,
-                    target_langs=target_langs,
-                    entries=entries,
-                    failed_langs=failed_langs,
-                    fallback_langs=fallback_langs,
-                    errors=errors,
-                    engine=engine,
-                    weight=weight,
-                )
+            result_obj = {
+                "video_id": video_id,
+                "default_lang": src_lang if src_lang and src_lang != "auto" else "auto",
+                "entries": entries,
+                "meta": {
+                    "source_lang": src_lang or "auto",
+                    "engine": engine,
+                    "options": options,
+                    "duration_ms": duration_ms,
+                    "completed_at": now_iso_utc(),
+                    "failed_langs": failed_langs,
+                    "fallback_langs": fallback_langs,
+                    "errors": errors,
+                    "weight": weight,
+                    "coalesced_langs": coalesced_langs,
+                    "dedup": dedup,
+                },
+            }
+            store_result(r, job_id, result_obj, ttl_sec=3600)
 
-                log.info(
-                    "job=%s video_id=%s state=DONE duration_ms=%s ok_langs=%s failed_langs=%s fallback_langs=%s",
-                    job_id,
-                    video_id,
-                    duration_ms,
-                    len(entries),
-                    len(failed_langs),
-                    len(fallback_langs),
-                )
+            msg = "done"
+            if failed_langs:
+                msg = f"done with failures: {len(failed_langs)}/{len(target_langs)}"
 
-            except Exception as e:
-                log.exception("job=%s video_id=%s state=FAILED err=%s", job_id, video_id, e)
-                set_status(
-                    r,
-                    job_id,
-                    state="FAILED",
-                    percent=0,
-                    message=str(e),
-                    err=str(e),
-                    meta={"engine": engine},
-                )
+            set_status(
+                r,
+                job_id,
+                state="DONE",
+                percent=100,
+                message=msg,
+                meta={
+                    "engine": engine,
+                    "duration_ms": duration_ms,
+                    "failed_langs": failed_langs,
+                    "fallback_langs": fallback_langs,
+                    "coalesced_langs": coalesced_langs,
+                    "dedup": dedup,
+                    "weight": weight,
+                },
+            )
 
-                _publish_partial(
-                    r=r,
-                    job_id=job_id,
-                    video_id=video_id,
-                    state="FAILED",
-                    percent=0,
-                    message=str(e),
-                    target_langs=target_langs,
-                    entries=entries,
-                    failed_langs=failed_langs,
-                    fallback_langs=fallback_langs,
-                    errors=errors,
-                    engine=engine,
-                    weight=weight,
-                )
+            _publish_partial(
+                r=r,
+                job_id=job_id,
+                video_id=video_id,
+                state="DONE",
+                percent=100,
+                message=msg,
+                target_langs=target_langs,
+                entries=entries,
+                failed_langs=failed_langs,
+                fallback_langs=fallback_langs,
+                errors=errors,
+                engine=engine,
+                weight=weight,
+            )
 
-    loop = asyncio.get_running_loop()
+            log.info(
+                "job=%s video_id=%s state=DONE duration_ms=%s ok_langs=%s failed_langs=%s fallback_langs=%s",
+                job_id,
+                video_id,
+                duration_ms,
+                len(entries),
+                len(failed_langs),
+                len(fallback_langs),
+            )
+            log.info(
+                "job=%s executor_stats=%s segcache_stats=%s batcher_stats=%s procpool_stats=%s",
+                job_id,
+                executor.stats(),
+                segment_cache_stats(),
+                batcher_stats(),
+                procpool_stats(),
+            )
+
+        except Exception as e:
+            log.exception("job=%s video_id=%s state=FAILED err=%s", job_id, video_id, e)
+            set_status(
+                r,
+                job_id,
+                state="FAILED",
+                percent=0,
+                message=str(e),
+                err=str(e),
+                meta={"engine": engine},
+            )
+            try:
+                release_inflight_many(r, chash, list(own_inflight), job_id)
+            except Exception:
+                log.exception("job=%s inflight_release_failed", job_id)
+
+            _publish_partial(
+                r=r,
+                job_id=job_id,
+                video_id=video_id,
+                state="FAILED",
+                percent=0,
+                message=str(e),
+                target_langs=target_langs,
+                entries=entries,
+                failed_langs=failed_langs,
+                fallback_langs=fallback_langs,
+                errors=errors,
+                engine=engine,
+                weight=weight,
+            )
+
+        # job finished (DONE/FAILED): payload is no longer needed.
+        # Not in finally: a cancelled job (shutdown) keeps its payload for the requeue.
+        try:
+            delete_payload(r, job_id)
+            release_backlog(r, job_id)
+        except Exception:
+            log.exception("job=%s payload_delete_failed", job_id)
+
+    async def _reaper():
+        suspects = set()
+        interval = max(1.0, lease_ttl_sec / 2.0)
+        while not stop_event.is_set():
+            try:
+                requeued, suspects = await loop.run_in_executor(None, requeue_expired, r, suspects)
+                for job_id in requeued:
+                    log.warning("job=%s lease_expired -> requeued", job_id)
+            except Exception:
+                log.exception("reaper pass failed")
+            await asyncio.sleep(interval)
+
+    log.info("worker=%s lease_ttl_sec=%s max_attempts=%s", worker_id, lease_ttl_sec, job_max_attempts)
+    reaper_task = asyncio.create_task(_reaper())
 
     while not stop_event.is_set():
+        # Backpressure: pull only when a max_parallel slot is free,
+        # so queued jobs stay in Redis where other nodes can take them.
+        await sem.acquire()
 
-        def brpop():
-            return r.brpop(QUEUE_KEY, timeout=1)
+        def claim():
+            return claim_job(r, worker_id, lease_ttl_sec, timeout=1)
 
-        item = await loop.run_in_executor(None, brpop)
-        if not item:
+        try:
+            job_id = await loop.run_in_executor(None, claim)
+        except Exception:
+            sem.release()
+            log.exception("claim failed")
+            await asyncio.sleep(1.0)
             continue
 
-        _q, job_id = item[0], item[1]
-        st = get_status(r, job_id)
-        if not st:
+        if not job_id:
+            sem.release()
             continue
 
         asyncio.create_task(one_job(job_id))
 
-    await asyncio.sleep(0.2)
\ No newline at end of file
+    reaper_task.cancel()
+    await asyncio.sleep(0.2)
+
+    if hasattr(provider, "aclose"):
+        try:
+            await provider.aclose()
+        except Exception:
+            log.exception("provider aclose failed")
+
+    if own_executor:
+        executor.shutdown(wait=False)
\ No newline at end of file
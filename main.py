@@ -3,12 +3,7 @@ import os
 
 from dotenv import load_dotenv
 
-from config.app_cfg import load_config
-from config.googleweb_cfg import load_googleweb_config
-from config.fbm2m100_cfg import load_fbm2m100_config
-from config.fbnllb200d600m_cfg import load_fbnllb200d600m_config
-from config.madlad400_cfg import load_madlad400_config
-from config.mbart50_cfg import load_mbart50_config
+from config.app_cfg import load_config, load_engine_config
 from services.grpc_srv import serve
 
 
@@ -16,6 +11,12 @@ def _parse_args():
     p = argparse.ArgumentParser()
     p.add_argument("--host", default=os.getenv("YTTRANS_HOST", "0.0.0.0"))
     p.add_argument("--port", type=int, default=int(os.getenv("YTTRANS_PORT", "9095")))
+    p.add_argument(
+        "--role",
+        choices=("api", "worker", "all"),
+        default=(os.getenv("YTTRANS_ROLE") or "all").strip().lower(),
+        help="api: gRPC only, worker: queue workers only, all: both (default)",
+    )
     return p.parse_args()
 
 
@@ -25,19 +26,9 @@ def main():
 
     cfg = load_config()
 
-    engine = (cfg.get("engine") or "").lower()
-    if engine == "googleweb":
-        cfg.update(load_googleweb_config())
-    if engine == "fbm2m100":
-        cfg.update(load_fbm2m100_config())
-    if engine == "fbnllb200d600m":
-        cfg.update(load_fbnllb200d600m_config())
-    if engine == "madlad400":
-        cfg.update(load_madlad400_config())
-    if engine == "mbart50":
-        cfg.update(load_mbart50_config())
-
-    serve(cfg, host=args.host, port=args.port)
+    cfg.update(load_engine_config(cfg.get("engine")))
+
+    serve(cfg, host=args.host, port=args.port, role=args.role)
 
 
 if __name__ == "__main__":
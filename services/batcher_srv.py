@@ -0,0 +1,298 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from services.executor_srv import provider_max_concurrency
+
+log = logging.getLogger("yttrans.batcher")
+
+
+def estimate_tokens(text):
+    """
+    Cheap subword estimate (~4 chars per token) for batch budgeting; no tokenizer call.
+    """
+    return len(text or "") // 4 + 2
+
+
+class _Request:
+    __slots__ = ("pairs", "src_lang", "future", "tokens", "enqueued_ts")
+
+    def __init__(self, pairs, src_lang):
+        self.pairs = pairs
+        self.src_lang = src_lang
+        self.future = Future()
+        self.tokens = sum(estimate_tokens(t) for t, _lang in pairs)
+        self.enqueued_ts = time.monotonic()
+
+
+class BatchingEngine:
+    """
+    Continuous cross-job micro-batching in front of a provider with translate_pairs().
+
+    Callers (executor threads of any job) submit (text, tgt_lang) rows and block on a future.
+    One engine thread collects requests for up to window_ms or until max_tokens is reached
+    and hands the batch to a pool of `workers` threads (the inner provider's concurrency,
+    e.g. its replicas), which run it as one translate_pairs call per source lang and route
+    rows back. At most `workers` batches are in flight: while all are busy, new requests
+    wait in the queue and form the next (larger) batch.
+    """
+
+    def __init__(self, inner, window_ms=20, max_tokens=4096, workers=1):
+        self.inner = inner
+        self.window_sec = max(0.0, int(window_ms or 0) / 1000.0)
+        self.max_tokens = max(1, int(max_tokens or 1))
+        self.workers = max(1, int(workers or 1))
+
+        self._q = queue.Queue()
+        self._carry = None
+        self._stop = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="yttrans-batch")
+        self._thread = threading.Thread(target=self._loop, name="yttrans-batcher", daemon=True)
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.tokens = 0
+        self.errors = 0
+        self.wait_ms_total = 0.0
+        self.in_flight = 0
+
+        self._thread.start()
+
+    def submit_nowait(self, pairs, src_lang):
+        """
+        Returns a Future resolving to list[str] for pairs (same order).
+        """
+        if self._stop.is_set():
+            raise RuntimeError("batching engine is stopped")
+        req = _Request(list(pairs), src_lang)
+        self._q.put(req)
+        return req.future
+
+    def submit(self, pairs, src_lang):
+        """
+        Blocking: returns list[str] for pairs (same order).
+        """
+        if not pairs:
+            return []
+        return self.submit_nowait(pairs, src_lang).result()
+
+    def _next(self, timeout):
+        if self._carry is not None:
+            req, self._carry = self._carry, None
+            return req
+        return self._q.get(timeout=timeout)
+
+    def _collect(self):
+        try:
+            first = self._next(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        tokens = first.tokens
+        deadline = time.monotonic() + self.window_sec
+        while tokens < self.max_tokens:
+            remaining = deadline - time.monotonic()
+            try:
+                req = self._q.get_nowait() if remaining <= 0 else self._q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if tokens + req.tokens > self.max_tokens:
+                # keep the budget; it opens the next batch
+                self._carry = req
+                break
+            batch.append(req)
+            tokens += req.tokens
+        return batch
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # a free worker first: requests arriving meanwhile join the next batch
+            if not self._slots.acquire(timeout=0.5):
+                continue
+            batch = self._collect()
+            if not batch:
+                self._slots.release()
+                continue
+            with self._stats_lock:
+                self.in_flight += 1
+            self._pool.submit(self._run_batch, batch)
+
+        # fail whatever is still waiting
+        pending = [self._carry] if self._carry is not None else []
+        while True:
+            try:
+                pending.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        for req in pending:
+            req.future.set_exception(RuntimeError("batching engine is stopped"))
+        self._pool.shutdown(wait=False)
+
+    def _run_batch(self, batch):
+        try:
+            started = time.monotonic()
+            by_src = {}
+            for req in batch:
+                by_src.setdefault(req.src_lang, []).append(req)
+            for src_lang, reqs in by_src.items():
+                self._run(src_lang, reqs)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.rows += sum(len(req.pairs) for req in batch)
+                self.tokens += sum(req.tokens for req in batch)
+                self.wait_ms_total += sum((started - req.enqueued_ts) * 1000.0 for req in batch)
+        except Exception as e:
+            log.exception("batch run failed")
+            for req in batch:
+                if not req.future.done():
+                    req.future.set_exception(e)
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _run(self, src_lang, reqs):
+        pairs = [p for req in reqs for p in req.pairs]
+        try:
+            out = self.inner.translate_pairs(pairs, src_lang=src_lang)
+            if len(out) != len(pairs):
+                raise ValueError(f"translate_pairs count mismatch: {len(out)} != {len(pairs)}")
+        except Exception as e:
+            if len(reqs) == 1:
+                with self._stats_lock:
+                    self.errors += 1
+                reqs[0].future.set_exception(e)
+                return
+            # one bad request (e.g. unsupported lang) must not fail the others
+            log.warning("batched translate_pairs failed (%s requests), retrying one by one: %s", len(reqs), e)
+            for req in reqs:
+                self._run(src_lang, [req])
+            return
+
+        pos = 0
+        for req in reqs:
+            n = len(req.pairs)
+            req.future.set_result(out[pos : pos + n])
+            pos += n
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "rows": self.rows,
+                "rows_per_batch": (self.rows / self.batches) if self.batches else 0.0,
+                "tokens_per_batch": (self.tokens / self.batches) if self.batches else 0.0,
+                "queue_wait_ms_avg": (self.wait_ms_total / self.requests) if self.requests else 0.0,
+                "queue_depth": self._q.qsize(),
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "errors": self.errors,
+            }
+
+    def stop(self):
+        self._stop.set()
+
+
+class BatchingProvider:
+    """
+    Provider facade over BatchingEngine: translate_batch/translate_batch_multi/translate
+    from any number of jobs end up in shared batches.
+    Other attributes (name, get_meta, list_languages, ...) are forwarded.
+    """
+
+    def __init__(self, inner, engine, max_concurrency):
+        self.inner = inner
+        self.engine = engine
+        # callers only wait on futures; the engine thread is the real inference limit
+        self.max_concurrency = max(1, int(max_concurrency or 1))
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+    def translate_pairs(self, pairs, src_lang):
+        return self.engine.submit(pairs, src_lang)
+
+    def translate_batch(self, texts, src_lang, tgt_lang):
+        if not texts:
+            return []
+        return self.engine.submit([(t, tgt_lang) for t in texts], src_lang)
+
+    def translate_batch_multi(self, texts, src_lang, tgt_langs):
+        """
+        One request per lang, submitted together so they land in the same batches;
+        langs that fail are left out of the result.
+        """
+        tgt_langs = list(tgt_langs or [])
+        if not texts:
+            return {lang: [] for lang in tgt_langs}
+        futs = {lang: self.engine.submit_nowait([(t, lang) for t in texts], src_lang) for lang in tgt_langs}
+        out = {}
+        for lang, fut in futs.items():
+            try:
+                out[lang] = fut.result()
+            except Exception as e:
+                log.warning("batched lang=%s failed: %s", lang, e)
+        return out
+
+    def translate(self, text, src_lang, tgt_lang):
+        if text is None:
+            return ""
+        if text.strip() == "":
+            return text
+        res = self.translate_batch([text], src_lang=src_lang, tgt_lang=tgt_lang)
+        return res[0] if res else ""
+
+
+# ---- process-wide engine ----
+
+_engine_lock = threading.Lock()
+_engine = None
+
+
+def wrap_with_batcher(provider, cfg):
+    """
+    Returns provider behind the shared BatchingEngine, or provider itself
+    if batching is disabled or the provider has no translate_pairs.
+    """
+    global _engine
+    if not int(cfg.get("batcher_enabled") or 0) or not hasattr(provider, "translate_pairs"):
+        return provider
+    with _engine_lock:
+        if _engine is None or _engine.inner is not provider:
+            _engine = BatchingEngine(
+                provider,
+                window_ms=int(cfg.get("batcher_window_ms") or 20),
+                max_tokens=int(cfg.get("batcher_max_tokens") or 4096),
+                # one batch per replica / pool process of the inner provider
+                workers=provider_max_concurrency(provider, cfg),
+            )
+            log.info(
+                "batching engine: provider=%s window_ms=%s max_tokens=%s workers=%s",
+                getattr(provider, "name", "?"),
+                cfg.get("batcher_window_ms"),
+                cfg.get("batcher_max_tokens"),
+                _engine.workers,
+            )
+    return BatchingProvider(provider, _engine, max_concurrency=int(cfg.get("batcher_max_pending") or 16))
+
+
+def batcher_stats():
+    if _engine is None:
+        return {}
+    return _engine.stats()
+
+
+def stop_batcher():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.stop()
+            _engine = None
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("yttrans.executor")
+
+
+def provider_max_concurrency(provider, cfg=None) -> int:
+    """
+    Providers may expose max_concurrency attribute (int).
+    Falls back to <engine>_max_concurrency from config, then 1.
+    """
+    try:
+        v = getattr(provider, "max_concurrency", None)
+        if v is None and cfg is not None:
+            engine = (cfg.get("engine") or "").lower()
+            v = cfg.get(f"{engine}_max_concurrency")
+        if v is None:
+            return 1
+        return max(1, int(v))
+    except Exception:
+        return 1
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for blocking provider calls (model generate, HTTP, ...).
+    Keeps the asyncio loop free: callers await run(fn, ...) instead of calling fn inline.
+
+    Size = provider max_concurrency, so the pool itself is the concurrency limit
+    for inference; extra submissions wait in the pool queue and are counted in stats().
+    """
+
+    def __init__(self, max_workers=1, name="infer"):
+        self.max_workers = max(1, int(max_workers or 1))
+        self.name = name
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"yttrans-{name}")
+
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._submitted = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
+        self._run_ms_total = 0.0
+
+    @classmethod
+    def for_provider(cls, provider, cfg):
+        n = provider_max_concurrency(provider, cfg)
+        log.info("inference executor: provider=%s max_workers=%s", getattr(provider, "name", "?"), n)
+        return cls(max_workers=n, name=getattr(provider, "name", "infer"))
+
+    def _call(self, submitted_ts, fn, args, kwargs):
+        started_ts = time.monotonic()
+        wait_ms = (started_ts - submitted_ts) * 1000.0
+        with self._stats_lock:
+            self._queued -= 1
+            self._running += 1
+            self._started += 1
+            self._wait_ms_total += wait_ms
+            if wait_ms > self._wait_ms_max:
+                self._wait_ms_max = wait_ms
+
+        ok = False
+        try:
+            res = fn(*args, **kwargs)
+            ok = True
+            return res
+        finally:
+            run_ms = (time.monotonic() - started_ts) * 1000.0
+            with self._stats_lock:
+                self._running -= 1
+                self._run_ms_total += run_ms
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Awaitable submission of a blocking call.
+        """
+        with self._stats_lock:
+            self._queued += 1
+            self._submitted += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._call, time.monotonic(), fn, args, kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_ms_avg": (self._wait_ms_total / self._started) if self._started else 0.0,
+                "wait_ms_max": self._wait_ms_max,
+                "run_ms_avg": (self._run_ms_total / finished) if finished else 0.0,
+            }
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -9,10 +9,13 @@ from grpc_reflection.v1alpha import reflection
 import contextlib
 
 from jobs.worker_job import run_workers
+from services.batcher_srv import stop_batcher, wrap_with_batcher
+from services.procpool_srv import stop_procpool, wrap_with_procpool
+from services.executor_srv import InferenceExecutor
 from services.health_srv import HealthService
 from services.info_srv import InfoService
 from services.translator_srv import TranslatorService
-from services.providers.base_prv import build_provider
+from services.providers.base_prv import get_provider, unload_providers
 from utils.redis_ut import redis_client
 from utils.time_ut import now_iso_utc
 
@@ -24,66 +27,92 @@ from proto import yttrans_pb2, yttrans_pb2_grpc
 log = logging.getLogger("yttrans.grpc")
 
 
-def serve(cfg, host="0.0.0.0", port=9095):
+def serve(cfg, host="0.0.0.0", port=9095, role="all"):
+    """
+    role:
+      api    - gRPC Translator/Info/Health only; never loads a model
+      worker - queue workers only; never binds a port
+      all    - both in one process (default)
+    """
     from utils.log_ut import setup_logging
 
     setup_logging(cfg.get("log_level", "info"))
 
+    role = (role or "all").strip().lower()
+    if role not in ("api", "worker", "all"):
+        raise ValueError(f"unknown role: {role} (expected api|worker|all)")
+    run_api = role in ("api", "all")
+    run_worker = role in ("worker", "all")
+
     r = redis_client(cfg["redis_url"])
-    provider = build_provider(cfg)
-    inmem_requests = {}
+    # Providers load models lazily, so building one here is cheap for the api role.
+    provider = get_provider(cfg)
+    # sized from the batching facade when enabled: its callers only wait on shared batches.
+    # The process pool (if enabled) loads the model and forks here, before any server threads start.
+    executor = (
+        InferenceExecutor.for_provider(wrap_with_batcher(wrap_with_procpool(provider, cfg), cfg), cfg) if run_worker else None
+    )
 
     started_at = time.time()
     started_at_iso = now_iso_utc()
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = None
+    bind = f"{host}:{port}"
+    if run_api:
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
 
-    yttrans_pb2_grpc.add_TranslatorServicer_to_server(
-        TranslatorService(cfg, r, inmem_requests, provider), server
-    )
-    info_pb2_grpc.add_InfoServicer_to_server(
-        InfoService(cfg, started_at_epoch=started_at, started_at_iso=started_at_iso), server
-    )
-    health_pb2_grpc.add_HealthServicer_to_server(HealthService(), server)
+        yttrans_pb2_grpc.add_TranslatorServicer_to_server(TranslatorService(cfg, r, provider), server)
+        info_pb2_grpc.add_InfoServicer_to_server(
+            InfoService(cfg, started_at_epoch=started_at, started_at_iso=started_at_iso, executor=executor), server
+        )
+        health_pb2_grpc.add_HealthServicer_to_server(HealthService(), server)
 
-    service_names = (
-        yttrans_pb2.DESCRIPTOR.services_by_name["Translator"].full_name,
-        info_pb2.DESCRIPTOR.services_by_name["Info"].full_name,
-        "grpc.health.v1.Health",
-        reflection.SERVICE_NAME,
-    )
-    reflection.enable_server_reflection(service_names, server)
+        service_names = (
+            yttrans_pb2.DESCRIPTOR.services_by_name["Translator"].full_name,
+            info_pb2.DESCRIPTOR.services_by_name["Info"].full_name,
+            "grpc.health.v1.Health",
+            reflection.SERVICE_NAME,
+        )
+        reflection.enable_server_reflection(service_names, server)
 
-    bind = f"{host}:{port}"
-    server.add_insecure_port(bind)
+        server.add_insecure_port(bind)
 
     async def _run():
         stop_event = asyncio.Event()
-        worker_task = asyncio.create_task(run_workers(cfg, r, inmem_requests, stop_event))
+        worker_task = None
+        if run_worker:
+            worker_task = asyncio.create_task(run_workers(cfg, r, stop_event, executor=executor))
 
-        log.info("starting gRPC server on %s", bind)
-        server.start()
+        log.info("role=%s", role)
+        if server is not None:
+            log.info("starting gRPC server on %s", bind)
+            server.start()
 
         try:
             await asyncio.Event().wait()
         except asyncio.CancelledError:
             pass
         finally:
-            log.info("stopping workers")
-            stop_event.set()
-            try:
-                await asyncio.wait_for(worker_task, timeout=2.0)
-            except asyncio.TimeoutError:
-                worker_task.cancel()
-                with contextlib.suppress(asyncio.CancelledError):
-                    await worker_task
-
-            log.info("stopping gRPC server")
-            server.stop(grace=1)
+            if worker_task is not None:
+                log.info("stopping workers")
+                stop_event.set()
+                try:
+                    await asyncio.wait_for(worker_task, timeout=2.0)
+                except asyncio.TimeoutError:
+                    worker_task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await worker_task
+
+            if server is not None:
+                log.info("stopping gRPC server")
+                server.stop(grace=1)
+            if executor is not None:
+                executor.shutdown(wait=False)
+            stop_batcher()
+            stop_procpool()
+            unload_providers()
 
     try:
         asyncio.run(_run())
     except KeyboardInterrupt:
         log.info("shutdown requested (Ctrl+C)")
-
-
@@ -1,16 +1,20 @@
 import time
 
 from utils.auth_ut import require_auth_if_configured
-from services.providers.base_prv import build_provider
+from services.providers.base_prv import provider_languages, provider_stats
+from services.batcher_srv import batcher_stats
+from services.procpool_srv import procpool_stats
+from services.segcache_srv import segment_cache_stats
 
 from proto import info_pb2, info_pb2_grpc
 
 
 class InfoService(info_pb2_grpc.InfoServicer):
-    def __init__(self, cfg, started_at_epoch, started_at_iso):
+    def __init__(self, cfg, started_at_epoch, started_at_iso, executor=None):
         self.cfg = cfg
         self.started_at_epoch = started_at_epoch
         self.started_at_iso = started_at_iso
+        self.executor = executor
 
     def All(self, request, context):
         require_auth_if_configured(context, self.cfg)
@@ -28,6 +32,24 @@ class InfoService(info_pb2_grpc.InfoServicer):
         )
 
         resp.metrics["uptime_sec"] = float(uptime)
+
+        try:
+            for k, v in provider_stats().items():
+                resp.metrics[k] = float(v)
+        except Exception:
+            pass
+
+        for k, v in segment_cache_stats().items():
+            resp.metrics[f"segcache_{k}"] = float(v)
+        for k, v in batcher_stats().items():
+            resp.metrics[f"batcher_{k}"] = float(v)
+        for k, v in procpool_stats().items():
+            resp.metrics[f"procpool_{k}"] = float(v)
+
+        if self.executor is not None:
+            for k, v in self.executor.stats().items():
+                resp.metrics[f"infer_{k}"] = float(v)
+
         return resp
 
     def Languages(self, request, context):
@@ -36,8 +58,7 @@ class InfoService(info_pb2_grpc.InfoServicer):
         langs = self.cfg.get("langs") or []
         if not langs:
             try:
-                provider = build_provider(self.cfg)
-                langs = provider.list_languages() or []
+                langs = provider_languages(self.cfg)
             except Exception:
                 langs = []
 
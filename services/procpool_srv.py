@@ -0,0 +1,367 @@
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+log = logging.getLogger("yttrans.procpool")
+
+
+def cpu_sets(n):
+    """
+    Host CPUs (current affinity) split into n contiguous subsets; [] per process
+    (no pinning) when there are fewer CPUs than processes or affinity is unsupported.
+    """
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return [[] for _ in range(n)]
+    if len(cpus) < n:
+        return [[] for _ in range(n)]
+    size, extra = divmod(len(cpus), n)
+    out = []
+    pos = 0
+    for i in range(n):
+        k = size + (1 if i < extra else 0)
+        out.append(cpus[pos : pos + k])
+        pos += k
+    return out
+
+
+def _cpus_str(cpus):
+    if not cpus:
+        return "any"
+    return f"{cpus[0]}-{cpus[-1]}" if cpus[-1] - cpus[0] + 1 == len(cpus) else ",".join(str(c) for c in cpus)
+
+
+def _child_main(index, provider, cpus, threads, req_q, res_q):
+    """
+    Worker process body: serves (req_id, method, kwargs) from req_q with the provider
+    (and model weights) inherited from the parent.
+    """
+    # Ctrl+C goes to the whole process group; the parent stops us with a sentinel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            log.warning("procpool[%s] cpu pinning failed: %s", index, e)
+    n_threads = threads or len(cpus)
+    if n_threads > 0:
+        try:
+            import torch
+
+            torch.set_num_threads(n_threads)
+        except ImportError:
+            pass
+
+    while True:
+        item = req_q.get()
+        if item is None:
+            break
+        req_id, method, kwargs = item
+        try:
+            res_q.put((req_id, True, getattr(provider, method)(**kwargs)))
+        except Exception as e:
+            res_q.put((req_id, False, f"{type(e).__name__}: {e}"))
+
+
+class ProcessPool:
+    """
+    Fixed set of forked inference processes over one provider.
+
+    The model is loaded in the parent before forking, so all processes share its weights
+    copy-on-write; each process runs tokenization, generate and decoding with its own GIL
+    on its own CPU subset. Calls go to the least loaded live process over a per-process
+    queue (texts in, texts out: token ids never cross the process boundary).
+    """
+
+    # dead processes are looked for at least this often, even while results keep arriving
+    REAP_INTERVAL_SEC = 0.5
+
+    def __init__(self, inner, processes=2, threads=0, pin=True, timeout_sec=600):
+        self.inner = inner
+        self.processes = max(1, int(processes or 1))
+        self.threads = max(0, int(threads or 0))
+        # upper bound for one call as seen by callers (0 = wait forever)
+        self.timeout_sec = max(0, int(timeout_sec or 0))
+
+        ctx = multiprocessing.get_context("fork")
+        self._res_q = ctx.Queue()
+        self._req_qs = []
+        self._procs = []
+        self._alive = []
+        self._inflight = []  # per process: set of req ids
+
+        self._lock = threading.Lock()
+        self._futures = {}  # req id -> (process index, Future, submitted ts)
+        self._next_id = 0
+        self._stop = threading.Event()
+
+        self.requests = 0
+        self.errors = 0
+        self.run_ms_total = 0.0
+
+        sets = cpu_sets(self.processes) if pin else [[] for _ in range(self.processes)]
+        for i in range(self.processes):
+            req_q = ctx.Queue()
+            p = ctx.Process(
+                target=_child_main,
+                args=(i, inner, sets[i], self.threads, req_q, self._res_q),
+                name=f"yttrans-infer-{i}",
+                daemon=True,
+            )
+            p.start()
+            self._req_qs.append(req_q)
+            self._procs.append(p)
+            self._alive.append(True)
+            self._inflight.append(set())
+            log.info("procpool[%s] pid=%s cpus=%s", i, p.pid, _cpus_str(sets[i]))
+
+        self._thread = threading.Thread(target=self._collect, name="yttrans-procpool", daemon=True)
+        self._thread.start()
+
+    def alive(self):
+        with self._lock:
+            return sum(1 for a in self._alive if a)
+
+    def submit(self, method, **kwargs):
+        """
+        Future resolving to provider.<method>(**kwargs) run in a pool process.
+        """
+        fut = Future()
+        with self._lock:
+            if self._stop.is_set():
+                raise RuntimeError("process pool is stopped")
+            live = [i for i, a in enumerate(self._alive) if a and self._procs[i].is_alive()]
+            if not live:
+                raise RuntimeError("process pool has no live processes")
+            idx = min(live, key=lambda i: len(self._inflight[i]))
+            req_id = self._next_id
+            self._next_id += 1
+            self._futures[req_id] = (idx, fut, time.monotonic())
+            self._inflight[idx].add(req_id)
+            self.requests += 1
+        self._req_qs[idx].put((req_id, method, kwargs))
+        return fut
+
+    def _collect(self):
+        next_reap = time.monotonic() + self.REAP_INTERVAL_SEC
+        while not self._stop.is_set():
+            # on a timer, not only on an idle queue: live processes may keep it busy
+            if time.monotonic() >= next_reap:
+                self._reap()
+                next_reap = time.monotonic() + self.REAP_INTERVAL_SEC
+            try:
+                req_id, ok, value = self._res_q.get(timeout=self.REAP_INTERVAL_SEC)
+            except queue.Empty:
+                continue
+            with self._lock:
+                idx, fut, submitted_ts = self._futures.pop(req_id, (None, None, 0.0))
+                if idx is not None:
+                    self._inflight[idx].discard(req_id)
+                if fut is not None:
+                    self.run_ms_total += (time.monotonic() - submitted_ts) * 1000.0
+                    if not ok:
+                        self.errors += 1
+            if fut is None:
+                continue
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(RuntimeError(value))
+
+    def _reap(self):
+        """
+        A dead process fails its in-flight calls and takes no new ones.
+        """
+        failed = []
+        with self._lock:
+            for i, p in enumerate(self._procs):
+                if not self._alive[i] or p.is_alive():
+                    continue
+                self._alive[i] = False
+                log.error("procpool[%s] pid=%s exited code=%s", i, p.pid, p.exitcode)
+                for req_id in self._inflight[i]:
+                    _idx, fut, _ts = self._futures.pop(req_id)
+                    failed.append((fut, f"inference process {i} exited (code {p.exitcode})"))
+                    self.errors += 1
+                self._inflight[i].clear()
+        for fut, msg in failed:
+            fut.set_exception(RuntimeError(msg))
+
+    def stats(self):
+        with self._lock:
+            done = self.requests - sum(len(x) for x in self._inflight)
+            return {
+                "processes": self.processes,
+                "alive": sum(1 for a in self._alive if a),
+                "busy": sum(1 for x in self._inflight if x),
+                "requests": self.requests,
+                "errors": self.errors,
+                "run_ms_avg": (self.run_ms_total / done) if done else 0.0,
+            }
+
+    def wait(self, futs):
+        """
+        Results of futs in order. Raises TimeoutError when they are not all done within
+        timeout_sec, so a stuck call fails like any provider error instead of hanging the job.
+        """
+        deadline = time.monotonic() + self.timeout_sec if self.timeout_sec else None
+        out = []
+        for fut in futs:
+            left = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            try:
+                out.append(fut.result(timeout=left))
+            except FutureTimeout:
+                raise TimeoutError(f"inference process call timed out after {self.timeout_sec}s") from None
+        return out
+
+    def stop(self):
+        self._stop.set()
+        for q in self._req_qs:
+            try:
+                q.put(None)
+            except Exception:
+                pass
+        for p in self._procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        with self._lock:
+            pending = list(self._futures.values())
+            self._futures.clear()
+        for _idx, fut, _ts in pending:
+            fut.set_exception(RuntimeError("process pool is stopped"))
+
+
+class ProcessPoolProvider:
+    """
+    Provider facade over ProcessPool: translate_batch/translate_pairs/translate
+    run in the pool processes. Inputs of at least 2 x min_rows rows are split across
+    processes and merged back in order, so one long VTT (or one batcher batch) uses them all.
+    Other attributes (name, get_meta, list_languages, ...) are forwarded.
+    """
+
+    def __init__(self, inner, pool, min_rows=16):
+        self.inner = inner
+        self.pool = pool
+        self.min_rows = max(1, int(min_rows or 1))
+        # one running + one queued call per process, so a process never idles between calls
+        self.max_concurrency = 2 * pool.processes
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+    def _spans(self, n):
+        k = max(1, min(self.pool.alive(), n // self.min_rows))
+        size = math.ceil(n / k)
+        return [(i, min(i + size, n)) for i in range(0, n, size)]
+
+    def translate_pairs(self, pairs, src_lang):
+        if not pairs:
+            return []
+        futs = [self.pool.submit("translate_pairs", pairs=pairs[a:b], src_lang=src_lang) for a, b in self._spans(len(pairs))]
+        return [t for part in self.pool.wait(futs) for t in part]
+
+    def translate_batch(self, texts, src_lang, tgt_lang):
+        if not texts:
+            return []
+        futs = [
+            self.pool.submit("translate_batch", texts=texts[a:b], src_lang=src_lang, tgt_lang=tgt_lang)
+            for a, b in self._spans(len(texts))
+        ]
+        return [t for part in self.pool.wait(futs) for t in part]
+
+    def translate(self, text, src_lang, tgt_lang):
+        if text is None:
+            return ""
+        if text.strip() == "":
+            return text
+        res = self.translate_batch([text], src_lang=src_lang, tgt_lang=tgt_lang)
+        return res[0] if res else ""
+
+
+class MultiProcessPoolProvider(ProcessPoolProvider):
+    """
+    ProcessPoolProvider for providers with translate_batch_multi (encoder reuse across targets).
+    """
+
+    def translate_batch_multi(self, texts, src_lang, tgt_langs):
+        """
+        Langs missing from any part (unsupported by the provider) are left out.
+        """
+        tgt_langs = list(tgt_langs or [])
+        if not texts:
+            return {lang: [] for lang in tgt_langs}
+        futs = [
+            self.pool.submit("translate_batch_multi", texts=texts[a:b], src_lang=src_lang, tgt_langs=tgt_langs)
+            for a, b in self._spans(len(texts))
+        ]
+        parts = self.pool.wait(futs)
+        return {lang: [t for part in parts for t in part[lang]] for lang in tgt_langs if all(lang in part for part in parts)}
+
+
+# ---- process-wide pool ----
+
+_pool_lock = threading.Lock()
+_facade = None
+
+
+def wrap_with_procpool(provider, cfg):
+    """
+    Returns provider behind the shared ProcessPool (forked on first call, model loaded first),
+    or provider itself if the pool is disabled or the provider cannot use it.
+    """
+    global _facade
+    n = int(cfg.get("procpool_workers") or 0)
+    if n <= 0 or not hasattr(provider, "load"):
+        return provider
+    with _pool_lock:
+        if _facade is not None and _facade.inner is provider:
+            return _facade
+
+        backend = ((provider.get_meta() or {}).get("backend") or "torch") if hasattr(provider, "get_meta") else "torch"
+        if backend != "torch":
+            # ct2/onnx already run parallel native threads and their thread pools do not survive fork
+            log.warning("process pool disabled: provider=%s backend=%s", getattr(provider, "name", "?"), backend)
+            return provider
+
+        started = time.monotonic()
+        provider.load()
+        log.info(
+            "process pool: provider=%s model loaded in %sms, forking %s processes",
+            getattr(provider, "name", "?"),
+            int((time.monotonic() - started) * 1000),
+            n,
+        )
+        pool = ProcessPool(
+            provider,
+            processes=n,
+            threads=int(cfg.get("procpool_threads") or 0),
+            pin=bool(int(cfg.get("procpool_pin") or 0)),
+            timeout_sec=int(cfg.get("procpool_timeout_sec") or 0),
+        )
+        cls = MultiProcessPoolProvider if hasattr(provider, "translate_batch_multi") else ProcessPoolProvider
+        _facade = cls(provider, pool, min_rows=int(cfg.get("procpool_min_rows") or 16))
+    return _facade
+
+
+def procpool_stats():
+    if _facade is None:
+        return {}
+    return _facade.pool.stats()
+
+
+def stop_procpool():
+    global _facade
+    with _pool_lock:
+        if _facade is not None:
+            _facade.pool.stop()
+            _facade = None
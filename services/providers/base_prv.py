@@ -1,3 +1,8 @@
+import inspect
+import logging
+import threading
+import time
+
 from services.providers.dummy_prv import DummyProvider
 from services.providers.google_prv import GoogleProvider
 from services.providers.deepl_prv import DeepLProvider
@@ -8,6 +13,40 @@ from services.providers.fbm2m100_prv import Fbm2m100Provider
 from services.providers.fbnllb200d600m_prv import Fbnllb200d600mProvider
 from services.providers.madlad400_prv import Madlad400Provider
 from services.providers.mbart50_prv import Mbart50Provider
+from utils.mem_ut import process_rss_bytes
+
+
+log = logging.getLogger("yttrans.providers")
+
+
+def has_async_batch(provider) -> bool:
+    """
+    Optional async provider contract:
+      async translate_batch_async(texts, src_lang, tgt_lang) -> list[str]  (same length as texts)
+
+    Providers implementing it do their own I/O on the running loop and are awaited
+    directly by the worker instead of being pushed to the inference executor.
+    """
+    fn = getattr(provider, "translate_batch_async", None)
+    return fn is not None and inspect.iscoroutinefunction(fn)
+
+
+def provider_model_tag(provider) -> str:
+    """
+    Identifies provider output for cache keys: model id + precision/backend + decode settings
+    if reported by get_meta().
+    """
+    meta = {}
+    try:
+        if hasattr(provider, "get_meta"):
+            meta = provider.get_meta() or {}
+    except Exception:
+        meta = {}
+    parts = [str(meta.get(k) or "") for k in ("model", "precision", "backend")]
+    decode = meta.get("decode") or {}
+    if decode:
+        parts.append(",".join(f"{k}={decode[k]}" for k in sorted(decode)))
+    return "|".join(parts)
 
 
 def build_provider(cfg):
@@ -41,4 +80,126 @@ def build_provider(cfg):
     if engine == "dummy":
         return DummyProvider(cfg)
 
-    raise RuntimeError(f"Unknown translation engine: {engine}")
\ No newline at end of file
+    raise RuntimeError(f"Unknown translation engine: {engine}")
+
+
+# ---- process-wide provider registry ----
+#
+# One provider instance (and therefore one loaded model) per engine per process,
+# shared by gRPC Translator/Info services and the worker.
+#
+# Optional provider lifecycle hooks:
+#   load()          load model weights only (process pool: before forking workers)
+#   warmup()        load model (and maybe run a test translation)
+#   unload()        drop model weights, keep cheap state (tokenizer/langs)
+#   memory_bytes()  bytes held by loaded model weights
+
+_registry_lock = threading.Lock()
+_registry = {}
+
+
+def _engine_of(cfg):
+    return (cfg.get("engine") or "dummy").lower()
+
+
+def get_provider(cfg):
+    """
+    Shared provider instance for cfg["engine"]; built on first use.
+    """
+    engine = _engine_of(cfg)
+    ent = _registry.get(engine)
+    if ent is not None:
+        return ent["provider"]
+
+    with _registry_lock:
+        ent = _registry.get(engine)
+        if ent is None:
+            ent = {
+                "provider": build_provider(cfg),
+                "langs": None,
+                "load_ms": 0,
+                "warm": False,
+            }
+            _registry[engine] = ent
+        return ent["provider"]
+
+
+def warmup_provider(cfg):
+    """
+    Load model at startup if <engine>_warmup=1. Safe to call more than once.
+    """
+    engine = _engine_of(cfg)
+    provider = get_provider(cfg)
+    ent = _registry[engine]
+
+    if ent["warm"] or int(cfg.get(f"{engine}_warmup", 0) or 0) != 1:
+        return
+    if not hasattr(provider, "warmup"):
+        return
+
+    log.info("%s warmup: loading model...", engine)
+    started = time.monotonic()
+    try:
+        provider.warmup()
+        ent["warm"] = True
+    except Exception as e:
+        log.warning("warmup failed: %s", str(e))
+    finally:
+        ent["load_ms"] = int((time.monotonic() - started) * 1000)
+    log.info("%s warmup: done in %sms", engine, ent["load_ms"])
+
+
+def provider_languages(cfg):
+    """
+    Cached list_languages() of the shared provider (O(1) after first non-empty answer).
+    """
+    engine = _engine_of(cfg)
+    provider = get_provider(cfg)
+    ent = _registry[engine]
+    if ent["langs"] is not None:
+        return ent["langs"]
+
+    langs = provider.list_languages() or []
+    if langs:
+        ent["langs"] = list(langs)
+    return langs
+
+
+def unload_providers():
+    with _registry_lock:
+        items = list(_registry.items())
+        _registry.clear()
+
+    for engine, ent in items:
+        p = ent["provider"]
+        if hasattr(p, "unload"):
+            try:
+                p.unload()
+                log.info("%s unloaded", engine)
+            except Exception:
+                log.exception("%s unload failed", engine)
+
+
+def provider_stats():
+    """
+    Flat numeric metrics for Info.All.
+    """
+    out = {
+        "providers_count": float(len(_registry)),
+        "process_rss_bytes": float(process_rss_bytes()),
+    }
+    model_bytes = 0
+    for engine, ent in list(_registry.items()):
+        p = ent["provider"]
+        mb = 0
+        if hasattr(p, "memory_bytes"):
+            try:
+                mb = int(p.memory_bytes() or 0)
+            except Exception:
+                mb = 0
+        model_bytes += mb
+        out[f"provider_{engine}_model_bytes"] = float(mb)
+        out[f"provider_{engine}_load_ms"] = float(ent["load_ms"])
+        out[f"provider_{engine}_loaded"] = 1.0 if mb > 0 else 0.0
+    out["provider_model_bytes"] = float(model_bytes)
+    return out
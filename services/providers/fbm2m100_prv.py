@@ -1,32 +1,82 @@
-﻿import threading
+﻿import gc
+import threading
 from typing import Optional
 
+from utils.hf_ut import (
+    DecodeLimits,
+    PretokenCache,
+    apply_precision,
+    batch_tensors,
+    decode_meta,
+    generate_mixed_targets,
+    generate_multi_target,
+    normalize_backend,
+    normalize_precision,
+    plan_length_batches,
+    run_pipelined,
+)
+from utils.mem_ut import model_param_bytes
+from utils.ct2_ut import ct2_translate_rows, load_ct2_translator
+from utils.onnx_ut import load_ort_seq2seq
+from utils.replica_ut import ReplicaPool, replica_threads
+
 
 class Fbm2m100Provider:
     name = "fbm2m100"
 
     def __init__(self, cfg):
         self.cfg = cfg
+        self.max_concurrency = int(cfg.get("fbm2m100_max_concurrency") or 1)
+        # replicas share the model weights; default: one per concurrent caller
+        self._replicas = int(cfg.get("fbm2m100_replicas") or 0) or self.max_concurrency
+        self.max_concurrency = max(self.max_concurrency, self._replicas)
+        self._pool = None
         self._lock = threading.Lock()
 
         self._tokenizer = None
         self._model = None
         self._load_err: Optional[Exception] = None
+        self._precision = None  # active mode once loaded
+        self._backend = normalize_backend(cfg.get("fbm2m100_backend"))
 
         self._langs_cache = None
         self._langs_lock = threading.Lock()
 
+        self._pretok_cache = PretokenCache()
+        self._limits = DecodeLimits.from_cfg(cfg, "fbm2m100")
+
     def get_meta(self):
         # Do not force model load here; just report configured values.
         return {
             "engine": self.name,
             "model": (self.cfg.get("fbm2m100_model") or "").strip(),
             "device": (self.cfg.get("fbm2m100_device") or "").strip(),
+            "precision": self._precision or (self.cfg.get("fbm2m100_precision") or "fp32").strip().lower(),
+            "backend": self._backend,
+            "replicas": self._replicas,
+            "decode": decode_meta(self.cfg, "fbm2m100"),
         }
 
+    def load(self):
+        """
+        Model weights only, no test translation (process pool loads before forking).
+        """
+        self._ensure_loaded()
+
     def warmup(self):
         self._ensure_loaded()
 
+    def unload(self):
+        with self._lock:
+            self._model = None
+            self._load_err = None
+            self._precision = None
+            self._pool = None
+        gc.collect()
+
+    def memory_bytes(self):
+        return model_param_bytes(self._model)
+
     def list_languages(self):
         whitelist = self.cfg.get("langs") or []
         if whitelist:
@@ -59,13 +109,13 @@ class Fbm2m100Provider:
                 return []
 
     def _ensure_loaded(self):
-        if self._model is not None and self._tokenizer is not None:
+        if self._pool is not None:
             return
         if self._load_err is not None:
             raise RuntimeError(f"fbm2m100 load failed: {self._load_err}")
 
         with self._lock:
-            if self._model is not None and self._tokenizer is not None:
+            if self._pool is not None:
                 return
             if self._load_err is not None:
                 raise RuntimeError(f"fbm2m100 load failed: {self._load_err}")
@@ -85,10 +135,41 @@ class Fbm2m100Provider:
                 if device != "cpu":
                     device = "cpu"
 
+                # per-replica intra-op threads: explicit, else torch_threads (or the CPUs) split evenly
+                rep_threads = replica_threads(
+                    self._replicas,
+                    int(self.cfg.get("fbm2m100_replica_threads") or 0) or torch_threads // self._replicas,
+                )
+
                 self._tokenizer = AutoTokenizer.from_pretrained(model_id)
-                self._model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
-                self._model.to(device)
-                self._model.eval()
+                if self._backend == "onnx":
+                    # exported graphs run as is: precision modes apply to the torch backend only
+                    self._model = load_ort_seq2seq(
+                        model_id,
+                        cache_root=(self.cfg.get("fbm2m100_onnx_dir") or "").strip(),
+                        threads=torch_threads,
+                    )
+                    self._precision = "fp32"
+                elif self._backend == "ct2":
+                    self._model = load_ct2_translator(
+                        model_id,
+                        cache_root=(self.cfg.get("fbm2m100_ct2_dir") or "").strip(),
+                        precision=self.cfg.get("fbm2m100_precision") or "fp32",
+                        device=device,
+                        threads=rep_threads,
+                        replicas=self._replicas,
+                    )
+                    self._precision = normalize_precision(self.cfg.get("fbm2m100_precision"))
+                else:
+                    self._model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
+                    self._model.to(device)
+                    self._model.eval()
+                    self._model, self._precision = apply_precision(
+                        self._model, self.cfg.get("fbm2m100_precision") or "fp32", device
+                    )
+
+                # set last: a ready pool means the provider is loaded
+                self._pool = ReplicaPool(self._tokenizer, self._replicas, rep_threads)
 
             except Exception as e:
                 self._load_err = e
@@ -100,96 +181,140 @@ class Fbm2m100Provider:
         except Exception as e:
             raise RuntimeError(f"fbm2m100 unsupported target language: {tgt_lang}: {e}")
 
-    def _set_src_lang(self, src_lang: str):
+    def _set_src_lang(self, tok, src_lang: str):
         if src_lang and src_lang != "auto":
             try:
-                self._tokenizer.src_lang = src_lang
+                tok.src_lang = src_lang
             except Exception:
                 pass
 
-    def _translate_texts_batched(self, texts, src_lang, tgt_lang):
+    def _pretokenize(self, tok, texts, src_lang, max_input_tokens):
         """
-        Core batched translation. texts: list[str]
-        Returns list[str] (same length).
+        Source ids/chunks for texts, shared by all target langs of a job (PretokenCache).
+        Long lines are split on token boundaries, so no tail is lost to truncation.
+        tok: tokenizer of the checked-out replica (src_lang is set on it).
         """
-        if not texts:
-            return []
-
-        self._ensure_loaded()
-
         src_lang = (src_lang or "auto").strip() or "auto"
+        self._set_src_lang(tok, src_lang)
+        return self._pretok_cache.get(tok, texts, src_lang, max_input_tokens)
+
+    def _ct2_rows(self, rows, row_bos):
+        """
+        ct2 backend: rows of source ids, each decoded after its target lang token.
+        """
+        max_input_tokens = int(self.cfg.get("fbm2m100_max_input_tokens") or 1024)
+        batch_size = int(self.cfg.get("fbm2m100_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbm2m100_batch_max_tokens") or 0)
+        return ct2_translate_rows(
+            self._model,
+            self._tokenizer,
+            rows,
+            [[b] for b in row_bos],
+            max_batch_tokens=batch_max_tokens or batch_size * max_input_tokens,
+            beam_size=int(self.cfg.get("fbm2m100_num_beams") or 1),
+            limits=self._limits,
+        )
+
+    def _translate_rows(self, tok, pre, tgt_lang):
+        """
+        Core batched translation of pretokenized rows.
+        Returns list[str] per row (same length as pre.row_ids).
+        """
         tgt_lang = (tgt_lang or "").strip()
         if not tgt_lang:
             raise RuntimeError("tgt_lang is required")
 
         forced_id = self._get_forced_bos_id(tgt_lang)
-        self._set_src_lang(src_lang)
+        if self._backend == "ct2":
+            return self._ct2_rows(pre.row_ids, [forced_id] * len(pre.row_ids))
 
         import torch
 
         # config
-        max_input_tokens = int(self.cfg.get("fbm2m100_max_input_tokens") or 1024)
-        max_new_tokens = int(self.cfg.get("fbm2m100_max_new_tokens") or 256)
         num_beams = int(self.cfg.get("fbm2m100_num_beams") or 1)
         batch_size = int(self.cfg.get("fbm2m100_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbm2m100_batch_max_tokens") or 0)
+        pad_id = self._tokenizer.pad_token_id
 
-        out_texts = []
-        i = 0
-        n = len(texts)
-
-        while i < n:
-            batch = texts[i : i + batch_size]
-            i += batch_size
-
-            # truncation protects against >1024 indexing errors
-            inputs = self._tokenizer(
-                batch,
-                return_tensors="pt",
-                padding=True,
-                truncation=True,
-                max_length=max_input_tokens,
-            )
-            inputs = {k: v.to("cpu") for k, v in inputs.items()}
+        # similar-length rows share a batch; outputs go back by index.
+        # Next batch tensors and previous batch decoding overlap with generate.
+        out_texts = [""] * len(pre.row_ids)
 
+        def _generate(idx, inputs):
             with torch.no_grad():
-                out = self._model.generate(
+                return self._model.generate(
                     **inputs,
                     forced_bos_token_id=forced_id,
-                    max_new_tokens=max_new_tokens,
                     num_beams=num_beams,
                     early_stopping=False,
+                    **self._limits.gen_kwargs([pre.lengths[j] for j in idx], num_beams),
                 )
 
-            decoded = self._tokenizer.batch_decode(out, skip_special_tokens=True)
-            out_texts.extend(decoded)
+        def _finish(idx, out):
+            decoded = self._limits.decode(tok, out)
+            for j, txt in zip(idx, decoded):
+                out_texts[j] = txt
+
+        run_pipelined(
+            plan_length_batches(pre.lengths, batch_size, batch_max_tokens),
+            lambda idx: batch_tensors([pre.row_ids[j] for j in idx], pad_id, "cpu"),
+            _generate,
+            _finish,
+            depth=int(self.cfg.get("fbm2m100_pipeline_depth") or 0),
+        )
 
         return out_texts
 
-    def _split_long_text_by_tokens(self, text: str, max_input_tokens: int):
+    def _translate_rows_multi(self, tok, pre, tgt_langs):
         """
-        Token-aware split to avoid truncation losing tail.
-        Strategy:
-          - encode without special tokens
-          - slice token ids into chunks
-          - decode chunks back to text
+        Multi-target variant of _translate_rows: one encoder pass per batch.
+        Returns dict tgt_lang -> list[str]; unsupported target langs are left out.
         """
-        if not text:
-            return [""]
+        forced_ids = {}
+        for lang in tgt_langs:
+            try:
+                forced_ids[lang] = self._get_forced_bos_id(lang.strip())
+            except Exception:
+                continue
 
-        # Note: use tokenizer directly; keep it simple
-        ids = self._tokenizer.encode(text, add_special_tokens=False)
-        if len(ids) <= max_input_tokens:
-            return [text]
+        if self._backend == "ct2":
+            # no encoder reuse across targets in ct2: one mixed batch of all langs
+            langs = list(forced_ids)
+            n_rows = len(pre.row_ids)
+            flat = self._ct2_rows(pre.row_ids * len(langs), [forced_ids[lang] for lang in langs for _ in range(n_rows)])
+            return {lang: flat[k * n_rows : (k + 1) * n_rows] for k, lang in enumerate(langs)}
+
+        num_beams = int(self.cfg.get("fbm2m100_num_beams") or 1)
+        batch_size = int(self.cfg.get("fbm2m100_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbm2m100_batch_max_tokens") or 0)
+        pad_id = self._tokenizer.pad_token_id
+
+        out_texts = {lang: [""] * len(pre.row_ids) for lang in forced_ids}
+
+        def _generate(idx, inputs):
+            return generate_multi_target(
+                self._model,
+                inputs,
+                forced_ids,
+                num_beams=num_beams,
+                early_stopping=False,
+                **self._limits.gen_kwargs([pre.lengths[j] for j in idx], num_beams),
+            )
 
-        chunks = []
-        pos = 0
-        while pos < len(ids):
-            part_ids = ids[pos : pos + max_input_tokens]
-            pos += max_input_tokens
-            part_txt = self._tokenizer.decode(part_ids, skip_special_tokens=True)
-            chunks.append(part_txt)
+        def _finish(idx, gen):
+            for lang, out in gen.items():
+                for j, txt in zip(idx, self._limits.decode(tok, out)):
+                    out_texts[lang][j] = txt
 
-        return chunks
+        run_pipelined(
+            plan_length_batches(pre.lengths if forced_ids else [], batch_size, batch_max_tokens),
+            lambda idx: batch_tensors([pre.row_ids[j] for j in idx], pad_id, "cpu"),
+            _generate,
+            _finish,
+            depth=int(self.cfg.get("fbm2m100_pipeline_depth") or 0),
+        )
+
+        return out_texts
 
     def translate_batch(self, texts, src_lang, tgt_lang):
         """
@@ -204,26 +329,107 @@ class Fbm2m100Provider:
 
         max_input_tokens = int(self.cfg.get("fbm2m100_max_input_tokens") or 1024)
 
-        # expand long lines into multiple segments
-        # mapping: original index -> list of segment indices in expanded list
-        expanded = []
-        mapping = []
-        for t in texts:
-            parts = self._split_long_text_by_tokens(t, max_input_tokens=max_input_tokens)
-            start = len(expanded)
-            expanded.extend(parts)
-            mapping.append((start, len(expanded)))
-
-        translated_expanded = self._translate_texts_batched(expanded, src_lang=src_lang, tgt_lang=tgt_lang)
+        # one replica per in-flight call: own tokenizer and thread budget
+        with self._pool.checkout() as rep:
+            # pre.mapping: original index -> range of rows (long lines are several rows)
+            pre = self._pretokenize(rep.tokenizer, texts, src_lang, max_input_tokens)
+            translated_rows = self._translate_rows(rep.tokenizer, pre, tgt_lang=tgt_lang)
 
         # merge segments back
         out = []
-        for start, end in mapping:
-            merged = "".join(translated_expanded[start:end])
+        for start, end in pre.mapping:
+            merged = "".join(translated_rows[start:end])
             out.append(merged)
 
         return out
 
+    def translate_batch_multi(self, texts, src_lang, tgt_langs):
+        """
+        Same texts into several target langs (encoder states reused across targets).
+        Returns dict tgt_lang -> list[str].
+        """
+        tgt_langs = [x for x in (tgt_langs or []) if (x or "").strip()]
+        if not texts or not tgt_langs:
+            return {lang: [] for lang in tgt_langs}
+
+        self._ensure_loaded()
+
+        max_input_tokens = int(self.cfg.get("fbm2m100_max_input_tokens") or 1024)
+
+        with self._pool.checkout() as rep:
+            pre = self._pretokenize(rep.tokenizer, texts, src_lang, max_input_tokens)
+            translated = self._translate_rows_multi(rep.tokenizer, pre, tgt_langs=tgt_langs)
+
+        return {lang: ["".join(res[start:end]) for start, end in pre.mapping] for lang, res in translated.items()}
+
+    def translate_pairs(self, pairs, src_lang):
+        """
+        Heterogeneous batch: pairs = [(text, tgt_lang)], each row decodes into its own target
+        via per-row decoder prompt [decoder_start, lang id]. Returns list[str] in pairs order.
+        """
+        if not pairs:
+            return []
+
+        self._ensure_loaded()
+
+        with self._pool.checkout() as rep:
+            return self._translate_pairs(rep.tokenizer, pairs, src_lang)
+
+    def _translate_pairs(self, tok, pairs, src_lang):
+        max_input_tokens = int(self.cfg.get("fbm2m100_max_input_tokens") or 1024)
+        num_beams = int(self.cfg.get("fbm2m100_num_beams") or 1)
+        batch_size = int(self.cfg.get("fbm2m100_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbm2m100_batch_max_tokens") or 0)
+
+        # same text for several langs is tokenized once
+        uniq = list(dict.fromkeys(t for t, _lang in pairs))
+        pos = {t: i for i, t in enumerate(uniq)}
+        pre = self._pretokenize(tok, uniq, src_lang, max_input_tokens)
+
+        bos_by_lang = {}
+        rows = []
+        row_bos = []
+        mapping = []
+        for t, lang in pairs:
+            if lang not in bos_by_lang:
+                bos_by_lang[lang] = self._get_forced_bos_id((lang or "").strip())
+            src_start, src_end = pre.mapping[pos[t]]
+            start = len(rows)
+            rows.extend(pre.row_ids[src_start:src_end])
+            row_bos.extend([bos_by_lang[lang]] * (src_end - src_start))
+            mapping.append((start, len(rows)))
+
+        if self._backend == "ct2":
+            out_texts = self._ct2_rows(rows, row_bos)
+            return ["".join(out_texts[start:end]) for start, end in mapping]
+
+        pad_id = self._tokenizer.pad_token_id
+        out_texts = [""] * len(rows)
+
+        def _generate(idx, inputs):
+            return generate_mixed_targets(
+                self._model,
+                inputs,
+                [row_bos[j] for j in idx],
+                num_beams=num_beams,
+                early_stopping=False,
+                **self._limits.gen_kwargs([len(rows[j]) for j in idx], num_beams),
+            )
+
+        def _finish(idx, out):
+            for j, txt in zip(idx, self._limits.decode(tok, out)):
+                out_texts[j] = txt
+
+        run_pipelined(
+            plan_length_batches([len(x) for x in rows], batch_size, batch_max_tokens),
+            lambda idx: batch_tensors([rows[j] for j in idx], pad_id, "cpu"),
+            _generate,
+            _finish,
+            depth=int(self.cfg.get("fbm2m100_pipeline_depth") or 0),
+        )
+
+        return ["".join(out_texts[start:end]) for start, end in mapping]
+
     def translate(self, text, src_lang, tgt_lang):
         """
         Single-text API used by fallback line_by_line and other code paths.
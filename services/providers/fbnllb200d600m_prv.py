@@ -1,6 +1,25 @@
-﻿import threading
+﻿import gc
+import threading
 from typing import Optional
 
+from utils.hf_ut import (
+    DecodeLimits,
+    PretokenCache,
+    apply_precision,
+    batch_tensors,
+    decode_meta,
+    generate_mixed_targets,
+    generate_multi_target,
+    normalize_backend,
+    normalize_precision,
+    plan_length_batches,
+    run_pipelined,
+)
+from utils.mem_ut import model_param_bytes
+from utils.ct2_ut import ct2_translate_rows, load_ct2_translator
+from utils.onnx_ut import load_ort_seq2seq
+from utils.replica_ut import ReplicaPool, replica_threads
+from utils.shortlist_ut import ShortlistStore, install_shortlist_head, shortlist_dir, use_shortlist
 from utils.fbnllb200d600m_ut import (
     build_iso3_index,
     extract_nllb_lang_codes,
@@ -14,11 +33,18 @@ class Fbnllb200d600mProvider:
 
     def __init__(self, cfg):
         self.cfg = cfg
+        self.max_concurrency = int(cfg.get("fbnllb200d600m_max_concurrency") or 1)
+        # replicas share the model weights; default: one per concurrent caller
+        self._replicas = int(cfg.get("fbnllb200d600m_replicas") or 0) or self.max_concurrency
+        self.max_concurrency = max(self.max_concurrency, self._replicas)
+        self._pool = None
         self._lock = threading.Lock()
 
         self._tokenizer = None
         self._model = None
         self._load_err: Optional[Exception] = None
+        self._precision = None  # active mode once loaded
+        self._backend = normalize_backend(cfg.get("fbnllb200d600m_backend"))
 
         self._langs_cache = None
         self._langs_lock = threading.Lock()
@@ -26,17 +52,43 @@ class Fbnllb200d600mProvider:
         self._nllb_codes_cache = None
         self._iso3_index_cache = None
 
+        self._pretok_cache = PretokenCache()
+        self._limits = DecodeLimits.from_cfg(cfg, "fbnllb200d600m")
+        self._shortlists = None  # ShortlistStore when fbnllb200d600m_shortlist=1 (torch backend)
+
     def get_meta(self):
         # Do not force model load here; just report configured values.
         return {
             "engine": self.name,
             "model": (self.cfg.get("fbnllb200d600m_model") or "").strip(),
             "device": (self.cfg.get("fbnllb200d600m_device") or "").strip(),
+            "precision": self._precision or (self.cfg.get("fbnllb200d600m_precision") or "fp32").strip().lower(),
+            "backend": self._backend,
+            "replicas": self._replicas,
+            "shortlist": bool(self._shortlists),
+            "decode": decode_meta(self.cfg, "fbnllb200d600m", shortlist=bool(self._shortlists)),
         }
 
+    def load(self):
+        """
+        Model weights only, no test translation (process pool loads before forking).
+        """
+        self._ensure_loaded()
+
     def warmup(self):
         self._ensure_loaded()
 
+    def unload(self):
+        with self._lock:
+            self._model = None
+            self._load_err = None
+            self._precision = None
+            self._pool = None
+        gc.collect()
+
+    def memory_bytes(self):
+        return model_param_bytes(self._model)
+
     def list_languages(self):
         whitelist = self.cfg.get("langs") or []
         if whitelist:
@@ -48,10 +100,12 @@ class Fbnllb200d600mProvider:
         if self._nllb_codes_cache is not None and self._iso3_index_cache is not None:
             return
 
-        model_id = (self.cfg.get("fbnllb200d600m_model") or "facebook/nllb-200-distilled-600M").strip()
-        from transformers import AutoTokenizer
+        tok = self._tokenizer
+        if tok is None:
+            model_id = (self.cfg.get("fbnllb200d600m_model") or "facebook/nllb-200-distilled-600M").strip()
+            from transformers import AutoTokenizer
 
-        tok = AutoTokenizer.from_pretrained(model_id)
+            tok = AutoTokenizer.from_pretrained(model_id)
         codes = extract_nllb_lang_codes(tok)
 
         self._nllb_codes_cache = codes
@@ -75,13 +129,13 @@ class Fbnllb200d600mProvider:
                 return []
 
     def _ensure_loaded(self):
-        if self._model is not None and self._tokenizer is not None:
+        if self._pool is not None:
             return
         if self._load_err is not None:
             raise RuntimeError(f"fbnllb200d600m load failed: {self._load_err}")
 
         with self._lock:
-            if self._model is not None and self._tokenizer is not None:
+            if self._pool is not None:
                 return
             if self._load_err is not None:
                 raise RuntimeError(f"fbnllb200d600m load failed: {self._load_err}")
@@ -108,35 +162,128 @@ class Fbnllb200d600mProvider:
                 if device != "cpu":
                     device = "cpu"
 
+                # per-replica intra-op threads: explicit, else torch_threads (or the CPUs) split evenly
+                rep_threads = replica_threads(
+                    self._replicas,
+                    int(self.cfg.get("fbnllb200d600m_replica_threads") or 0) or torch_threads // self._replicas,
+                )
+
                 self._tokenizer = AutoTokenizer.from_pretrained(model_id)
-                self._model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
-                self._model.to(device)
-                self._model.eval()
+                if self._backend == "onnx":
+                    # exported graphs run as is: precision modes apply to the torch backend only
+                    self._model = load_ort_seq2seq(
+                        model_id,
+                        cache_root=(self.cfg.get("fbnllb200d600m_onnx_dir") or "").strip(),
+                        threads=torch_threads,
+                    )
+                    self._precision = "fp32"
+                elif self._backend == "ct2":
+                    self._model = load_ct2_translator(
+                        model_id,
+                        cache_root=(self.cfg.get("fbnllb200d600m_ct2_dir") or "").strip(),
+                        precision=self.cfg.get("fbnllb200d600m_precision") or "fp32",
+                        device=device,
+                        threads=rep_threads,
+                        replicas=self._replicas,
+                    )
+                    self._precision = normalize_precision(self.cfg.get("fbnllb200d600m_precision"))
+                else:
+                    self._model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
+                    self._model.to(device)
+                    self._model.eval()
+                    self._model, self._precision = apply_precision(
+                        self._model, self.cfg.get("fbnllb200d600m_precision") or "fp32", device
+                    )
 
                 self._nllb_codes_cache = extract_nllb_lang_codes(self._tokenizer)
                 self._iso3_index_cache = build_iso3_index(self._nllb_codes_cache)
 
+                if self._backend == "torch" and int(self.cfg.get("fbnllb200d600m_shortlist") or 0):
+                    self._shortlists = self._make_shortlist_store(self._tokenizer)
+                    install_shortlist_head(self._model)
+
+                # set last: a ready pool means the provider is loaded
+                self._pool = ReplicaPool(self._tokenizer, self._replicas, rep_threads)
+
             except Exception as e:
                 self._load_err = e
                 raise
 
-    def _split_long_text_by_tokens(self, text: str, max_input_tokens: int):
-        if not text:
-            return [""]
+    def _make_shortlist_store(self, tokenizer):
+        model_id = (self.cfg.get("fbnllb200d600m_model") or "facebook/nllb-200-distilled-600M").strip()
+        codes = self._nllb_codes_cache or extract_nllb_lang_codes(tokenizer)
+        return ShortlistStore(
+            shortlist_dir(model_id, (self.cfg.get("fbnllb200d600m_shortlist_dir") or "").strip()),
+            size=int(self.cfg.get("fbnllb200d600m_shortlist_size") or 32000),
+            min_tokens=int(self.cfg.get("fbnllb200d600m_shortlist_min_tokens") or 0),
+            min_coverage=float(self.cfg.get("fbnllb200d600m_shortlist_min_coverage") or 0.995),
+            always_ids=list(tokenizer.all_special_ids) + tokenizer.convert_tokens_to_ids(codes),
+        )
+
+    def _shortlist_ctx(self, bos_ids):
+        """
+        Restricts decoding to the union of the target langs' shortlists (full vocab if any has none).
+        """
+        if self._shortlists is None:
+            return use_shortlist(None, None)
+        keys = self._tokenizer.convert_ids_to_tokens(sorted(set(bos_ids)))
+        return use_shortlist(*self._shortlists.union(keys))
+
+    def _observe(self, bos_id, seqs):
+        """
+        Lazy shortlist build from full-vocabulary outputs (generated ids tensor or lists).
+        """
+        if self._shortlists is not None:
+            seqs = seqs.tolist() if hasattr(seqs, "tolist") else seqs
+            self._shortlists.observe(self._tokenizer.convert_ids_to_tokens(bos_id), seqs)
+
+    def build_shortlist(self, tgt_lang, lines):
+        """
+        Offline shortlist for tgt_lang from target-language text (tokenizer only, no model load).
+        """
+        self._ensure_tokenizer_codes()
+        tok = self._tokenizer
+        if tok is None:
+            from transformers import AutoTokenizer
 
-        ids = self._tokenizer.encode(text, add_special_tokens=False)
-        if len(ids) <= max_input_tokens:
-            return [text]
+            model_id = (self.cfg.get("fbnllb200d600m_model") or "facebook/nllb-200-distilled-600M").strip()
+            tok = AutoTokenizer.from_pretrained(model_id)
+        key = iso_to_nllb((tgt_lang or "").strip().lower(), nllb_iso3_index=self._iso3_index_cache or {})
+        return self._make_shortlist_store(tok).build_from_corpus(tok, key, lines)
 
-        chunks = []
-        pos = 0
-        while pos < len(ids):
-            part_ids = ids[pos : pos + max_input_tokens]
-            pos += max_input_tokens
-            part_txt = self._tokenizer.decode(part_ids, skip_special_tokens=True)
-            chunks.append(part_txt)
+    def _src_nllb(self, src_lang):
+        src_code = (src_lang or "auto").strip().lower() or "auto"
+        if src_code == "auto":
+            src_code = "en"
+        return iso_to_nllb(src_code, nllb_iso3_index=self._iso3_index_cache or {})
 
-        return chunks
+    def _pretokenize(self, tok, texts, src_nllb, max_input_tokens):
+        """
+        Source ids/chunks for texts, shared by all target langs of a job (PretokenCache).
+        tok: tokenizer of the checked-out replica (src_lang is set on it).
+        """
+        try:
+            tok.src_lang = src_nllb
+        except Exception:
+            pass
+        return self._pretok_cache.get(tok, texts, src_nllb, max_input_tokens)
+
+    def _ct2_rows(self, rows, row_bos):
+        """
+        ct2 backend: rows of source ids, each decoded after its target lang token.
+        """
+        max_input_tokens = int(self.cfg.get("fbnllb200d600m_max_input_tokens") or 1024)
+        batch_size = int(self.cfg.get("fbnllb200d600m_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbnllb200d600m_batch_max_tokens") or 0)
+        return ct2_translate_rows(
+            self._model,
+            self._tokenizer,
+            rows,
+            [[b] for b in row_bos],
+            max_batch_tokens=batch_max_tokens or batch_size * max_input_tokens,
+            beam_size=int(self.cfg.get("fbnllb200d600m_num_beams") or 1),
+            limits=self._limits,
+        )
 
     def translate_batch(self, texts, src_lang, tgt_lang):
         if not texts:
@@ -144,72 +291,220 @@ class Fbnllb200d600mProvider:
 
         self._ensure_loaded()
 
-        src_code = (src_lang or "auto").strip().lower() or "auto"
         tgt_code = (tgt_lang or "").strip().lower()
         if not tgt_code:
             raise RuntimeError("tgt_lang is required")
 
-        if src_code == "auto":
-            src_code = "en"
-
         iso3_index = self._iso3_index_cache or {}
-        src_nllb = iso_to_nllb(src_code, nllb_iso3_index=iso3_index)
+        src_nllb = self._src_nllb(src_lang)
         tgt_nllb = iso_to_nllb(tgt_code, nllb_iso3_index=iso3_index)
 
         import torch
 
         max_input_tokens = int(self.cfg.get("fbnllb200d600m_max_input_tokens") or 1024)
-        max_new_tokens = int(self.cfg.get("fbnllb200d600m_max_new_tokens") or 256)
         num_beams = int(self.cfg.get("fbnllb200d600m_num_beams") or 1)
         batch_size = int(self.cfg.get("fbnllb200d600m_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbnllb200d600m_batch_max_tokens") or 0)
+
+        # one replica per in-flight call: own tokenizer and thread budget
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            pre = self._pretokenize(tok, texts, src_nllb, max_input_tokens)
+            forced_id = self._tokenizer.convert_tokens_to_ids(tgt_nllb)
+            pad_id = self._tokenizer.pad_token_id
+
+            if self._backend == "ct2":
+                out_texts = self._ct2_rows(pre.row_ids, [forced_id] * len(pre.row_ids))
+                return ["".join(out_texts[start:end]) for start, end in pre.mapping]
+
+            # similar-length rows share a batch; outputs go back by index.
+            # Next batch tensors and previous batch decoding overlap with generate.
+            out_texts = [""] * len(pre.row_ids)
+
+            def _generate(idx, inputs):
+                with torch.no_grad(), self._shortlist_ctx([forced_id]):
+                    return self._model.generate(
+                        **inputs,
+                        forced_bos_token_id=forced_id,
+                        num_beams=num_beams,
+                        early_stopping=False,
+                        **self._limits.gen_kwargs([pre.lengths[j] for j in idx], num_beams),
+                    )
+
+            def _finish(idx, out):
+                self._observe(forced_id, out)
+                for j, txt in zip(idx, self._limits.decode(tok, out)):
+                    out_texts[j] = txt
+
+            run_pipelined(
+                plan_length_batches(pre.lengths, batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([pre.row_ids[j] for j in idx], pad_id, "cpu"),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("fbnllb200d600m_pipeline_depth") or 0),
+            )
 
-        expanded = []
-        mapping = []
-        for t in texts:
-            parts = self._split_long_text_by_tokens(t, max_input_tokens=max_input_tokens)
-            start = len(expanded)
-            expanded.extend(parts)
-            mapping.append((start, len(expanded)))
+        merged = []
+        for start, end in pre.mapping:
+            merged.append("".join(out_texts[start:end]))
 
-        try:
-            self._tokenizer.src_lang = src_nllb
-        except Exception:
-            pass
+        return merged
 
-        forced_id = self._tokenizer.convert_tokens_to_ids(tgt_nllb)
-
-        out_texts = []
-        i = 0
-        n = len(expanded)
-        while i < n:
-            batch = expanded[i : i + batch_size]
-            i += batch_size
-
-            inputs = self._tokenizer(
-                batch,
-                return_tensors="pt",
-                padding=True,
-                truncation=True,
-                max_length=max_input_tokens,
-            )
-            inputs = {k: v.to("cpu") for k, v in inputs.items()}
+    def translate_batch_multi(self, texts, src_lang, tgt_langs):
+        """
+        Same texts into several target langs: the encoder runs once per batch,
+        decoding runs per target. Returns dict tgt_lang -> list[str].
+        Unsupported target langs are left out of the result.
+        """
+        tgt_langs = [x for x in (tgt_langs or []) if (x or "").strip()]
+        if not texts or not tgt_langs:
+            return {lang: [] for lang in tgt_langs}
+
+        self._ensure_loaded()
+
+        iso3_index = self._iso3_index_cache or {}
+        src_nllb = self._src_nllb(src_lang)
+
+        forced_ids = {}
+        for lang in tgt_langs:
+            try:
+                tgt_nllb = iso_to_nllb(lang.strip().lower(), nllb_iso3_index=iso3_index)
+                forced_ids[lang] = self._tokenizer.convert_tokens_to_ids(tgt_nllb)
+            except Exception:
+                continue
 
-            with torch.no_grad():
-                out = self._model.generate(
-                    **inputs,
-                    forced_bos_token_id=forced_id,
-                    max_new_tokens=max_new_tokens,
+        max_input_tokens = int(self.cfg.get("fbnllb200d600m_max_input_tokens") or 1024)
+        num_beams = int(self.cfg.get("fbnllb200d600m_num_beams") or 1)
+        batch_size = int(self.cfg.get("fbnllb200d600m_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbnllb200d600m_batch_max_tokens") or 0)
+
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            pre = self._pretokenize(tok, texts, src_nllb, max_input_tokens)
+
+            if forced_ids and (self._backend == "ct2" or (1 < len(forced_ids) and len(pre.row_ids) < batch_size)):
+                # short input: a per-lang batch would be mostly padding, pack all langs together
+                # (ct2 has no encoder reuse across targets: always one mixed batch)
+                langs = list(forced_ids)
+                pairs = [(t, lang) for lang in langs for t in texts]
+                flat = self._translate_pairs(rep, pairs, src_lang)
+                n_texts = len(texts)
+                return {lang: flat[k * n_texts : (k + 1) * n_texts] for k, lang in enumerate(langs)}
+
+            pad_id = self._tokenizer.pad_token_id
+            out_texts = {lang: [""] * len(pre.row_ids) for lang in forced_ids}
+
+            def _generate(idx, inputs):
+                return generate_multi_target(
+                    self._model,
+                    inputs,
+                    forced_ids,
+                    decode_ctx=lambda lang: self._shortlist_ctx([forced_ids[lang]]),
                     num_beams=num_beams,
                     early_stopping=False,
+                    **self._limits.gen_kwargs([pre.lengths[j] for j in idx], num_beams),
                 )
 
-            out_texts.extend(self._tokenizer.batch_decode(out, skip_special_tokens=True))
+            def _finish(idx, gen):
+                for lang, out in gen.items():
+                    self._observe(forced_ids[lang], out)
+                    for j, txt in zip(idx, self._limits.decode(tok, out)):
+                        out_texts[lang][j] = txt
+
+            run_pipelined(
+                plan_length_batches(pre.lengths if forced_ids else [], batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([pre.row_ids[j] for j in idx], pad_id, "cpu"),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("fbnllb200d600m_pipeline_depth") or 0),
+            )
 
-        merged = []
-        for start, end in mapping:
-            merged.append("".join(out_texts[start:end]))
+            return {lang: ["".join(res[start:end]) for start, end in pre.mapping] for lang, res in out_texts.items()}
 
-        return merged
+    def translate_pairs(self, pairs, src_lang):
+        """
+        Heterogeneous batch: pairs = [(text, tgt_lang)] with any mix of target langs.
+        Rows are packed into length-bucketed batches (fbnllb200d600m_batch_size rows or
+        fbnllb200d600m_batch_max_tokens padded tokens); each row gets its own
+        target lang token as decoder prompt. Returns list[str] in pairs order.
+        """
+        if not pairs:
+            return []
+
+        self._ensure_loaded()
+
+        with self._pool.checkout() as rep:
+            return self._translate_pairs(rep, pairs, src_lang)
+
+    def _translate_pairs(self, rep, pairs, src_lang):
+        tok = rep.tokenizer
+        iso3_index = self._iso3_index_cache or {}
+        src_nllb = self._src_nllb(src_lang)
+
+        bos_by_lang = {}
+        for _t, lang in pairs:
+            if lang not in bos_by_lang:
+                tgt_nllb = iso_to_nllb((lang or "").strip().lower(), nllb_iso3_index=iso3_index)
+                bos_by_lang[lang] = self._tokenizer.convert_tokens_to_ids(tgt_nllb)
+
+        max_input_tokens = int(self.cfg.get("fbnllb200d600m_max_input_tokens") or 1024)
+        num_beams = int(self.cfg.get("fbnllb200d600m_num_beams") or 1)
+        batch_size = int(self.cfg.get("fbnllb200d600m_batch_size") or 8)
+        batch_max_tokens = int(self.cfg.get("fbnllb200d600m_batch_max_tokens") or 0)
+
+        # same text for several langs is tokenized once
+        uniq = list(dict.fromkeys(t for t, _lang in pairs))
+        pos = {t: i for i, t in enumerate(uniq)}
+        pre = self._pretokenize(tok, uniq, src_nllb, max_input_tokens)
+
+        rows = []
+        row_bos = []
+        mapping = []
+        for t, lang in pairs:
+            src_start, src_end = pre.mapping[pos[t]]
+            start = len(rows)
+            rows.extend(pre.row_ids[src_start:src_end])
+            row_bos.extend([bos_by_lang[lang]] * (src_end - src_start))
+            mapping.append((start, len(rows)))
+
+        if self._backend == "ct2":
+            out_texts = self._ct2_rows(rows, row_bos)
+            return ["".join(out_texts[start:end]) for start, end in mapping]
+
+        pad_id = self._tokenizer.pad_token_id
+        out_texts = [""] * len(rows)
+
+        def _generate(idx, inputs):
+            batch_bos = [row_bos[j] for j in idx]
+            with self._shortlist_ctx(batch_bos):
+                return generate_mixed_targets(
+                    self._model,
+                    inputs,
+                    batch_bos,
+                    num_beams=num_beams,
+                    early_stopping=False,
+                    **self._limits.gen_kwargs([len(rows[j]) for j in idx], num_beams),
+                )
+
+        def _finish(idx, out):
+            if self._shortlists is not None:
+                by_bos = {}
+                for j, seq in zip(idx, out.tolist()):
+                    by_bos.setdefault(row_bos[j], []).append(seq)
+                for bos, seqs in by_bos.items():
+                    self._observe(bos, seqs)
+            for j, txt in zip(idx, self._limits.decode(tok, out)):
+                out_texts[j] = txt
+
+        run_pipelined(
+            plan_length_batches([len(x) for x in rows], batch_size, batch_max_tokens),
+            lambda idx: batch_tensors([rows[j] for j in idx], pad_id, "cpu"),
+            _generate,
+            _finish,
+            depth=int(self.cfg.get("fbnllb200d600m_pipeline_depth") or 0),
+        )
+
+        return ["".join(out_texts[start:end]) for start, end in mapping]
 
     def translate(self, text, src_lang, tgt_lang):
         if text is None:
@@ -1,8 +1,13 @@
 import asyncio
+import concurrent.futures
+import inspect
 import re
+import threading
 import time
 from typing import Optional
 
+from utils.vtt_ut import batch_translate_texts_async
+
 
 _LANG_ALIASES = {
     "he": "iw",
@@ -51,6 +56,20 @@ def _norm_lang(code: str) -> str:
     return "-".join(parts)
 
 
+def _call_with_timeout(fn, timeout, grace_sec=0):
+    """
+    Runs fn() in a helper thread and waits at most timeout + grace_sec.
+    The thread is not joined: a stuck call must not block the caller past timeout.
+    """
+    ex = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        return ex.submit(fn).result(timeout=timeout + grace_sec)
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError(f"googletrans timed out after {timeout}s") from None
+    finally:
+        ex.shutdown(wait=False)
+
+
 def _is_transient_error(e: Exception) -> bool:
     """
     Detect errors that are likely temporary:
@@ -87,16 +106,22 @@ class GoogleWebProvider:
 
     def __init__(self, cfg):
         self.cfg = cfg
+        self.max_concurrency = int(cfg.get("googleweb_max_concurrency") or 1)
 
         # QPS throttling across all translate calls in this process.
         # Set googleweb_qps to 0.5..1 for stability.
         qps = float(cfg.get("googleweb_qps") or 0)
         self._min_interval = (1.0 / float(qps)) if qps > 0 else 0.0
         self._last_call_ts = 0.0
+        self._throttle_lock = threading.Lock()
 
         self._retry_attempts = int(cfg.get("googleweb_retry_attempts") or 3)
         self._retry_backoff_sec = float(cfg.get("googleweb_retry_backoff_sec") or 20)
 
+        # Pooled googletrans client for the async path (bound to the loop that created it).
+        self._gt_translator = None
+        self._gt_loop = None
+
     def list_languages(self):
         whitelist = self.cfg.get("langs") or []
         if whitelist:
@@ -112,14 +137,35 @@ class GoogleWebProvider:
         except Exception:
             return whitelist
 
-    def _throttle(self):
+    def _reserve_slot(self) -> float:
+        """
+        Reserve the next call slot under the QPS limit.
+        Returns seconds to wait before the call; the wait itself happens outside the lock,
+        so sync threads and async tasks can keep several requests in flight.
+        """
         if self._min_interval <= 0:
-            return
-        now = time.time()
-        dt = now - self._last_call_ts
-        if dt < self._min_interval:
-            time.sleep(self._min_interval - dt)
-        self._last_call_ts = time.time()
+            return 0.0
+        with self._throttle_lock:
+            now = time.time()
+            slot = max(now, self._last_call_ts + self._min_interval)
+            self._last_call_ts = slot
+            return slot - now
+
+    def _throttle(self):
+        wait = self._reserve_slot()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def _throttle_async(self):
+        wait = self._reserve_slot()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _norm_pair(self, src_lang, tgt_lang):
+        src_lang = (src_lang or "auto").strip() or "auto"
+        if src_lang != "auto":
+            src_lang = _norm_lang(src_lang)
+        return src_lang, _norm_lang(tgt_lang)
 
     def translate(self, text, src_lang, tgt_lang):
         if text is None:
@@ -127,11 +173,7 @@ class GoogleWebProvider:
         if text.strip() == "":
             return text
 
-        src_lang = (src_lang or "auto").strip() or "auto"
-        if src_lang != "auto":
-            src_lang = _norm_lang(src_lang)
-
-        tgt_lang = _norm_lang(tgt_lang)
+        src_lang, tgt_lang = self._norm_pair(src_lang, tgt_lang)
 
         # Prefer deep-translator first (often more stable than googletrans)
         order = self.cfg.get("googleweb_order") or ["deep", "googletrans"]
@@ -177,20 +219,117 @@ class GoogleWebProvider:
     def _translate_googletrans(self, text, src_lang, tgt_lang):
         from googletrans import Translator
 
+        timeout = int(self.cfg.get("googleweb_timeout_sec") or 10)
+        tr = Translator()
+
+        if not inspect.iscoroutinefunction(tr.translate):
+            # googletrans<4.0.0 (incl. the pinned 4.0.0rc1) has a sync client
+            return _call_with_timeout(lambda: tr.translate(text, src=src_lang, dest=tgt_lang).text, timeout)
+
         async def _do():
-            tr = Translator()
-            res = await tr.translate(text, src=src_lang, dest=tgt_lang)
+            try:
+                # cancelled on the private loop when over time, so nothing keeps running behind us
+                res = await asyncio.wait_for(tr.translate(text, src=src_lang, dest=tgt_lang), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"googletrans timed out after {timeout}s") from None
             return res.text
 
-        timeout = int(self.cfg.get("googleweb_timeout_sec") or 10)
-
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
             loop = None
 
         if loop and loop.is_running():
-            fut = asyncio.run_coroutine_threadsafe(_do(), loop)
-            return fut.result(timeout=timeout)
+            # Called from a loop thread: never block on a coroutine scheduled to this same loop.
+            # Run it on a private loop in a helper thread instead (async callers should use translate_batch_async).
+            return _call_with_timeout(lambda: asyncio.run(_do()), timeout, grace_sec=1)
+
+        return asyncio.run(_do())
+
+    # ---- async contract (see base_prv.has_async_batch) ----
+
+    async def translate_batch_async(self, texts, src_lang, tgt_lang):
+        """
+        Delimiter-joined chunks are translated concurrently on the running loop;
+        QPS limit is applied per request via _throttle_async.
+        """
+        if not texts:
+            return []
+
+        max_total_chars = int(self.cfg.get("max_total_chars") or 4500)
+
+        async def _one(block_text):
+            return await self.translate_async(block_text, src_lang, tgt_lang)
+
+        return await batch_translate_texts_async(texts, _one, max_total_chars=max_total_chars)
+
+    async def translate_async(self, text, src_lang, tgt_lang):
+        if text is None:
+            return ""
+        if text.strip() == "":
+            return text
+
+        src_lang, tgt_lang = self._norm_pair(src_lang, tgt_lang)
+        order = self.cfg.get("googleweb_order") or ["deep", "googletrans"]
+
+        last_err: Optional[Exception] = None
+
+        attempts = max(1, int(self._retry_attempts))
+        for attempt in range(1, attempts + 1):
+            for impl in order:
+                try:
+                    await self._throttle_async()
+
+                    if impl == "googletrans":
+                        return await self._translate_googletrans_async(text, src_lang, tgt_lang)
+
+                    if impl == "deep":
+                        return await asyncio.to_thread(self._translate_deep, text, src_lang, tgt_lang)
+
+                    last_err = RuntimeError(f"unknown googleweb impl: {impl}")
+
+                except Exception as e:
+                    last_err = e
 
-        return asyncio.run(_do())
\ No newline at end of file
+            if last_err and _is_transient_error(last_err) and attempt < attempts:
+                sleep_s = self._retry_backoff_sec * (1 + (attempt - 1) * 0.5)
+                await asyncio.sleep(sleep_s)
+                continue
+
+            break
+
+        raise RuntimeError(f"googleweb translate failed: {last_err}")
+
+    def _get_googletrans_async(self):
+        loop = asyncio.get_running_loop()
+        if self._gt_translator is None or self._gt_loop is not loop:
+            from googletrans import Translator
+
+            self._gt_translator = Translator()
+            self._gt_loop = loop
+        return self._gt_translator
+
+    async def _translate_googletrans_async(self, text, src_lang, tgt_lang):
+        timeout = int(self.cfg.get("googleweb_timeout_sec") or 10)
+        tr = self._get_googletrans_async()
+
+        if inspect.iscoroutinefunction(tr.translate):
+            res = await asyncio.wait_for(tr.translate(text, src=src_lang, dest=tgt_lang), timeout=timeout)
+        else:
+            # googletrans<4.0.0 has a sync client
+            res = await asyncio.wait_for(
+                asyncio.to_thread(tr.translate, text, src=src_lang, dest=tgt_lang),
+                timeout=timeout,
+            )
+        return res.text
+
+    async def aclose(self):
+        tr = self._gt_translator
+        self._gt_translator = None
+        self._gt_loop = None
+        client = getattr(tr, "client", None)
+        try:
+            if client is not None and hasattr(client, "aclose"):
+                await client.aclose()
+        except Exception:
+            pass
\ No newline at end of file
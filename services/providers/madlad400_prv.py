@@ -1,7 +1,23 @@
+import gc
 import logging
 import threading
 from typing import Optional
 
+from utils.ct2_ut import ct2_translate_rows, load_ct2_translator
+from utils.hf_ut import (
+    DecodeLimits,
+    apply_precision,
+    batch_tensors,
+    decode_meta,
+    normalize_backend,
+    normalize_precision,
+    plan_length_batches,
+    run_pipelined,
+)
+from utils.mem_ut import model_param_bytes
+from utils.replica_ut import ReplicaPool, replica_threads
+from utils.shortlist_ut import ShortlistStore, install_shortlist_head, shortlist_dir, use_shortlist
+
 log = logging.getLogger("yttrans.madlad400")
 
 
@@ -12,25 +28,43 @@ class Madlad400Provider:
         self.cfg = cfg
 
         self.max_concurrency = int(cfg.get("madlad400_max_concurrency") or 1)
+        # replicas share the model weights; default: one per concurrent caller
+        self._replicas = int(cfg.get("madlad400_replicas") or 0) or self.max_concurrency
+        self.max_concurrency = max(self.max_concurrency, self._replicas)
+        self._pool = None
 
         self._load_lock = threading.Lock()
-        self._infer_lock = threading.Lock()
         self._langs_lock = threading.Lock()
 
         self._tokenizer = None
         self._model = None
         self._load_err: Optional[Exception] = None
+        self._precision = None  # active mode once loaded
+        self._backend = normalize_backend(cfg.get("madlad400_backend"), supported=("torch", "ct2"))
 
         self._langs_cache = None           # list[str] (no <2...>)
         self._tgt_token_cache = {}         # tgt_lang -> "<2...>"
+        self._shortlists = None            # ShortlistStore when madlad400_shortlist=1 (torch backend)
+        self._limits = DecodeLimits.from_cfg(cfg, "madlad400")
 
     def get_meta(self):
         return {
             "engine": self.name,
             "model": (self.cfg.get("madlad400_model") or "").strip(),
             "device": (self.cfg.get("madlad400_device") or "").strip(),
+            "precision": self._precision or (self.cfg.get("madlad400_precision") or "fp32").strip().lower(),
+            "backend": self._backend,
+            "replicas": self._replicas,
+            "shortlist": bool(self._shortlists),
+            "decode": decode_meta(self.cfg, "madlad400", shortlist=bool(self._shortlists)),
         }
 
+    def load(self):
+        """
+        Model weights only, no test translation (process pool loads before forking).
+        """
+        self._ensure_loaded()
+
     def warmup(self):
         self._ensure_loaded()
         try:
@@ -38,6 +72,17 @@ class Madlad400Provider:
         except Exception:
             log.exception("warmup translate failed")
 
+    def unload(self):
+        with self._load_lock:
+            self._model = None
+            self._load_err = None
+            self._precision = None
+            self._pool = None
+        gc.collect()
+
+    def memory_bytes(self):
+        return model_param_bytes(self._model)
+
     def _ensure_tokenizer_only(self):
         if self._tokenizer is not None:
             return
@@ -118,13 +163,13 @@ class Madlad400Provider:
         raise RuntimeError(f"unsupported tgt_lang={tgt_lang}: no matching <2...> token found")
 
     def _ensure_loaded(self):
-        if self._model is not None and self._tokenizer is not None:
+        if self._pool is not None:
             return
         if self._load_err is not None:
             raise RuntimeError(f"{self.name} load failed: {self._load_err}")
 
         with self._load_lock:
-            if self._model is not None and self._tokenizer is not None:
+            if self._pool is not None:
                 return
             if self._load_err is not None:
                 raise RuntimeError(f"{self.name} load failed: {self._load_err}")
@@ -144,6 +189,27 @@ class Madlad400Provider:
                     log.info("%s loading tokenizer model_id=%s", self.name, model_id)
                     self._tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
 
+                # per-replica intra-op threads: explicit, else torch_threads (or the CPUs) split evenly
+                rep_threads = replica_threads(
+                    self._replicas,
+                    int(self.cfg.get("madlad400_replica_threads") or 0) or torch_threads // self._replicas,
+                )
+
+                if self._backend == "ct2":
+                    log.info("%s loading ct2 model model_id=%s", self.name, model_id)
+                    self._model = load_ct2_translator(
+                        model_id,
+                        cache_root=(self.cfg.get("madlad400_ct2_dir") or "").strip(),
+                        precision=self.cfg.get("madlad400_precision") or "fp32",
+                        device=device,
+                        threads=rep_threads,
+                        replicas=self._replicas,
+                    )
+                    self._precision = normalize_precision(self.cfg.get("madlad400_precision"))
+                    self._pool = ReplicaPool(self._tokenizer, self._replicas, rep_threads)
+                    log.info("%s model ready device=%s precision=%s backend=ct2", self.name, device, self._precision)
+                    return
+
                 log.info("%s loading model model_id=%s", self.name, model_id)
                 self._model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
                 self._model.eval()
@@ -158,12 +224,94 @@ class Madlad400Provider:
                         log.warning("%s device=%s requested but cuda not available; using cpu", self.name, device)
                         self._model.to("cpu")
 
-                log.info("%s model ready device=%s", self.name, device)
+                model_dev = next(self._model.parameters()).device
+                self._model, self._precision = apply_precision(
+                    self._model, self.cfg.get("madlad400_precision") or "fp32", model_dev
+                )
+
+                if int(self.cfg.get("madlad400_shortlist") or 0):
+                    self._shortlists = self._make_shortlist_store(self._tokenizer)
+                    install_shortlist_head(self._model)
+
+                # set last: a ready pool means the provider is loaded
+                self._pool = ReplicaPool(self._tokenizer, self._replicas, rep_threads)
+
+                log.info("%s model ready device=%s precision=%s", self.name, device, self._precision)
 
             except Exception as e:
                 self._load_err = e
                 raise
 
+    def _make_shortlist_store(self, tokenizer):
+        model_id = (self.cfg.get("madlad400_model") or "google/madlad400-3b-mt").strip()
+        return ShortlistStore(
+            shortlist_dir(model_id, (self.cfg.get("madlad400_shortlist_dir") or "").strip()),
+            size=int(self.cfg.get("madlad400_shortlist_size") or 32000),
+            min_tokens=int(self.cfg.get("madlad400_shortlist_min_tokens") or 0),
+            min_coverage=float(self.cfg.get("madlad400_shortlist_min_coverage") or 0.995),
+            always_ids=tokenizer.all_special_ids,
+        )
+
+    def _shortlist_ctx(self, tgt_toks):
+        """
+        Restricts decoding to the union of the target langs' shortlists (full vocab if any has none).
+        """
+        if self._shortlists is None:
+            return use_shortlist(None, None)
+        return use_shortlist(*self._shortlists.union(tgt_toks))
+
+    def _observe(self, row_toks, gen):
+        """
+        Lazy shortlist build from full-vocabulary outputs, grouped by target lang token.
+        """
+        if self._shortlists is None:
+            return
+        by_tok = {}
+        for tok, seq in zip(row_toks, gen.tolist()):
+            by_tok.setdefault(tok, []).append(seq)
+        for tok, seqs in by_tok.items():
+            self._shortlists.observe(tok, seqs)
+
+    def build_shortlist(self, tgt_lang, lines):
+        """
+        Offline shortlist for tgt_lang from target-language text (tokenizer only, no model load).
+        """
+        tgt_tok = self._pick_tgt_token(tgt_lang)
+        return self._make_shortlist_store(self._tokenizer).build_from_corpus(self._tokenizer, tgt_tok, lines)
+
+    def _model_device(self):
+        try:
+            return next(self._model.parameters()).device
+        except Exception:
+            return "cpu"
+
+    @staticmethod
+    def _prompt_ids(tok, prompts, max_input_tokens):
+        """
+        Source ids of "<2xx>text" prompts (special tokens included, truncated like a batch call).
+        """
+        return tok(list(prompts), add_special_tokens=True, truncation=True, max_length=max_input_tokens)["input_ids"]
+
+    def _ct2_prompts(self, tok, prompts):
+        """
+        ct2 backend: "<2xx>text" prompts, target lang is part of the source.
+        tok: tokenizer of the checked-out replica.
+        """
+        max_input_tokens = int(self.cfg.get("madlad400_max_input_tokens") or 512)
+        batch_size = int(self.cfg.get("madlad400_batch_size") or 1)
+        batch_max_tokens = int(self.cfg.get("madlad400_batch_max_tokens") or 0)
+
+        rows = self._prompt_ids(tok, prompts, max_input_tokens)
+        return ct2_translate_rows(
+            self._model,
+            tok,
+            rows,
+            None,
+            max_batch_tokens=batch_max_tokens or batch_size * max_input_tokens,
+            beam_size=int(self.cfg.get("madlad400_num_beams") or 1),
+            limits=self._limits,
+        )
+
     def translate_batch(self, texts, src_lang, tgt_lang):
         if not texts:
             return []
@@ -171,47 +319,107 @@ class Madlad400Provider:
         self._ensure_loaded()
 
         max_input_tokens = int(self.cfg.get("madlad400_max_input_tokens") or 512)
-        max_new_tokens = int(self.cfg.get("madlad400_max_new_tokens") or 256)
         num_beams = int(self.cfg.get("madlad400_num_beams") or 1)
         batch_size = int(self.cfg.get("madlad400_batch_size") or 1)
+        batch_max_tokens = int(self.cfg.get("madlad400_batch_max_tokens") or 0)
 
         tgt_tok = self._pick_tgt_token(tgt_lang)
 
-        out = []
-        i = 0
+        all_prompts = [f"{tgt_tok}{t or ''}" for t in texts]
+        out = [""] * len(texts)
 
-        with self._infer_lock:
-            while i < len(texts):
-                batch = texts[i : i + batch_size]
-                i += batch_size
+        # one replica per in-flight call: own tokenizer and thread budget
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            if self._backend == "ct2":
+                return self._ct2_prompts(tok, all_prompts)
 
-                prompts = [f"{tgt_tok}{t or ''}" for t in batch]
+            # prompts are tokenized once up front: the decode stage uses the tokenizer concurrently
+            rows = self._prompt_ids(tok, all_prompts, max_input_tokens)
+            lengths = [len(x) for x in rows]
+            pad_id = tok.pad_token_id
+            model_dev = self._model_device()
 
-                inputs = self._tokenizer(
-                    prompts,
-                    return_tensors="pt",
-                    padding=True,
-                    truncation=True,
-                    max_length=max_input_tokens,
-                )
+            def _generate(idx, inputs):
+                import torch
+                with torch.no_grad(), self._shortlist_ctx([tgt_tok]):
+                    return self._model.generate(
+                        **inputs,
+                        num_beams=num_beams,
+                        early_stopping=False,
+                        **self._limits.gen_kwargs([lengths[j] for j in idx], num_beams),
+                    )
+
+            def _finish(idx, gen):
+                self._observe([tgt_tok] * len(idx), gen)
+                decoded = self._limits.decode(tok, gen)
+                for j, txt in zip(idx, decoded):
+                    out[j] = txt
+
+            # similar-length rows share a batch; outputs go back by index.
+            # Next batch tensors and previous batch decoding overlap with generate.
+            run_pipelined(
+                plan_length_batches(lengths, batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([rows[j] for j in idx], pad_id, model_dev),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("madlad400_pipeline_depth") or 0),
+            )
+
+        return out
+
+    def translate_pairs(self, pairs, src_lang):
+        """
+        Heterogeneous batch: pairs = [(text, tgt_lang)]. MADLAD takes the target as a
+        <2xx> prefix of each source row, so any mix of target langs shares a batch.
+        Returns list[str] in pairs order.
+        """
+        if not pairs:
+            return []
+
+        self._ensure_loaded()
+
+        max_input_tokens = int(self.cfg.get("madlad400_max_input_tokens") or 512)
+        num_beams = int(self.cfg.get("madlad400_num_beams") or 1)
+        batch_size = int(self.cfg.get("madlad400_batch_size") or 1)
+        batch_max_tokens = int(self.cfg.get("madlad400_batch_max_tokens") or 0)
+
+        row_toks = [self._pick_tgt_token(lang) for _t, lang in pairs]
+        prompts = [f"{lt}{t or ''}" for lt, (t, _lang) in zip(row_toks, pairs)]
+        out = [""] * len(prompts)
+
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            if self._backend == "ct2":
+                return self._ct2_prompts(tok, prompts)
 
-                try:
-                    model_dev = next(self._model.parameters()).device
-                    inputs = {k: v.to(model_dev) for k, v in inputs.items()}
-                except Exception:
-                    inputs = {k: v.to("cpu") for k, v in inputs.items()}
+            rows = self._prompt_ids(tok, prompts, max_input_tokens)
+            lengths = [len(x) for x in rows]
+            pad_id = tok.pad_token_id
+            model_dev = self._model_device()
 
+            def _generate(idx, inputs):
                 import torch
-                with torch.no_grad():
-                    gen = self._model.generate(
+                with torch.no_grad(), self._shortlist_ctx([row_toks[j] for j in idx]):
+                    return self._model.generate(
                         **inputs,
-                        max_new_tokens=max_new_tokens,
                         num_beams=num_beams,
                         early_stopping=False,
+                        **self._limits.gen_kwargs([lengths[j] for j in idx], num_beams),
                     )
 
-                decoded = self._tokenizer.batch_decode(gen, skip_special_tokens=True)
-                out.extend(decoded)
+            def _finish(idx, gen):
+                self._observe([row_toks[j] for j in idx], gen)
+                for j, txt in zip(idx, self._limits.decode(tok, gen)):
+                    out[j] = txt
+
+            run_pipelined(
+                plan_length_batches(lengths, batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([rows[j] for j in idx], pad_id, model_dev),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("madlad400_pipeline_depth") or 0),
+            )
 
         return out
 
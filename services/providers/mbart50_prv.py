@@ -1,7 +1,22 @@
+import gc
 import logging
 import threading
 from typing import Optional
 
+from utils.hf_ut import (
+    DecodeLimits,
+    PretokenCache,
+    apply_precision,
+    batch_tensors,
+    decode_meta,
+    generate_mixed_targets,
+    generate_multi_target,
+    plan_length_batches,
+    run_pipelined,
+)
+from utils.mem_ut import model_param_bytes
+from utils.replica_ut import ReplicaPool, replica_threads
+
 log = logging.getLogger("yttrans.mbart50")
 
 
@@ -79,22 +94,31 @@ class Mbart50Provider:
     def __init__(self, cfg):
         self.cfg = cfg
         self.max_concurrency = int(cfg.get("mbart50_max_concurrency") or 1)
+        # replicas share the model weights; default: one per concurrent caller
+        self._replicas = int(cfg.get("mbart50_replicas") or 0) or self.max_concurrency
+        self.max_concurrency = max(self.max_concurrency, self._replicas)
+        self._pool = None
 
         self._load_lock = threading.Lock()
-        self._infer_lock = threading.Lock()
         self._langs_lock = threading.Lock()
 
         self._tokenizer = None
         self._model = None
         self._load_err: Optional[Exception] = None
+        self._precision = None  # active mode once loaded
 
         self._langs_cache = None  # list[str] of mbart codes
+        self._pretok_cache = PretokenCache()
+        self._limits = DecodeLimits.from_cfg(cfg, "mbart50")
 
     def get_meta(self):
         return {
             "engine": self.name,
             "model": (self.cfg.get("mbart50_model") or "").strip(),
             "device": (self.cfg.get("mbart50_device") or "").strip(),
+            "precision": self._precision or (self.cfg.get("mbart50_precision") or "fp32").strip().lower(),
+            "replicas": self._replicas,
+            "decode": decode_meta(self.cfg, "mbart50"),
         }
 
     def _ensure_tokenizer_only(self):
@@ -133,6 +157,12 @@ class Mbart50Provider:
             self._langs_cache = langs
             return langs
 
+    def load(self):
+        """
+        Model weights only, no test translation (process pool loads before forking).
+        """
+        self._ensure_loaded()
+
     def warmup(self):
         self._ensure_loaded()
         try:
@@ -140,14 +170,25 @@ class Mbart50Provider:
         except Exception:
             log.exception("warmup translate failed")
 
+    def unload(self):
+        with self._load_lock:
+            self._model = None
+            self._load_err = None
+            self._precision = None
+            self._pool = None
+        gc.collect()
+
+    def memory_bytes(self):
+        return model_param_bytes(self._model)
+
     def _ensure_loaded(self):
-        if self._model is not None and self._tokenizer is not None:
+        if self._pool is not None:
             return
         if self._load_err is not None:
             raise RuntimeError(f"{self.name} load failed: {self._load_err}")
 
         with self._load_lock:
-            if self._model is not None and self._tokenizer is not None:
+            if self._pool is not None:
                 return
             if self._load_err is not None:
                 raise RuntimeError(f"{self.name} load failed: {self._load_err}")
@@ -181,12 +222,45 @@ class Mbart50Provider:
                         log.warning("%s device=%s requested but cuda not available; using cpu", self.name, device)
                         self._model.to("cpu")
 
-                log.info("%s model ready device=%s", self.name, device)
+                model_dev = next(self._model.parameters()).device
+                self._model, self._precision = apply_precision(
+                    self._model, self.cfg.get("mbart50_precision") or "fp32", model_dev
+                )
+
+                # per-replica intra-op threads: explicit, else torch_threads (or the CPUs) split evenly
+                rep_threads = replica_threads(
+                    self._replicas,
+                    int(self.cfg.get("mbart50_replica_threads") or 0) or torch_threads // self._replicas,
+                )
+                # set last: a ready pool means the provider is loaded
+                self._pool = ReplicaPool(self._tokenizer, self._replicas, rep_threads)
+
+                log.info(
+                    "%s model ready device=%s precision=%s replicas=%s",
+                    self.name,
+                    device,
+                    self._precision,
+                    self._replicas,
+                )
 
             except Exception as e:
                 self._load_err = e
                 raise
 
+    def _model_device(self):
+        try:
+            return next(self._model.parameters()).device
+        except Exception:
+            return "cpu"
+
+    def _pretokenize(self, tok, texts, src_code, max_input_tokens):
+        """
+        Source ids/chunks for texts, shared by all target langs of a job (PretokenCache).
+        tok: tokenizer of the checked-out replica (mBART tokenization depends on its src_lang).
+        """
+        tok.src_lang = src_code
+        return self._pretok_cache.get(tok, texts, src_code, max_input_tokens)
+
     def translate_batch(self, texts, src_lang, tgt_lang):
         if not texts:
             return []
@@ -194,9 +268,9 @@ class Mbart50Provider:
         self._ensure_loaded()
 
         max_input_tokens = int(self.cfg.get("mbart50_max_input_tokens") or 512)
-        max_new_tokens = int(self.cfg.get("mbart50_max_new_tokens") or 256)
         num_beams = int(self.cfg.get("mbart50_num_beams") or 1)
         batch_size = int(self.cfg.get("mbart50_batch_size") or 1)
+        batch_max_tokens = int(self.cfg.get("mbart50_batch_max_tokens") or 0)
 
         lang_map = getattr(self._tokenizer, "lang_code_to_id", None)
         if not isinstance(lang_map, dict) or not lang_map:
@@ -211,45 +285,177 @@ class Mbart50Provider:
         if forced_bos is None:
             raise RuntimeError(f"cannot resolve forced_bos_token_id for {tgt_code}")
 
-        out = []
-        i = 0
-
-        with self._infer_lock:
-            while i < len(texts):
-                batch = texts[i : i + batch_size]
-                i += batch_size
-
-                # mBART: set source language before tokenization
-                self._tokenizer.src_lang = src_code
-
-                inputs = self._tokenizer(
-                    batch,
-                    return_tensors="pt",
-                    padding=True,
-                    truncation=True,
-                    max_length=max_input_tokens,
-                )
-
-                try:
-                    model_dev = next(self._model.parameters()).device
-                    inputs = {k: v.to(model_dev) for k, v in inputs.items()}
-                except Exception:
-                    inputs = {k: v.to("cpu") for k, v in inputs.items()}
+        # one replica per in-flight call: own tokenizer and thread budget
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            # mBART: set source language before tokenization
+            pre = self._pretokenize(tok, texts, src_code, max_input_tokens)
+            pad_id = self._tokenizer.pad_token_id
+            model_dev = self._model_device()
+            rows_out = [""] * len(pre.row_ids)
 
+            def _generate(idx, inputs):
                 import torch
                 with torch.no_grad():
-                    gen = self._model.generate(
+                    return self._model.generate(
                         **inputs,
                         forced_bos_token_id=forced_bos,
-                        max_new_tokens=max_new_tokens,
                         num_beams=num_beams,
                         early_stopping=False,
+                        **self._limits.gen_kwargs([pre.lengths[j] for j in idx], num_beams),
                     )
 
-                decoded = self._tokenizer.batch_decode(gen, skip_special_tokens=True)
-                out.extend(decoded)
+            def _finish(idx, gen):
+                decoded = self._limits.decode(tok, gen)
+                for j, txt in zip(idx, decoded):
+                    rows_out[j] = txt
+
+            # similar-length rows share a batch; outputs go back by index.
+            # Next batch tensors and previous batch decoding overlap with generate.
+            run_pipelined(
+                plan_length_batches(pre.lengths, batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([pre.row_ids[j] for j in idx], pad_id, model_dev),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("mbart50_pipeline_depth") or 0),
+            )
+
+        return ["".join(rows_out[start:end]) for start, end in pre.mapping]
+
+    def translate_batch_multi(self, texts, src_lang, tgt_langs):
+        """
+        Same texts into several target langs: encoder runs once per batch, decoding per target.
+        Returns dict tgt_lang -> list[str]; unsupported target langs are left out.
+        """
+        tgt_langs = [x for x in (tgt_langs or []) if (x or "").strip()]
+        if not texts or not tgt_langs:
+            return {lang: [] for lang in tgt_langs}
+
+        self._ensure_loaded()
+
+        max_input_tokens = int(self.cfg.get("mbart50_max_input_tokens") or 512)
+        num_beams = int(self.cfg.get("mbart50_num_beams") or 1)
+        batch_size = int(self.cfg.get("mbart50_batch_size") or 1)
+        batch_max_tokens = int(self.cfg.get("mbart50_batch_max_tokens") or 0)
+
+        lang_map = getattr(self._tokenizer, "lang_code_to_id", None)
+        if not isinstance(lang_map, dict) or not lang_map:
+            raise RuntimeError("mbart50 tokenizer has no lang_code_to_id")
+
+        src_code = _to_mbart50_code(src_lang, lang_map) or "en_XX"
+
+        forced_ids = {}
+        for lang in tgt_langs:
+            tgt_code = _to_mbart50_code(lang, lang_map)
+            if tgt_code and lang_map.get(tgt_code) is not None:
+                forced_ids[lang] = lang_map[tgt_code]
+
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            pre = self._pretokenize(tok, texts, src_code, max_input_tokens)
+            pad_id = self._tokenizer.pad_token_id
+            model_dev = self._model_device()
+            rows_out = {lang: [""] * len(pre.row_ids) for lang in forced_ids}
+
+            def _generate(idx, inputs):
+                return generate_multi_target(
+                    self._model,
+                    inputs,
+                    forced_ids,
+                    num_beams=num_beams,
+                    early_stopping=False,
+                    **self._limits.gen_kwargs([pre.lengths[j] for j in idx], num_beams),
+                )
+
+            def _finish(idx, gen):
+                for lang, ids in gen.items():
+                    for j, txt in zip(idx, self._limits.decode(tok, ids)):
+                        rows_out[lang][j] = txt
+
+            run_pipelined(
+                plan_length_batches(pre.lengths if forced_ids else [], batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([pre.row_ids[j] for j in idx], pad_id, model_dev),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("mbart50_pipeline_depth") or 0),
+            )
+
+        return {lang: ["".join(res[start:end]) for start, end in pre.mapping] for lang, res in rows_out.items()}
+
+    def translate_pairs(self, pairs, src_lang):
+        """
+        Heterogeneous batch: pairs = [(text, tgt_lang)], each row decodes into its own target
+        via per-row decoder prompt [decoder_start, lang code]. Returns list[str] in pairs order.
+        """
+        if not pairs:
+            return []
+
+        self._ensure_loaded()
+
+        max_input_tokens = int(self.cfg.get("mbart50_max_input_tokens") or 512)
+        num_beams = int(self.cfg.get("mbart50_num_beams") or 1)
+        batch_size = int(self.cfg.get("mbart50_batch_size") or 1)
+        batch_max_tokens = int(self.cfg.get("mbart50_batch_max_tokens") or 0)
+
+        lang_map = getattr(self._tokenizer, "lang_code_to_id", None)
+        if not isinstance(lang_map, dict) or not lang_map:
+            raise RuntimeError("mbart50 tokenizer has no lang_code_to_id")
+
+        src_code = _to_mbart50_code(src_lang, lang_map) or "en_XX"
+
+        bos_by_lang = {}
+        for _t, lang in pairs:
+            if lang not in bos_by_lang:
+                tgt_code = _to_mbart50_code(lang, lang_map)
+                if not tgt_code or lang_map.get(tgt_code) is None:
+                    raise RuntimeError(f"unsupported tgt_lang={lang} for mbart50")
+                bos_by_lang[lang] = lang_map[tgt_code]
+
+        # same text for several langs is tokenized once
+        uniq = list(dict.fromkeys(t for t, _lang in pairs))
+        pos = {t: i for i, t in enumerate(uniq)}
+
+        with self._pool.checkout() as rep:
+            tok = rep.tokenizer
+            pre = self._pretokenize(tok, uniq, src_code, max_input_tokens)
+            pad_id = self._tokenizer.pad_token_id
+            model_dev = self._model_device()
+
+            rows = []
+            row_bos = []
+            mapping = []
+            for t, lang in pairs:
+                src_start, src_end = pre.mapping[pos[t]]
+                start = len(rows)
+                rows.extend(pre.row_ids[src_start:src_end])
+                row_bos.extend([bos_by_lang[lang]] * (src_end - src_start))
+                mapping.append((start, len(rows)))
+
+            rows_out = [""] * len(rows)
+
+            def _generate(idx, inputs):
+                return generate_mixed_targets(
+                    self._model,
+                    inputs,
+                    [row_bos[j] for j in idx],
+                    num_beams=num_beams,
+                    early_stopping=False,
+                    **self._limits.gen_kwargs([len(rows[j]) for j in idx], num_beams),
+                )
+
+            def _finish(idx, gen):
+                for j, txt in zip(idx, self._limits.decode(tok, gen)):
+                    rows_out[j] = txt
+
+            run_pipelined(
+                plan_length_batches([len(x) for x in rows], batch_size, batch_max_tokens),
+                lambda idx: batch_tensors([rows[j] for j in idx], pad_id, model_dev),
+                _generate,
+                _finish,
+                depth=int(self.cfg.get("mbart50_pipeline_depth") or 0),
+            )
 
-        return out
+        return ["".join(rows_out[start:end]) for start, end in mapping]
 
     def translate(self, text, src_lang, tgt_lang):
         if text is None:
@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from services.providers.base_prv import has_async_batch, provider_model_tag
+from utils.vtt_ut import batch_translate_texts, normalize_segment
+
+log = logging.getLogger("yttrans.segcache")
+
+
+SEG_KEY_PREFIX = "yttrans:seg:"
+
+
+class SegmentCache:
+    """
+    Two-tier cache of translated segments:
+      L1 - in-process LRU bounded by approx bytes
+      L2 - shared Redis (GET/SET with TTL), looked up in bulk with MGET
+    """
+
+    def __init__(self, r=None, l1_max_bytes=64 * 1024 * 1024, ttl_sec=7 * 86400, use_redis=True):
+        self.r = r if use_redis else None
+        self.l1_max_bytes = max(0, int(l1_max_bytes or 0))
+        self.ttl_sec = int(ttl_sec or 0)
+
+        self._lock = threading.Lock()
+        self._l1 = OrderedDict()
+        self._l1_bytes = 0
+
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.l2_errors = 0
+
+    @staticmethod
+    def make_key(engine, model_tag, src_lang, tgt_lang, norm_text):
+        h = hashlib.sha1(f"{engine}\x1f{model_tag}\x1f{src_lang}\x1f{tgt_lang}\x1f{norm_text}".encode("utf-8"))
+        return SEG_KEY_PREFIX + h.hexdigest()
+
+    @staticmethod
+    def _size(key, value):
+        return len(key) + len(value.encode("utf-8")) + 64
+
+    def _l1_put(self, key, value):
+        if self.l1_max_bytes <= 0:
+            return
+        sz = self._size(key, value)
+        if sz > self.l1_max_bytes:
+            return
+        with self._lock:
+            old = self._l1.pop(key, None)
+            if old is not None:
+                self._l1_bytes -= self._size(key, old)
+            self._l1[key] = value
+            self._l1_bytes += sz
+            while self._l1_bytes > self.l1_max_bytes and self._l1:
+                k, v = self._l1.popitem(last=False)
+                self._l1_bytes -= self._size(k, v)
+
+    def get_many(self, keys):
+        """
+        Returns dict key -> value for found keys. Misses are fetched from Redis in one MGET.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for k in keys:
+                v = self._l1.get(k)
+                if v is None:
+                    missing.append(k)
+                else:
+                    self._l1.move_to_end(k)
+                    found[k] = v
+            self.l1_hits += len(found)
+
+        l2_found = {}
+        if missing and self.r is not None:
+            try:
+                vals = self.r.mget(missing)
+                for k, v in zip(missing, vals):
+                    if v is not None:
+                        l2_found[k] = v
+            except Exception as e:
+                with self._lock:
+                    self.l2_errors += 1
+                log.warning("segcache mget failed: %s", e)
+
+        for k, v in l2_found.items():
+            self._l1_put(k, v)
+        found.update(l2_found)
+
+        with self._lock:
+            self.l2_hits += len(l2_found)
+            self.misses += len(missing) - len(l2_found)
+        return found
+
+    def put_many(self, items):
+        """
+        items: dict key -> value
+        """
+        if not items:
+            return
+        for k, v in items.items():
+            self._l1_put(k, v)
+        if self.r is None:
+            return
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for k, v in items.items():
+                if self.ttl_sec > 0:
+                    pipe.set(k, v, ex=self.ttl_sec)
+                else:
+                    pipe.set(k, v)
+            pipe.execute()
+        except Exception as e:
+            with self._lock:
+                self.l2_errors += 1
+            log.warning("segcache set failed: %s", e)
+
+    def stats(self):
+        with self._lock:
+            total = self.l1_hits + self.l2_hits + self.misses
+            return {
+                "l1_hits": self.l1_hits,
+                "l2_hits": self.l2_hits,
+                "misses": self.misses,
+                "hit_ratio": ((self.l1_hits + self.l2_hits) / total) if total else 0.0,
+                "l1_entries": len(self._l1),
+                "l1_bytes": self._l1_bytes,
+                "l2_errors": self.l2_errors,
+            }
+
+
+class CachedProvider:
+    """
+    Wraps any provider: only segments missing from SegmentCache reach the inner provider.
+    Other attributes (name, max_concurrency, get_meta, list_languages, ...) are forwarded.
+    """
+
+    def __init__(self, inner, cache, cfg):
+        self.inner = inner
+        self.cache = cache
+        self.cfg = cfg
+        self._engine = getattr(inner, "name", "") or (cfg.get("engine") or "")
+        self._model_tag = None
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+    def _tag(self):
+        """
+        Model tag for cache keys, taken after the model is loaded: the effective precision
+        (e.g. int8-dynamic falling back to fp32 off CPU) and shortlist use are known only then.
+        """
+        if self._model_tag is None:
+            if hasattr(self.inner, "load"):
+                self.inner.load()
+            self._model_tag = provider_model_tag(self.inner)
+        return self._model_tag
+
+    def _plan(self, texts, src_lang, tgt_lang):
+        """
+        Returns (parts, keys, found, miss_keys, miss_texts):
+          parts[i] = (prefix, core, suffix); keys[i] = cache key or None for blank lines.
+        """
+        src = (src_lang or "auto").strip().lower() or "auto"
+        tgt = (tgt_lang or "").strip().lower()
+        model_tag = self._tag()
+
+        parts = []
+        keys = []
+        for t in texts:
+            prefix, core, suffix = normalize_segment(t)
+            parts.append((prefix, core, suffix))
+            keys.append(self.cache.make_key(self._engine, model_tag, src, tgt, core) if core else None)
+
+        uniq_keys = list(dict.fromkeys(k for k in keys if k))
+        found = self.cache.get_many(uniq_keys)
+
+        miss_keys = []
+        miss_texts = []
+        seen = set()
+        for k, (_p, core, _s) in zip(keys, parts):
+            if k and k not in found and k not in seen:
+                seen.add(k)
+                miss_keys.append(k)
+                miss_texts.append(core)
+        return parts, keys, found, miss_keys, miss_texts
+
+    def _finish(self, texts, parts, keys, found, miss_keys, miss_translated):
+        if len(miss_translated) != len(miss_keys):
+            raise ValueError(f"translated segments count mismatch: {len(miss_translated)} != {len(miss_keys)}")
+
+        new_items = {}
+        for k, v in zip(miss_keys, miss_translated):
+            v = v or ""
+            found[k] = v
+            if v.strip():
+                new_items[k] = v
+        self.cache.put_many(new_items)
+
+        out = []
+        for t, k, (prefix, _core, suffix) in zip(texts, keys, parts):
+            if not k:
+                out.append(t)
+            else:
+                out.append(f"{prefix}{found[k]}{suffix}")
+        return out
+
+    def _inner_translate_batch(self, texts, src_lang, tgt_lang):
+        if hasattr(self.inner, "translate_batch"):
+            return self.inner.translate_batch(texts=texts, src_lang=src_lang, tgt_lang=tgt_lang)
+
+        def translate_block_sync(block_text):
+            return self.inner.translate(text=block_text, src_lang=src_lang, tgt_lang=tgt_lang)
+
+        max_total_chars = int(self.cfg.get("max_total_chars") or 4500)
+        return batch_translate_texts(texts, translate_block_sync, max_total_chars=max_total_chars)
+
+    def translate_batch(self, texts, src_lang, tgt_lang):
+        if not texts:
+            return []
+        parts, keys, found, miss_keys, miss_texts = self._plan(texts, src_lang, tgt_lang)
+        translated = self._inner_translate_batch(miss_texts, src_lang, tgt_lang) if miss_texts else []
+        return self._finish(texts, parts, keys, found, miss_keys, translated)
+
+    def translate(self, text, src_lang, tgt_lang):
+        if text is None:
+            return ""
+        if text.strip() == "":
+            return text
+        res = self.translate_batch([text], src_lang=src_lang, tgt_lang=tgt_lang)
+        return res[0] if res else ""
+
+
+class AsyncCachedProvider(CachedProvider):
+    """
+    CachedProvider for providers implementing translate_batch_async.
+    Cache lookups/writes (Redis MGET, pipelined SET) run in the default executor, off the event loop.
+    """
+
+    async def translate_batch_async(self, texts, src_lang, tgt_lang):
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        parts, keys, found, miss_keys, miss_texts = await loop.run_in_executor(
+            None, self._plan, texts, src_lang, tgt_lang
+        )
+        translated = []
+        if miss_texts:
+            translated = await self.inner.translate_batch_async(texts=miss_texts, src_lang=src_lang, tgt_lang=tgt_lang)
+        return await loop.run_in_executor(None, self._finish, texts, parts, keys, found, miss_keys, translated)
+
+
+class MultiCachedProvider(CachedProvider):
+    """
+    CachedProvider for providers implementing translate_batch_multi (one encoder pass, many targets).
+    Inner call gets the union of segments missed for any of the target langs.
+    """
+
+    def translate_batch_multi(self, texts, src_lang, tgt_langs):
+        tgt_langs = list(tgt_langs or [])
+        if not texts:
+            return {lang: [] for lang in tgt_langs}
+
+        plans = {lang: self._plan(texts, src_lang, lang) for lang in tgt_langs}
+        union = list(dict.fromkeys(t for p in plans.values() for t in p[4]))
+
+        translated = {}
+        if union:
+            translated = self.inner.translate_batch_multi(texts=union, src_lang=src_lang, tgt_langs=tgt_langs)
+
+        out = {}
+        for lang, (parts, keys, found, miss_keys, miss_texts) in plans.items():
+            if miss_texts and lang not in translated:
+                continue
+            by_text = dict(zip(union, translated.get(lang) or []))
+            out[lang] = self._finish(texts, parts, keys, found, miss_keys, [by_text.get(t, "") for t in miss_texts])
+        return out
+
+
+# ---- process-wide cache ----
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_segment_cache(cfg, r):
+    global _cache
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SegmentCache(
+                r=r,
+                l1_max_bytes=int(cfg.get("segcache_l1_max_mb") or 0) * 1024 * 1024,
+                ttl_sec=int(cfg.get("segcache_ttl_sec") or 0),
+                use_redis=bool(int(cfg.get("segcache_redis") or 0)),
+            )
+        return _cache
+
+
+def wrap_with_segment_cache(provider, cfg, r):
+    """
+    Returns provider wrapped by the shared SegmentCache, or provider itself if disabled.
+    """
+    if not int(cfg.get("segcache_enabled") or 0):
+        return provider
+    cache = get_segment_cache(cfg, r)
+    if has_async_batch(provider):
+        return AsyncCachedProvider(provider, cache, cfg)
+    if hasattr(provider, "translate_batch_multi"):
+        return MultiCachedProvider(provider, cache, cfg)
+    return CachedProvider(provider, cache, cfg)
+
+
+def segment_cache_stats():
+    if _cache is None:
+        return {}
+    return _cache.stats()
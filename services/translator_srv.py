@@ -4,12 +4,16 @@ import grpc
 from google.protobuf.struct_pb2 import Struct
 
 from jobs.translate_job import (
+    content_hash,
     create_job,
-    delete_result,
+    get_backlog,
     get_status,
+    job_weight,
+    load_cached_results,
     load_result,
     load_partial_result,
 )
+from services.providers.base_prv import provider_languages, provider_model_tag
 from utils.auth_ut import require_auth_if_configured
 
 from proto import yttrans_pb2, yttrans_pb2_grpc
@@ -77,11 +81,36 @@ def _provider_meta(provider, cfg):
     return meta
 
 
+def _admission_check(cfg, r, new_weight):
+    """
+    Returns (backlog_dict, reject_reason or "").
+    """
+    max_jobs = int(cfg.get("max_queued_jobs") or 0)
+    max_chars = int(cfg.get("max_backlog_chars") or 0)
+
+    backlog = {}
+    if max_jobs <= 0 and max_chars <= 0:
+        return backlog, ""
+
+    try:
+        backlog = get_backlog(r)
+    except Exception as e:
+        log.warning("backlog check failed: %s", e)
+        return backlog, ""
+
+    if max_jobs > 0 and backlog["queued_jobs"] >= max_jobs:
+        return backlog, f"queue is full: queued_jobs={backlog['queued_jobs']} max={max_jobs}"
+    # a single job bigger than the limit is still accepted into an empty backlog
+    if max_chars > 0 and backlog["backlog_chars"] > 0 and backlog["backlog_chars"] + new_weight > max_chars:
+        return backlog, f"backlog is full: backlog_chars={backlog['backlog_chars']} max={max_chars}"
+
+    return backlog, ""
+
+
 class TranslatorService(yttrans_pb2_grpc.TranslatorServicer):
-    def __init__(self, cfg, r, inmem_requests, provider):
+    def __init__(self, cfg, r, provider):
         self.cfg = cfg
         self.r = r
-        self.inmem_requests = inmem_requests
         self.provider = provider
 
     def ListLanguages(self, request, context):
@@ -91,7 +120,7 @@ class TranslatorService(yttrans_pb2_grpc.TranslatorServicer):
         meta = _provider_meta(self.provider, self.cfg)
 
         try:
-            langs = self.provider.list_languages()
+            langs = provider_languages(self.cfg)
             if not langs:
                 langs = self.cfg.get("langs") or []
         except Exception as e:
@@ -121,13 +150,34 @@ class TranslatorService(yttrans_pb2_grpc.TranslatorServicer):
             context.abort(grpc.StatusCode.INVALID_ARGUMENT, "target_langs is required")
 
         engine = self.cfg.get("engine")
-        job_id = create_job(
-            self.r,
-            video_id=video_id,
-            engine=engine,
-            target_langs=target_langs,
-            src_lang=src_lang,
-        )
+
+        # Content-addressed result cache: langs translated before for this exact VTT finish immediately.
+        # The hash also keys coalescing, which hands results over through the same cache entries.
+        result_cache = int(self.cfg.get("result_cache_enabled") or 0)
+        coalesce = int(self.cfg.get("coalesce_enabled") or 0)
+        chash = ""
+        cached = {}
+        if result_cache or coalesce:
+            chash = content_hash(src_vtt, src_lang, engine, provider_model_tag(self.provider))
+        if result_cache:
+            try:
+                cached = load_cached_results(
+                    self.r, chash, target_langs, ttl_sec=int(self.cfg.get("result_cache_ttl_sec") or 0)
+                )
+            except Exception as e:
+                log.warning("result cache lookup failed: %s", e)
+                cached = {}
+
+        pending_langs = [lang for lang in target_langs if lang not in cached]
+
+        backlog, reject = {}, ""
+        if pending_langs:
+            backlog, reject = _admission_check(self.cfg, self.r, job_weight(src_vtt, len(pending_langs)))
+        if reject:
+            retry_after = int(self.cfg.get("retry_after_sec") or 30)
+            log.warning("submit rejected video_id=%s: %s", video_id, reject)
+            context.set_trailing_metadata((("retry-after", str(retry_after)),))
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"{reject}; retry after {retry_after}s")
 
         options = {}
         try:
@@ -135,17 +185,39 @@ class TranslatorService(yttrans_pb2_grpc.TranslatorServicer):
         except Exception:
             options = {}
 
-        self.inmem_requests[job_id] = {
-            "video_id": video_id,
-            "src_vtt": src_vtt,
-            "src_lang": src_lang,
-            "target_langs": target_langs,
-            "options": options,
-        }
+        job_id = create_job(
+            self.r,
+            video_id=video_id,
+            engine=engine,
+            target_langs=target_langs,
+            src_lang=src_lang,
+            payload={
+                "video_id": video_id,
+                "src_vtt": src_vtt,
+                "src_lang": src_lang,
+                "target_langs": target_langs,
+                "options": options,
+                "content_hash": chash,
+            },
+            payload_ttl_sec=int(self.cfg.get("payload_ttl_sec") or 86400),
+            done_entries=[{"lang": lang, "vtt": cached[lang]} for lang in target_langs if lang in cached],
+            coalesce_hash=chash if coalesce else None,
+            coalesce_ttl_sec=int(self.cfg.get("coalesce_ttl_sec") or 3600),
+        )
 
-        log.info("submit job=%s video_id=%s engine=%s targets=%s", job_id, video_id, engine, target_langs)
+        log.info(
+            "submit job=%s video_id=%s engine=%s targets=%s cached=%s",
+            job_id,
+            video_id,
+            engine,
+            target_langs,
+            sorted(cached.keys()),
+        )
 
         meta = {"queue": "redis", "engine": engine}
+        if cached:
+            meta["cached_langs"] = sorted(cached.keys())
+        meta.update(backlog)
         meta.update(_service_endpoint_meta(self.cfg))
 
         return yttrans_pb2.JobAck(job_id=job_id, accepted=True, message="accepted", meta=_dict_to_struct(meta))
@@ -239,7 +311,7 @@ class TranslatorService(yttrans_pb2_grpc.TranslatorServicer):
 
         res = load_result(self.r, job_id)
         if not res:
-            context.abort(grpc.StatusCode.NOT_FOUND, "result not found (expired or already fetched)")
+            context.abort(grpc.StatusCode.NOT_FOUND, "result not found (expired)")
 
         entries = []
         for e in (res.get("entries") or []):
@@ -256,5 +328,5 @@ class TranslatorService(yttrans_pb2_grpc.TranslatorServicer):
             meta=_dict_to_struct(meta),
         )
 
-        delete_result(self.r, job_id)
+        # Result is kept until its TTL expires, so client retries can fetch it again.
         return reply
\ No newline at end of file
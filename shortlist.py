@@ -0,0 +1,46 @@
+"""
+Offline build of a target-language output vocabulary shortlist.
+
+  python shortlist.py --engine fbnllb200d600m --lang ru --corpus ru.txt
+
+corpus: target-language text, one caption/sentence per line.
+"""
+
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from config.app_cfg import load_config, load_engine_config
+from services.providers.base_prv import build_provider
+
+
+def _parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--engine", default=os.getenv("YTTRANS_ENGINE", "fbnllb200d600m"))
+    p.add_argument("--lang", required=True, help="target lang (same codes as in SubmitTranslate)")
+    p.add_argument("--corpus", required=True, help="text file in the target lang")
+    return p.parse_args()
+
+
+def main():
+    load_dotenv()
+    args = _parse_args()
+
+    cfg = load_config()
+    engine = (args.engine or "").lower()
+    cfg["engine"] = engine
+    cfg.update(load_engine_config(engine))
+
+    provider = build_provider(cfg)
+    if not hasattr(provider, "build_shortlist"):
+        raise SystemExit(f"engine {engine} has no vocabulary shortlist support")
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        lines = [x.strip() for x in f if x.strip()]
+    ids = provider.build_shortlist(args.lang, lines)
+    print(f"engine={engine} lang={args.lang} lines={len(lines)} shortlist={len(ids)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from services.procpool_srv import ProcessPool
+
+
+class _Provider:
+    def echo(self, value):
+        return value
+
+    def hang(self):
+        time.sleep(60)
+        return "late"
+
+
+def test_dead_process_fails_inflight_while_queue_is_busy():
+    pool = ProcessPool(_Provider(), processes=2, pin=False, timeout_sec=30)
+    stop = threading.Event()
+    try:
+        # lands on process 0 (both idle, lowest index first)
+        hung = pool.submit("hang")
+        victim = pool._procs[pool._futures[0][0]]
+
+        def feed():
+            # keeps results flowing from the other process, so the result queue is never idle
+            while not stop.is_set():
+                pool.wait([pool.submit("echo", value=1)])
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        time.sleep(1.0)
+
+        os.kill(victim.pid, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="exited"):
+            hung.result(timeout=5)
+        assert feeder.is_alive()
+        assert pool.alive() == 1
+
+        # new work goes to the live process only
+        assert pool.wait([pool.submit("echo", value=i) for i in range(4)]) == [0, 1, 2, 3]
+    finally:
+        stop.set()
+        pool.stop()
+
+
+def test_wait_times_out_on_stuck_call():
+    pool = ProcessPool(_Provider(), processes=1, pin=False, timeout_sec=1)
+    try:
+        with pytest.raises(TimeoutError):
+            pool.wait([pool.submit("hang")])
+    finally:
+        pool.stop()
@@ -0,0 +1,136 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from utils.hf_ut import DecodeLimits, normalize_precision, trim_loop
+
+log = logging.getLogger("yttrans.ct2")
+
+
+def ct2_model_dir(model_id, root=""):
+    """
+    Converted models live next to the HF hub cache: <HF_HOME>/yttrans-ct2/<org>--<name>.
+    """
+    if not root:
+        try:
+            from huggingface_hub.constants import HF_HOME
+
+            root = os.path.join(HF_HOME, "yttrans-ct2")
+        except Exception:
+            root = os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "yttrans-ct2")
+    return os.path.join(root, model_id.strip().replace("/", "--"))
+
+
+def ct2_compute_type(precision, device="cpu"):
+    """
+    Provider precision mode -> CTranslate2 compute_type (weights are converted once, unquantized).
+    """
+    mode = normalize_precision(precision)
+    on_gpu = not str(device or "cpu").lower().startswith("cpu")
+    if mode == "int8-dynamic":
+        return "int8_float16" if on_gpu else "int8"
+    if mode == "bf16":
+        return "bfloat16"
+    return "float32"
+
+
+def _is_converted(path):
+    return os.path.isfile(os.path.join(path, "model.bin"))
+
+
+def load_ct2_translator(model_id, cache_root="", precision="fp32", device="cpu", threads=0, replicas=1):
+    """
+    ctranslate2.Translator for an HF seq2seq checkpoint.
+    First call converts the checkpoint into a local CT2 model dir; later calls load it from disk.
+    device: "cpu", "cuda" or "cuda:N".
+    replicas: parallel translations (CT2 inter_threads), threads: intra threads of each.
+    """
+    import ctranslate2
+
+    path = ct2_model_dir(model_id, cache_root)
+    if not _is_converted(path):
+        log.info("converting %s to ctranslate2: %s", model_id, path)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        # convert into a temp dir and rename, so a concurrent loader never sees half a model
+        tmp = tempfile.mkdtemp(prefix=".convert-", dir=parent)
+        try:
+            ctranslate2.converters.TransformersConverter(model_id).convert(tmp, force=True)
+            if not _is_converted(path):
+                os.replace(tmp, path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    dev = str(device or "cpu").strip().lower()
+    dev_name, _sep, dev_index = dev.partition(":")
+    if dev_name != "cpu" and ctranslate2.get_cuda_device_count() == 0:
+        log.warning("ct2 device=%s requested but cuda not available; using cpu", device)
+        dev_name, dev_index = "cpu", ""
+
+    return ctranslate2.Translator(
+        path,
+        device=dev_name,
+        device_index=int(dev_index or 0),
+        compute_type=ct2_compute_type(precision, dev_name),
+        inter_threads=max(1, int(replicas or 1)),
+        intra_threads=max(0, int(threads or 0)),
+    )
+
+
+def ct2_translate_rows(translator, tokenizer, rows, target_prefix_ids=None, max_batch_tokens=4096, beam_size=1, limits=None):
+    """
+    Translate model-ready source ids (special tokens included, e.g. PretokenizedSource.row_ids).
+    target_prefix_ids: per-row decoder prompt ids (target lang token) or None.
+    limits: DecodeLimits (per-row length cap and loop guard, as in the torch path).
+    CT2 sorts and packs rows into token-budget batches itself. Returns list[str] per row.
+    """
+    if not rows:
+        return []
+
+    limits = limits or DecodeLimits()
+    row_max = limits.row_limits([len(r) for r in rows])
+
+    source = [tokenizer.convert_ids_to_tokens(list(r)) for r in rows]
+    prefixes = None
+    if target_prefix_ids is not None:
+        prefixes = [tokenizer.convert_ids_to_tokens(list(p)) for p in target_prefix_ids]
+
+    kwargs = {}
+    if int(beam_size) <= 1:
+        # greedy: each row stops at its own limit or as soon as it ends in a loop
+        generated = [[] for _ in rows]
+
+        def _step(res):
+            ids = generated[res.batch_id]
+            ids.append(res.token_id)
+            if len(ids) >= row_max[res.batch_id]:
+                return True
+            return limits.loop_ngram > 0 and len(trim_loop(ids, limits.loop_ngram, limits.loop_repeats)) < len(ids)
+
+        kwargs["callback"] = _step
+
+    results = translator.translate_batch(
+        source,
+        target_prefix=prefixes,
+        max_batch_size=max(1, int(max_batch_tokens)),
+        batch_type="tokens",
+        beam_size=max(1, int(beam_size)),
+        max_decoding_length=max(row_max) + max((len(p) for p in prefixes or []), default=0),
+        **kwargs,
+    )
+
+    special = set(tokenizer.all_special_ids)
+    out = []
+    for k, res in enumerate(results):
+        tokens = res.hypotheses[0]
+        if prefixes is not None:
+            tokens = tokens[len(prefixes[k]) :]
+        # beam search (no callback) runs to the batch-wide limit: cut rows here
+        ids = tokenizer.convert_tokens_to_ids(tokens)[: row_max[k]]
+        while ids and ids[-1] in special:
+            ids.pop()
+        if limits.loop_ngram > 0:
+            ids = trim_loop(ids, limits.loop_ngram, limits.loop_repeats)
+        out.append(tokenizer.decode(ids, skip_special_tokens=True))
+    return out
@@ -0,0 +1,499 @@
+import hashlib
+import logging
+import math
+import queue
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger("yttrans.hf")
+
+
+PRECISION_MODES = ("fp32", "bf16", "int8-dynamic")
+
+
+def normalize_precision(mode):
+    m = (mode or "fp32").strip().lower().replace("_", "-")
+    if m in ("int8", "qint8", "dynamic-int8"):
+        m = "int8-dynamic"
+    if m not in PRECISION_MODES:
+        raise ValueError(f"unknown precision: {mode} (expected {'|'.join(PRECISION_MODES)})")
+    return m
+
+
+BACKENDS = ("torch", "onnx", "ct2")
+
+
+def normalize_backend(backend, supported=BACKENDS):
+    b = (backend or "torch").strip().lower()
+    if b in ("ort", "onnxruntime"):
+        b = "onnx"
+    if b in ("ctranslate2",):
+        b = "ct2"
+    if b not in supported:
+        raise ValueError(f"unsupported backend: {backend} (expected {'|'.join(supported)})")
+    return b
+
+
+def apply_precision(model, mode, device="cpu"):
+    """
+    Load-time precision for a seq2seq model (after .to(device) and .eval()):
+      fp32         - as loaded
+      bf16         - weights cast to bfloat16 (half the memory, bf16 matmuls)
+      int8-dynamic - torch dynamic quantization of nn.Linear (int8 weights, CPU only)
+    Returns (model, active_mode). int8-dynamic on a non-CPU device falls back to fp32.
+    """
+    import torch
+
+    mode = normalize_precision(mode)
+    if mode == "bf16":
+        model = model.to(torch.bfloat16)
+    elif mode == "int8-dynamic":
+        if not str(device or "cpu").lower().startswith("cpu"):
+            log.warning("int8-dynamic is CPU only (device=%s); using fp32", device)
+            return model, "fp32"
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, mode
+
+
+def generate_mixed_targets(model, inputs, row_bos_ids, **gen_kwargs):
+    """
+    One generate call for rows with different target langs.
+    Each row starts decoding from [decoder_start_token_id, its lang token], instead of
+    a scalar forced_bos_token_id for the whole batch.
+
+    row_bos_ids: list of lang token ids, one per input row.
+    """
+    import torch
+
+    start_id = model.config.decoder_start_token_id
+    input_ids = inputs["input_ids"]
+    decoder_input_ids = torch.tensor(
+        [[start_id, int(bos)] for bos in row_bos_ids],
+        dtype=input_ids.dtype,
+        device=input_ids.device,
+    )
+    with torch.no_grad():
+        return model.generate(
+            **inputs,
+            decoder_input_ids=decoder_input_ids,
+            forced_bos_token_id=None,
+            **gen_kwargs,
+        )
+
+
+def generate_multi_target(model, inputs, forced_bos_ids, decode_ctx=None, **gen_kwargs):
+    """
+    Encode-once / decode-many for HF seq2seq models.
+    The encoder runs once over the batch; each target decodes from the same encoder states.
+
+    inputs: tokenizer output (input_ids, attention_mask) already on the model device
+    forced_bos_ids: dict key -> forced_bos_token_id (key is usually the target lang)
+    decode_ctx: optional callable key -> context manager entered around each target's decode
+    gen_kwargs: stateful stopping criteria (DecodeLimits) are rebuilt for each target's generate()
+    Returns dict key -> generated ids (same key order).
+    Models that are not torch modules (onnxruntime backend) run one generate per target.
+    """
+    import contextlib
+
+    import torch
+    from transformers.modeling_outputs import BaseModelOutput
+
+    decode_ctx = decode_ctx or (lambda _key: contextlib.nullcontext())
+
+    attention_mask = inputs.get("attention_mask")
+    out = {}
+    if not isinstance(model, torch.nn.Module):
+        for key, bos_id in forced_bos_ids.items():
+            with decode_ctx(key):
+                out[key] = model.generate(**inputs, forced_bos_token_id=bos_id, **_fresh_gen_kwargs(gen_kwargs))
+        return out
+    with torch.no_grad():
+        enc = model.get_encoder()(
+            input_ids=inputs["input_ids"],
+            attention_mask=attention_mask,
+            return_dict=True,
+        )
+        hidden = enc.last_hidden_state
+        for key, bos_id in forced_bos_ids.items():
+            # generate() expands encoder_outputs in place for beams: hand it a fresh wrapper each time
+            with decode_ctx(key):
+                out[key] = model.generate(
+                    encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+                    attention_mask=attention_mask,
+                    forced_bos_token_id=bos_id,
+                    **_fresh_gen_kwargs(gen_kwargs),
+                )
+    return out
+
+
+def _fresh_gen_kwargs(gen_kwargs):
+    """
+    gen_kwargs for one more generate() call: stopping criteria that keep per-call state
+    (fresh() method, see DecodeLimits.gen_kwargs) are replaced with new instances.
+    """
+    criteria = gen_kwargs.get("stopping_criteria")
+    if not criteria or not any(hasattr(c, "fresh") for c in criteria):
+        return gen_kwargs
+    from transformers import StoppingCriteriaList
+
+    fresh = [c.fresh() if hasattr(c, "fresh") else c for c in criteria]
+    return dict(gen_kwargs, stopping_criteria=StoppingCriteriaList(fresh))
+
+
+# loops shorter than this many tokens are left alone ("no, no, no" is a valid caption)
+_LOOP_MIN_SPAN = 8
+
+
+def _loop_repeats(n, repeats):
+    return max(int(repeats), math.ceil(_LOOP_MIN_SPAN / n))
+
+
+def ngram_loop_rows(ids, max_ngram=4, repeats=4):
+    """
+    Bool tensor per row: generated ids end with some n-gram (n <= max_ngram) repeated
+    back to back (at least `repeats` times and _LOOP_MIN_SPAN tokens).
+    """
+    import torch
+
+    rows, length = ids.shape
+    done = torch.zeros(rows, dtype=torch.bool, device=ids.device)
+    for n in range(1, max_ngram + 1):
+        span = n * _loop_repeats(n, repeats)
+        if length < span:
+            break
+        tail = ids[:, -span:].reshape(rows, -1, n)
+        done |= (tail == tail[:, -1:, :]).all(dim=2).all(dim=1)
+    return done
+
+
+def trim_loop(seq, max_ngram=4, repeats=4):
+    """
+    Drops a repetition loop at the end of a token list, keeping one copy of the n-gram.
+    """
+    for n in range(1, max_ngram + 1):
+        need = _loop_repeats(n, repeats)
+        if len(seq) < n * need:
+            break
+        gram = seq[-n:]
+        count = 1
+        while len(seq) >= n * (count + 1) and seq[-n * (count + 1) : -n * count] == gram:
+            count += 1
+        if count >= need:
+            return seq[: len(seq) - n * (count - 1)]
+    return seq
+
+
+# cfg suffixes (<engine>_<name>) that change what an HF provider outputs
+_DECODE_CFG_KEYS = (
+    "num_beams",
+    "max_input_tokens",
+    "max_new_tokens",
+    "max_new_tokens_ratio",
+    "max_new_tokens_slack",
+    "loop_ngram",
+    "loop_repeats",
+)
+
+
+def decode_meta(cfg, engine, shortlist=False):
+    """
+    Output-affecting decode settings for get_meta() (folded into cache keys by provider_model_tag).
+    shortlist: a vocabulary shortlist is in use, so its size matters too.
+    """
+    out = {k: cfg.get(f"{engine}_{k}") for k in _DECODE_CFG_KEYS if cfg.get(f"{engine}_{k}") is not None}
+    if shortlist:
+        out["shortlist_size"] = cfg.get(f"{engine}_shortlist_size")
+    return out
+
+
+class DecodeLimits:
+    """
+    Per-row generation length and loop guard for HF providers.
+
+    Each row may generate up to min(max_new_tokens, ceil(src_tokens * ratio) + slack) tokens
+    (ratio <= 0 keeps the fixed max_new_tokens). A row whose output ends in an n-gram loop
+    (loop_ngram > 0) stops early and the loop is cut from its text.
+    """
+
+    def __init__(self, max_new_tokens=256, ratio=0.0, slack=16, loop_ngram=0, loop_repeats=4):
+        self.max_new_tokens = max(1, int(max_new_tokens or 1))
+        self.ratio = float(ratio or 0.0)
+        self.slack = max(0, int(slack or 0))
+        self.loop_ngram = max(0, int(loop_ngram or 0))
+        self.loop_repeats = max(2, int(loop_repeats or 2))
+
+    @classmethod
+    def from_cfg(cls, cfg, engine):
+        return cls(
+            max_new_tokens=int(cfg.get(f"{engine}_max_new_tokens") or 256),
+            ratio=float(cfg.get(f"{engine}_max_new_tokens_ratio") or 0.0),
+            slack=int(cfg.get(f"{engine}_max_new_tokens_slack") or 0),
+            loop_ngram=int(cfg.get(f"{engine}_loop_ngram") or 0),
+            loop_repeats=int(cfg.get(f"{engine}_loop_repeats") or 4),
+        )
+
+    def row_limits(self, src_lengths):
+        if self.ratio <= 0:
+            return [self.max_new_tokens] * len(src_lengths)
+        return [min(self.max_new_tokens, math.ceil(n * self.ratio) + self.slack) for n in src_lengths]
+
+    def gen_kwargs(self, src_lengths, num_beams=1):
+        """
+        max_new_tokens + stopping_criteria for one generate() call over rows with src_lengths.
+        The criterion measures from the decoder prompt length seen on its first call, so it
+        serves one generate() only; fresh() gives a new one (generate_multi_target does that).
+        """
+        limits = self.row_limits(src_lengths)
+        kwargs = {"max_new_tokens": max(limits) if limits else self.max_new_tokens}
+        if self.ratio <= 0 and self.loop_ngram <= 0:
+            return kwargs
+
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        loop_ngram = self.loop_ngram
+        loop_repeats = self.loop_repeats
+
+        class _RowStop(StoppingCriteria):
+            def __init__(self):
+                # generate() expands rows to rows * num_beams with repeat_interleave
+                self.limits = torch.tensor(limits, dtype=torch.long).repeat_interleave(max(1, int(num_beams)))
+                self.start = None
+
+            def __call__(self, input_ids, scores, **kw):
+                if self.start is None:
+                    # first call comes after the first new token
+                    self.start = input_ids.shape[1] - 1
+                    self.limits = self.limits.to(input_ids.device)
+                done = (input_ids.shape[1] - self.start) >= self.limits
+                if loop_ngram:
+                    done |= ngram_loop_rows(input_ids[:, self.start :], loop_ngram, loop_repeats)
+                return done
+
+            def fresh(self):
+                return _RowStop()
+
+        kwargs["stopping_criteria"] = StoppingCriteriaList([_RowStop()])
+        return kwargs
+
+    def decode(self, tokenizer, out):
+        """
+        batch_decode with repetition loops cut (when loop_ngram > 0).
+        """
+        if self.loop_ngram <= 0:
+            return tokenizer.batch_decode(out, skip_special_tokens=True)
+        special = set(tokenizer.all_special_ids)
+        texts = []
+        for seq in out.tolist():
+            while seq and seq[-1] in special:
+                seq.pop()
+            texts.append(tokenizer.decode(trim_loop(seq, self.loop_ngram, self.loop_repeats), skip_special_tokens=True))
+        return texts
+
+
+def plan_length_batches(lengths, batch_size=8, max_tokens=0):
+    """
+    Length bucketing: row indices sorted by token length, then grouped so that a batch's
+    padded size (rows * longest row) stays within max_tokens. With max_tokens <= 0 batches
+    are batch_size rows of similar length. A row over budget gets a batch of its own.
+
+    Returns list of index lists; callers put outputs back by index (original order).
+    """
+    batch_size = max(1, int(batch_size or 1))
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+    batches = []
+    cur = []
+    cur_max = 0
+    for i in order:
+        n = max(1, int(lengths[i]))
+        if cur:
+            if max_tokens and max_tokens > 0:
+                full = max(cur_max, n) * (len(cur) + 1) > max_tokens
+            else:
+                full = len(cur) >= batch_size
+            if full:
+                batches.append(cur)
+                cur = []
+                cur_max = 0
+        cur.append(i)
+        cur_max = max(cur_max, n)
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+class PretokenizedSource:
+    """
+    Source texts tokenized once: model-ready ids per row (special tokens included),
+    where a text longer than max_input_tokens is split into several rows on token
+    boundaries (no decode/re-encode round trip).
+
+      row_ids[k]  - ids of row k
+      lengths[k]  - len(row_ids[k]), for length bucketing
+      mapping[i]  - (start, end) rows of text i; translations are joined back with ""
+    """
+
+    __slots__ = ("row_ids", "lengths", "mapping")
+
+    def __init__(self, row_ids, mapping):
+        self.row_ids = row_ids
+        self.lengths = [len(x) for x in row_ids]
+        self.mapping = mapping
+
+
+def pretokenize(tokenizer, texts, max_input_tokens):
+    """
+    tokenizer must already be set up for the source lang (src_lang prefix tokens).
+    """
+    n_special = len(tokenizer.build_inputs_with_special_tokens([]))
+    budget = max(1, int(max_input_tokens) - n_special)
+
+    encoded = tokenizer(list(texts), add_special_tokens=False)["input_ids"] if texts else []
+    row_ids = []
+    mapping = []
+    for ids in encoded:
+        start = len(row_ids)
+        if not ids:
+            row_ids.append(tokenizer.build_inputs_with_special_tokens([]))
+        for pos in range(0, len(ids), budget):
+            row_ids.append(tokenizer.build_inputs_with_special_tokens(list(ids[pos : pos + budget])))
+        mapping.append((start, len(row_ids)))
+    return PretokenizedSource(row_ids, mapping)
+
+
+class PretokenCache:
+    """
+    Small LRU of PretokenizedSource keyed by (src lang, max_input_tokens, texts).
+    All target langs of a job send the same texts, so the source is tokenized once per job.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max(1, int(max_entries or 1))
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tokenizer, texts, src_key, max_input_tokens):
+        h = hashlib.sha1("\x1f".join(texts).encode("utf-8")).hexdigest()
+        key = (src_key, int(max_input_tokens), len(texts), h)
+        with self._lock:
+            pre = self._items.get(key)
+            if pre is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return pre
+            self.misses += 1
+
+        pre = pretokenize(tokenizer, texts, max_input_tokens)
+        with self._lock:
+            self._items[key] = pre
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return pre
+
+
+def batch_tensors(rows, pad_token_id, device="cpu"):
+    """
+    Right-padded input_ids/attention_mask tensors from lists of ids.
+    """
+    import torch
+
+    width = max(len(r) for r in rows)
+    input_ids = torch.full((len(rows), width), int(pad_token_id), dtype=torch.long)
+    attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+    for i, r in enumerate(rows):
+        input_ids[i, : len(r)] = torch.tensor(r, dtype=torch.long)
+        attention_mask[i, : len(r)] = 1
+    return {"input_ids": input_ids.to(device), "attention_mask": attention_mask.to(device)}
+
+
+# ---- tokenize / generate / decode pipeline ----
+
+_PIPE_END = object()
+
+
+def run_pipelined(batches, prepare, generate, finish, depth=2):
+    """
+    Runs prepare(batch) -> generate(batch, inputs) -> finish(batch, out) over batches as a
+    3-stage pipeline: input tensors for the next batches are built in one thread and outputs
+    of the previous ones are decoded in another while the current batch generates (torch
+    releases the GIL in native ops). generate runs in the calling thread, so thread-local
+    state (no_grad, vocabulary shortlist) applies as usual. Queues hold at most `depth`
+    batches per stage; depth <= 0 or a single batch runs the stages in order.
+    The first stage error is raised in the caller after all stages stop.
+    """
+    batches = list(batches)
+    if int(depth or 0) <= 0 or len(batches) <= 1:
+        for b in batches:
+            finish(b, generate(b, prepare(b)))
+        return
+
+    stop = threading.Event()
+    errors = []
+    prepared = queue.Queue(maxsize=int(depth))
+    generated = queue.Queue(maxsize=int(depth))
+
+    def _put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _PIPE_END
+
+    def _fail(e):
+        errors.append(e)
+        stop.set()
+
+    def _prepare_stage():
+        try:
+            for b in batches:
+                if not _put(prepared, (b, prepare(b))):
+                    return
+            _put(prepared, _PIPE_END)
+        except BaseException as e:
+            _fail(e)
+
+    def _finish_stage():
+        try:
+            while True:
+                item = _get(generated)
+                if item is _PIPE_END:
+                    return
+                finish(*item)
+        except BaseException as e:
+            _fail(e)
+
+    stages = [
+        threading.Thread(target=_prepare_stage, name="yttrans-pipe-prepare", daemon=True),
+        threading.Thread(target=_finish_stage, name="yttrans-pipe-finish", daemon=True),
+    ]
+    for t in stages:
+        t.start()
+    try:
+        while True:
+            item = _get(prepared)
+            if item is _PIPE_END:
+                break
+            b, inputs = item
+            if not _put(generated, (b, generate(b, inputs))):
+                break
+        _put(generated, _PIPE_END)
+    except BaseException as e:
+        _fail(e)
+    finally:
+        for t in stages:
+            t.join()
+    if errors:
+        raise errors[0]
@@ -1,4 +1,6 @@
+import base64
 import json
+import zlib
 
 
 def dumps(obj):
@@ -6,4 +8,17 @@ def dumps(obj):
 
 
 def loads(s):
-    return json.loads(s)
\ No newline at end of file
+    return json.loads(s)
+
+
+def dumps_packed(obj, level=6):
+    """
+    JSON -> zlib -> base64 ascii (safe for decode_responses=True redis clients).
+    """
+    raw = dumps(obj).encode("utf-8")
+    return base64.b64encode(zlib.compress(raw, level)).decode("ascii")
+
+
+def loads_packed(s):
+    raw = zlib.decompress(base64.b64decode(s))
+    return loads(raw.decode("utf-8"))
@@ -0,0 +1,39 @@
+import os
+import resource
+
+
+def process_rss_bytes():
+    """
+    Current resident set size of this process (Linux /proc), falls back to peak RSS.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            parts = f.read().split()
+        return int(parts[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return process_peak_rss_bytes()
+
+
+def process_peak_rss_bytes():
+    try:
+        # ru_maxrss is in KiB on Linux
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    except Exception:
+        return 0
+
+
+def model_param_bytes(model):
+    """
+    Bytes held by torch module parameters + buffers (0 if model is None).
+    """
+    if model is None:
+        return 0
+    total = 0
+    try:
+        for p in model.parameters():
+            total += p.numel() * p.element_size()
+        for b in model.buffers():
+            total += b.numel() * b.element_size()
+    except Exception:
+        return 0
+    return int(total)
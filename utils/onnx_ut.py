@@ -0,0 +1,62 @@
+import logging
+import os
+import shutil
+import tempfile
+
+log = logging.getLogger("yttrans.onnx")
+
+
+def onnx_cache_dir(model_id, root=""):
+    """
+    Exported graphs live next to the HF hub cache: <HF_HOME>/yttrans-onnx/<org>--<name>.
+    """
+    if not root:
+        try:
+            from huggingface_hub.constants import HF_HOME
+
+            root = os.path.join(HF_HOME, "yttrans-onnx")
+        except Exception:
+            root = os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "yttrans-onnx")
+    return os.path.join(root, model_id.strip().replace("/", "--"))
+
+
+def _is_exported(path):
+    return os.path.isfile(os.path.join(path, "config.json")) and os.path.isfile(os.path.join(path, "encoder_model.onnx"))
+
+
+def load_ort_seq2seq(model_id, cache_root="", threads=0):
+    """
+    ORTModelForSeq2SeqLM (encoder + decoder with past) on onnxruntime's CPU provider.
+    First call exports the HF checkpoint and saves the graphs; later calls load them from disk.
+    The result has the usual generate() (forced_bos_token_id, decoder_input_ids, beams).
+    """
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads and int(threads) > 0:
+        so.intra_op_num_threads = int(threads)
+
+    path = onnx_cache_dir(model_id, cache_root)
+    if not _is_exported(path):
+        log.info("exporting %s to onnx: %s", model_id, path)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        # export into a temp dir and rename, so a concurrent loader never sees half a model
+        tmp = tempfile.mkdtemp(prefix=".export-", dir=parent)
+        try:
+            exported = ORTModelForSeq2SeqLM.from_pretrained(model_id, export=True, use_cache=True)
+            exported.save_pretrained(tmp)
+            del exported
+            if not _is_exported(path):
+                os.replace(tmp, path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        path,
+        use_cache=True,
+        provider="CPUExecutionProvider",
+        session_options=so,
+    )
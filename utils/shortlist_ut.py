@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+log = logging.getLogger("yttrans.shortlist")
+
+
+# ---- on-disk store ----
+
+
+def shortlist_dir(model_id, root=""):
+    """
+    Shortlists live next to the HF hub cache: <HF_HOME>/yttrans-shortlist/<org>--<name>/<lang key>.json.
+    """
+    if not root:
+        try:
+            from huggingface_hub.constants import HF_HOME
+
+            root = os.path.join(HF_HOME, "yttrans-shortlist")
+        except Exception:
+            root = os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "yttrans-shortlist")
+    return os.path.join(root, model_id.strip().replace("/", "--"))
+
+
+class ShortlistStore:
+    """
+    Per-target-lang output vocabulary shortlists (token ids) for one model.
+
+    A shortlist is the `size` most frequent target-side tokens, built either offline from
+    target-language text (build_from_corpus) or lazily from the provider's own outputs
+    (observe) once min_tokens output tokens were seen and the top `size` ids of earlier
+    outputs cover at least min_coverage of the latest coverage_window tokens (output no
+    longer brings new tokens). Lang keys are model lang tokens (rus_Cyrl, <2ru>).
+    always_ids (special and lang tokens) are not counted and are added to every shortlist.
+    Langs without a shortlist decode over the full vocabulary; their file is looked up
+    again after miss_ttl_sec (built offline or by another process meanwhile).
+    """
+
+    def __init__(
+        self,
+        path,
+        size=32000,
+        min_tokens=0,
+        always_ids=(),
+        miss_ttl_sec=60.0,
+        min_coverage=0.995,
+        coverage_window=2000,
+    ):
+        self.path = path
+        self.size = max(1, int(size or 1))
+        self.min_tokens = max(0, int(min_tokens or 0))
+        self.always_ids = set(int(x) for x in always_ids)
+        self.miss_ttl_sec = max(0.0, float(miss_ttl_sec))
+        self.min_coverage = min(1.0, max(0.0, float(min_coverage)))
+        self.coverage_window = max(1, int(coverage_window or 1))
+
+        self._lock = threading.Lock()
+        self._ids = {}  # lang key -> sorted list[int]
+        self._misses = {}  # lang key -> monotonic ts of the last lookup without a file
+        self._counts = {}  # lang key -> Counter (lazy build)
+        self._recent = {}  # lang key -> Counter of the window not yet merged into _counts
+        self._seen = {}  # lang key -> tokens observed
+
+    def _file(self, key):
+        safe = "".join(c if c.isalnum() or c in "_-" else "_" for c in key)
+        return os.path.join(self.path, f"{safe}.json")
+
+    def get(self, key):
+        """
+        Sorted token ids for lang key or None (no shortlist: use the full vocabulary).
+        """
+        with self._lock:
+            if key in self._ids:
+                return self._ids[key]
+            missed = self._misses.get(key)
+            if missed is not None and time.monotonic() - missed < self.miss_ttl_sec:
+                return None
+        ids = None
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as f:
+                ids = sorted(set(int(x) for x in json.load(f)["ids"]) | self.always_ids)
+        except FileNotFoundError:
+            ids = None
+        except Exception as e:
+            log.warning("shortlist %s unreadable: %s", self._file(key), e)
+            ids = None
+        with self._lock:
+            if ids is None:
+                self._misses[key] = time.monotonic()
+            else:
+                self._ids[key] = ids
+                self._misses.pop(key, None)
+        return ids
+
+    def save(self, key, counts, source):
+        ids = [i for i, _n in counts.most_common(self.size)]
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"lang": key, "source": source, "tokens": sum(counts.values()), "ids": ids}, f)
+        os.replace(tmp, self._file(key))
+        with self._lock:
+            self._ids[key] = sorted(set(ids) | self.always_ids)
+            self._misses.pop(key, None)
+        log.info("shortlist saved lang=%s size=%s source=%s", key, len(ids), source)
+        return ids
+
+    def build_from_corpus(self, tokenizer, key, lines):
+        """
+        Offline build from target-language text (one caption/sentence per line).
+        """
+        counts = Counter()
+        for ids in tokenizer(list(lines), add_special_tokens=False)["input_ids"] if lines else []:
+            counts.update(ids)
+        return self.save(key, counts, source="corpus")
+
+    def observe(self, key, sequences):
+        """
+        Lazy build: count output token ids (special ids skipped) of full-vocabulary decodes
+        for lang key.
+        """
+        if self.min_tokens <= 0:
+            return
+        with self._lock:
+            if self._ids.get(key) is not None:
+                return
+            recent = self._recent.setdefault(key, Counter())
+            for seq in sequences:
+                recent.update(i for i in (int(x) for x in seq) if i not in self.always_ids)
+            n_recent = sum(recent.values())
+            if n_recent < self.coverage_window:
+                return
+            # share of the window a shortlist from the earlier outputs would have covered
+            counts = self._counts.setdefault(key, Counter())
+            top = {i for i, _n in counts.most_common(self.size)}
+            covered = sum(n for i, n in recent.items() if i in top)
+            counts.update(recent)
+            self._recent[key] = Counter()
+            self._seen[key] = self._seen.get(key, 0) + n_recent
+            if self._seen[key] < self.min_tokens or covered < self.min_coverage * n_recent:
+                return
+            counts = self._counts.pop(key)
+            self._recent.pop(key, None)
+            self._seen.pop(key, None)
+        try:
+            self.save(key, counts, source="observed")
+        except Exception as e:
+            log.warning("shortlist save lang=%s failed: %s", key, e)
+
+    def union(self, keys):
+        """
+        Shortlist for a batch with several target langs; None if any of them has none.
+        Returns (cache key, ids) or (None, None).
+        """
+        keys = sorted(set(keys))
+        merged = set()
+        for key in keys:
+            ids = self.get(key)
+            if ids is None:
+                return None, None
+            merged.update(ids)
+        return "+".join(keys), sorted(merged)
+
+
+# ---- restricted LM head ----
+
+_active = threading.local()
+
+
+class use_shortlist:
+    """
+    Context manager: decoding in this thread projects onto ids only (key identifies ids).
+    key=None keeps the full vocabulary.
+    """
+
+    def __init__(self, key, ids):
+        self.key = key
+        self.ids = ids
+
+    def __enter__(self):
+        self._prev = getattr(_active, "value", None)
+        _active.value = (self.key, self.ids) if self.key is not None and self.ids else None
+        return self
+
+    def __exit__(self, *exc):
+        _active.value = self._prev
+        return False
+
+
+def _make_head_class():
+    import torch
+
+    class ShortlistLMHead(torch.nn.Module):
+        """
+        Output projection that, while a shortlist is active in the calling thread,
+        multiplies only the shortlisted rows of the weight and leaves the rest at -inf.
+        """
+
+        def __init__(self, orig, max_cached=16):
+            super().__init__()
+            self.orig = orig
+            self.max_cached = max_cached
+            self._slices = OrderedDict()
+            self._slices_lock = threading.Lock()
+
+        def _weight(self):
+            w = self.orig.weight
+            if callable(w):
+                # dynamically quantized Linear keeps a packed weight
+                w = w().dequantize()
+            b = getattr(self.orig, "bias", None)
+            if callable(b):
+                b = b()
+            return w, b
+
+        def _slice(self, key, ids, dtype, device):
+            with self._slices_lock:
+                hit = self._slices.get(key)
+                if hit is not None:
+                    self._slices.move_to_end(key)
+                    return hit
+            w, b = self._weight()
+            idx = torch.tensor(ids, dtype=torch.long, device=w.device)
+            hit = (
+                idx.to(device),
+                w.index_select(0, idx).to(dtype=dtype, device=device).contiguous(),
+                b.index_select(0, idx).to(dtype=dtype, device=device) if b is not None else None,
+                int(w.shape[0]),
+            )
+            with self._slices_lock:
+                self._slices[key] = hit
+                while len(self._slices) > self.max_cached:
+                    self._slices.popitem(last=False)
+            return hit
+
+        def forward(self, hidden):
+            active = getattr(_active, "value", None)
+            if active is None:
+                return self.orig(hidden)
+            key, ids = active
+            idx, w, b, vocab = self._slice(key, ids, hidden.dtype, hidden.device)
+            small = torch.nn.functional.linear(hidden, w, b)
+            out = hidden.new_full((*hidden.shape[:-1], vocab), float("-inf"))
+            out[..., idx] = small
+            return out
+
+    return ShortlistLMHead
+
+
+def install_shortlist_head(model):
+    """
+    Replaces the model's output projection with a shortlist-aware one (no-op without
+    an active shortlist). Call after precision is applied.
+    """
+    head = model.get_output_embeddings()
+    if head is None or type(head).__name__ == "ShortlistLMHead":
+        return model
+    model.set_output_embeddings(_make_head_class()(head))
+    return model
@@ -1,3 +1,4 @@
+import asyncio
 import re
 import uuid
 
@@ -40,6 +41,142 @@ def inject_translated_lines(lines, idxs, translated_texts):
     return "\n".join(out)
 
 
+# YouTube auto-captions: word timing tags inside cue text, e.g. "hello<00:00:01.234><c> world</c>"
+_INLINE_TS_RE = re.compile(r"<\d{1,2}:\d{2}(?::\d{2})?\.\d{3}>")
+_CUE_TAG_RE = re.compile(r"</?c(?:\.[\w.-]+)?>")
+
+
+def strip_inline_tags(text):
+    return _CUE_TAG_RE.sub("", _INLINE_TS_RE.sub("", text or ""))
+
+
+def _cue_text_blocks(lines):
+    """
+    Returns list of cues as lists of (line_idx, stripped_text) for non-blank text lines.
+    """
+    cues = []
+    cur = None
+    for i, raw in enumerate(lines):
+        s = raw.strip()
+        if is_timestamp_line(s):
+            cur = []
+            cues.append(cur)
+            continue
+        if cur is None or s == "":
+            continue
+        cur.append((i, strip_inline_tags(raw).strip()))
+    return cues
+
+
+def is_rolling_vtt(src_vtt, min_cues=4, min_carry_ratio=0.5):
+    """
+    Detects YouTube rolling layout: inline word timing tags, or the last line of
+    cue N repeated as the first line of cue N+1 for most cues.
+    """
+    if not src_vtt:
+        return False
+    if _INLINE_TS_RE.search(src_vtt) and _CUE_TAG_RE.search(src_vtt):
+        return True
+
+    cues = [c for c in _cue_text_blocks(src_vtt.splitlines()) if c]
+    if len(cues) < min_cues:
+        return False
+    carried = sum(1 for prev, cur in zip(cues, cues[1:]) if cur[0][1] == prev[-1][1])
+    return carried / (len(cues) - 1) >= min_carry_ratio
+
+
+def extract_rolling_lines(src_vtt):
+    """
+    extract_translatable_lines for rolling-caption VTT.
+    Lines before the first cue (WEBVTT, Kind:, Language:) are kept as is, timing tags are
+    stripped from cue text, and carried-over lines come out identical to the line they
+    repeat, so dedupe_texts translates each transcript line once.
+    Returns (lines, idxs, texts) where lines already have tags stripped.
+    """
+    if src_vtt is None:
+        return [], [], []
+
+    lines = src_vtt.splitlines()
+    idxs = []
+    texts = []
+    for cue in _cue_text_blocks(lines):
+        for i, text in cue:
+            if not text or text.isdigit() or text.startswith("NOTE"):
+                continue
+            lines[i] = text
+            idxs.append(i)
+            texts.append(text)
+    return lines, idxs, texts
+
+
+def extract_vtt_lines(src_vtt, rolling="auto"):
+    """
+    rolling: auto|on|off. Returns (lines, idxs, texts, is_rolling).
+    """
+    mode = (rolling or "auto").strip().lower()
+    use_rolling = mode == "on" or (mode == "auto" and is_rolling_vtt(src_vtt))
+    if use_rolling:
+        lines, idxs, texts = extract_rolling_lines(src_vtt)
+    else:
+        lines, idxs, texts = extract_translatable_lines(src_vtt)
+    return lines, idxs, texts, use_rolling
+
+
+def normalize_segment(text):
+    """
+    Collapse inner whitespace, strip ends.
+    Returns (prefix_ws, core, suffix_ws) so the original padding can be restored.
+    """
+    text = text or ""
+    core = text.strip()
+    if not core:
+        return text, "", ""
+    prefix = text[: len(text) - len(text.lstrip())]
+    suffix = text[len(text.rstrip()) :]
+    return prefix, " ".join(core.split()), suffix
+
+
+def dedupe_texts(texts):
+    """
+    Auto-captions repeat lines a lot ("♪", "[Applause]", rolling cues).
+    Returns (unique_texts, plan): each distinct normalized line once, and
+    plan[i] = (unique_idx, prefix_ws, suffix_ws) to fan translations back out.
+    Blank lines keep unique_idx = -1 and are passed through unchanged.
+    """
+    unique_texts = []
+    pos = {}
+    plan = []
+    for t in texts or []:
+        prefix, core, suffix = normalize_segment(t)
+        if not core:
+            plan.append((-1, t, ""))
+            continue
+        j = pos.get(core)
+        if j is None:
+            j = len(unique_texts)
+            pos[core] = j
+            unique_texts.append(core)
+        plan.append((j, prefix, suffix))
+    return unique_texts, plan
+
+
+def expand_deduped(translated_unique, plan):
+    """
+    Inverse of dedupe_texts: one translated line per original line.
+    """
+    n = 1 + max((j for j, _p, _s in plan), default=-1)
+    if len(translated_unique) != n:
+        raise ValueError(f"translated unique lines count mismatch: {len(translated_unique)} != {n}")
+
+    out = []
+    for j, prefix, suffix in plan:
+        if j < 0:
+            out.append(prefix)
+        else:
+            out.append(f"{prefix}{translated_unique[j] or ''}{suffix}")
+    return out
+
+
 # Use rare unicode brackets to make delimiter less likely to be changed by MT models.
 # Marker itself is also structured to avoid underscores/words that can be normalized.
 def _make_delimiter(token: str) -> str:
@@ -191,6 +328,34 @@ def batch_translate_texts(texts, translate_text_fn, max_total_chars=4500):
     return pieces
 
 
+async def batch_translate_texts_async(texts, translate_text_async_fn, max_total_chars=4500):
+    """
+    Async variant of batch_translate_texts: chunks are translated concurrently
+    (translate_text_async_fn is responsible for its own rate limiting).
+    """
+    if not texts:
+        return []
+
+    token = _pick_unique_token(texts)
+    delim = _make_delimiter(token)
+
+    joined = delim.join(texts)
+    chunks = _split_large_text(joined, max_total_chars)
+
+    translated_chunks = await asyncio.gather(*[translate_text_async_fn(ch) for ch in chunks])
+    translated_joined = "".join(translated_chunks)
+
+    pieces = _split_by_delim_token(translated_joined, token)
+    if len(pieces) != len(texts):
+        raise ValueError(
+            "delimiter split mismatch after translation: "
+            f"got {len(pieces)} pieces expected {len(texts)}. "
+            "Likely translator modified delimiter."
+        )
+
+    return pieces
+
+
 def translate_vtt(src_vtt, translate_line_fn):
     if src_vtt is None:
         return ""